@@ -12,6 +12,7 @@ import torch
 import sys
 
 from utils import Args
+from pcse.prefetch import prefetch_grid
 import tyro
 import utils
 import wofost_gym.policies as policies
@@ -38,6 +39,9 @@ def gen_data(env, args, pol):
     longitudes = np.arange(start=args.long_range[0],stop=args.long_range[1]+.5,step=.5)
 
     lat_long = [(i,j) for i in latitudes for j in longitudes]
+
+    # Fetch the weather of all locations up front instead of in the episode loop
+    prefetch_grid(args.lat_range, args.long_range, step=.5)
     
     # Create all the location-year pairs 
     loc_yr = [[loc, yr] for yr in years for loc in lat_long]
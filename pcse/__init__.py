@@ -47,7 +47,8 @@ from .utils import exceptions, decorators, traitlets, signals
 
 import logging.config
 from .base import ParameterProvider
-from .nasapower import NASAPowerWeatherDataProvider
+from .nasapower import NASAPowerWeatherDataProvider, get_weather_data_provider, weather_registry
+from .weathergenerator import EnsembleWeatherDataProvider
 from . import fileinput
 from . import agromanager
 from . import soil
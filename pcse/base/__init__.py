@@ -6,10 +6,13 @@ when creating PCSE simulation units.
 Written by: Allard de Wit (allard.dewit@wur.nl), April 2014
 Modified by Will Solow, 2024
 """
-from .variablekiosk import VariableKiosk
+from .variablekiosk import VariableKiosk, IndexedVariableKiosk, create_kiosk
 from .engine import BaseEngine
 from .parameter_providers import ParameterProvider, MultiCropDataProvider, MultiSiteDataProvider
 from .simulationobject import SimulationObject, AncillaryObject
 from .states_rates import StatesTemplate, RatesTemplate, StatesWithImplicitRatesTemplate, ParamTemplate
-from .dispatcher import DispatcherObject
-from .timer import Timer
\ No newline at end of file
+from .states_rates import set_states_rates_backend, get_states_rates_backend
+from .dispatcher import DispatcherObject, SignalBus
+from .timer import Timer
+from .recorder import OutputRecorder
+from .batch import BatchParameters, BatchVariables
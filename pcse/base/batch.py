@@ -0,0 +1,101 @@
+"""Containers for simulating a batch of fields with NumPy arrays
+
+The batched models keep the parameters, states and rates of N fields in
+arrays of shape (N,) instead of one SimulationObject per field. A
+`BatchParameters` object holds the parameter values of a batch, taken from
+the ParamTemplates of the scalar models so that parameters are checked and
+shared in the same way. `BatchVariables` holds the state or rate variables
+of a batch, one float array per variable.
+
+Written by: Will Solow, 2024
+"""
+import numbers
+
+import numpy as np
+
+from ..util import Afgen, BatchAfgen
+
+
+def values_changed(values, before):
+    """Returns a boolean array that is True where values differs from before.
+    NaN values are taken as equal.
+    """
+    if values.dtype == object:
+        return np.array([v != b for v, b in zip(values, before)], dtype=bool)
+    changed = values != before
+    if np.issubdtype(values.dtype, np.floating):
+        changed &= ~(np.isnan(values) & np.isnan(before))
+    return changed
+
+
+class BatchParameters(object):
+    """Parameter values of a batch of fields.
+
+    :param n: number of fields
+
+    The values of the parameters of a ParamTemplate are set for a subset of
+    the fields with `set()`. Each parameter becomes an attribute holding the
+    values of all fields: a BatchAfgen for AFGEN tables, a float array for
+    numbers and booleans and an object array for other values, e.g. the crop
+    start type. Fields for which a parameter was not set are NaN or None.
+    """
+
+    def __init__(self, n:int):
+        self.n = n
+
+    def set(self, template, idx, parvalues:list):
+        """Set the parameters of template for the fields idx.
+
+        :param template: a ParamTemplate class
+        :param idx: array with the indices of the fields
+        :param parvalues: list with the parameter values of each field, e.g.
+            a ParameterProvider
+        """
+        params = [template(pv) for pv in parvalues]
+        for name in template._parameter_names():
+            values = [getattr(p, name) for p in params]
+            current = self.__dict__.get(name)
+            if isinstance(values[0], Afgen):
+                if current is None:
+                    current = BatchAfgen(self.n)
+                current.set(idx, values)
+            elif all(isinstance(v, numbers.Number) for v in values):
+                if current is None:
+                    current = np.full(self.n, np.nan)
+                current[idx] = values
+            else:
+                if current is None:
+                    current = np.full(self.n, None, dtype=object)
+                current[idx] = values
+            setattr(self, name, current)
+
+    def __contains__(self, name:str):
+        return name in self.__dict__ and name != "n"
+
+
+class BatchVariables(object):
+    """State or rate variables of a batch of fields.
+
+    :param n: number of fields
+    :param names: names of the variables
+
+    Every variable is an attribute holding a float array of shape (n,)
+    initialized to zero. Booleans are stored as 0. and 1.
+    """
+
+    def __init__(self, n:int, names:list):
+        self.n = n
+        self.names = tuple(names)
+        for name in self.names:
+            setattr(self, name, np.zeros(n))
+
+    def zerofy(self, idx=None):
+        """Set all variables to zero for the fields idx, or all fields.
+        """
+        if idx is None:
+            idx = slice(None)
+        for name in self.names:
+            getattr(self, name)[idx] = 0.
+
+    def __contains__(self, name:str):
+        return name in self.names
@@ -3,7 +3,139 @@
 Written by: Allard de Wit (allard.dewit@wur.nl), April 2014
 Modified by Will Solow, 2024
 """
-from ..pydispatch import dispatcher
+import types
+import weakref
+
+from ..pydispatch import robustapply, errors
+
+
+class _Receiver(object):
+    """Weak reference to a signal handler together with the names of the
+    keyword arguments it accepts, resolved once at connect time.
+    """
+    __slots__ = ("key", "_ref", "_func", "accepts_all", "names")
+
+    def __init__(self, handler):
+        receiver, code, bound = robustapply.function(handler)
+        if isinstance(receiver, types.MethodType):
+            self._ref = weakref.ref(receiver.__self__)
+            self._func = receiver.__func__
+            self.key = (id(receiver.__self__), receiver.__func__)
+        else:
+            self._ref = weakref.ref(receiver)
+            self._func = None
+            self.key = id(receiver)
+        self.accepts_all = bool(code.co_flags & 8)
+        self.names = frozenset(code.co_varnames[bound:code.co_argcount])
+
+    def __call__(self):
+        """Returns the handler or None if it no longer exists.
+        """
+        obj = self._ref()
+        if obj is None or self._func is None:
+            return obj
+        return types.MethodType(self._func, obj)
+
+
+class SignalBus(object):
+    """Connects signal handlers to the signals sent by the components of a
+    single engine.
+
+    Every VariableKiosk owns a SignalBus, so the signals of different engines
+    in the same process are kept apart without a global registry. Handlers are
+    weakly referenced, as with the PyDispatcher package, and are called in the
+    order in which they were connected with the keyword arguments they accept.
+    The arguments a handler accepts are determined once when it is connected.
+    """
+
+    def __init__(self):
+        self._receivers = {}
+
+    def connect(self, handler, signal):
+        """Connect handler to signal. A handler that is already connected to
+        signal is moved to the end of the list of handlers.
+        """
+        if signal is None:
+            msg = "Signal cannot be None (receiver=%r)" % (handler,)
+            raise errors.DispatcherTypeError(msg)
+        receiver = _Receiver(handler)
+        receivers = self._receivers.setdefault(signal, [])
+        # Lists are changed in place, handlers connected while the signal is
+        # being sent are called as well.
+        receivers[:] = [r for r in receivers if r.key != receiver.key]
+        receivers.append(receiver)
+
+    def disconnect(self, handler, signal):
+        """Disconnect handler from signal.
+        """
+        key = _Receiver(handler).key
+        receivers = self._receivers.get(signal, [])
+        remaining = [r for r in receivers if r.key != key]
+        if len(remaining) == len(receivers):
+            msg = "No receiver %r for signal %r" % (handler, signal)
+            raise errors.DispatcherKeyError(msg)
+        receivers[:] = remaining
+
+    def receivers(self, signal):
+        """Returns the live handlers connected to signal, in order.
+        """
+        handlers = []
+        for receiver in self._receivers.get(signal, ()):
+            handler = receiver()
+            if handler is not None:
+                handlers.append(handler)
+        return handlers
+
+    def signals(self):
+        """Returns the signals that have handlers connected.
+        """
+        return list(self._receivers)
+
+    def send(self, signal, sender, *arguments, **named):
+        """Send signal from sender to all connected handlers.
+
+        Returns a list of (handler, response) pairs. Handlers of objects that
+        no longer exist are removed.
+        """
+        named["signal"] = signal
+        named["sender"] = sender
+        responses = []
+        receivers = self._receivers.get(signal)
+        if not receivers:
+            return responses
+        dead = False
+        for receiver in receivers:
+            handler = receiver()
+            if handler is None:
+                dead = True
+                continue
+            if arguments:
+                response = robustapply.robustApply(handler, *arguments, **named)
+            elif receiver.accepts_all:
+                response = handler(**named)
+            else:
+                names = receiver.names
+                response = handler(**{k: v for k, v in named.items() if k in names})
+            responses.append((handler, response))
+        if dead:
+            receivers[:] = [r for r in receivers if r() is not None]
+        return responses
+
+    def clear(self):
+        """Disconnect all handlers.
+        """
+        self._receivers.clear()
+
+    def _get_state(self):
+        """Returns a copy of the connections, used for engine snapshots.
+        """
+        return {signal: list(receivers) for signal, receivers in self._receivers.items()}
+
+    def _set_state(self, state):
+        """Restores the connections from a state returned by `_get_state()`.
+        """
+        self._receivers = {signal: list(receivers) for signal, receivers in state.items()}
+
 
 class DispatcherObject(object):
     """Class only defines the _send_signal() and _connect_signal() methods.
@@ -12,23 +144,24 @@ class DispatcherObject(object):
     """
 
     def _send_signal(self, signal, *args, **kwargs):
-        """Send <signal> using the dispatcher module.
+        """Send <signal> using the SignalBus of the VariableKiosk.
 
         The VariableKiosk of this SimulationObject is used as the sender of
         the signal. Additional arguments to the _send_signal() method are
-        passed to dispatcher.send()
+        passed to SignalBus.send()
         """
 
         self.logger.debug("Sent signal: %s" % signal)
-        dispatcher.send(signal=signal, sender=self.kiosk, *args, **kwargs)
+        self.kiosk.signal_bus.send(signal, self.kiosk, *args, **kwargs)
 
     def _connect_signal(self, handler, signal):
-        """Connect the handler to the signal using the dispatcher module.
+        """Connect the handler to the signal using the SignalBus of the
+        VariableKiosk.
 
         The handler will only react on signals that have the SimulationObjects
         VariableKiosk as sender. This ensure that different PCSE model instances
         in the same runtime environment will not react to each others signals.
         """
 
-        dispatcher.connect(handler, signal, sender=self.kiosk)
+        self.kiosk.signal_bus.connect(handler, signal)
         self.logger.debug("Connected handler '%s' to signal '%s'." % (handler, signal))
@@ -11,12 +11,18 @@ import logging
 
 from ..utils.traitlets import HasTraits
 from .dispatcher import DispatcherObject
-from .simulationobject import SimulationObject
+from .simulationobject import (SimulationObject, _changes_structure, _structure_changed,
+                               get_structure_version)
 
 
 class BaseEngine(HasTraits, DispatcherObject):
     """Base Class for Engine to inherit from
     """
+    # Execution plan, see _get_plan()
+    _plan_version = -1
+    _sub_sim_objects = None
+    _rates_plan = None
+
     def __init__(self):
         """Initialize class `BaseEngine`
         """
@@ -50,22 +56,34 @@ class BaseEngine(HasTraits, DispatcherObject):
         if attr.startswith("_") or type(value) is types.FunctionType:
             HasTraits.__setattr__(self, attr, value)
         elif hasattr(self, attr):
+            if _changes_structure(self, attr, value):
+                _structure_changed(getattr(self, "kiosk", None))
             HasTraits.__setattr__(self, attr, value)
         else:
             msg = "Assignment to non-existing attribute '%s' prevented." % attr
             raise AttributeError(msg)
 
+    def _get_plan(self):
+        """Returns the list of SimulationObjects embedded within self and the
+        flat list of all their rates objects, see `SimulationObject._get_plan()`.
+        """
+        version = get_structure_version(getattr(self, "kiosk", None))
+        if version is None or self._plan_version != version:
+            sub_sim_objects = [attr for attr in self.__dict__["_trait_values"].values()
+                               if isinstance(attr, SimulationObject)]
+            rates_plan = []
+            for simobj in sub_sim_objects:
+                rates_plan.extend(simobj._get_plan()[1])
+            self._sub_sim_objects = sub_sim_objects
+            self._rates_plan = rates_plan
+            self._plan_version = version
+        return self._sub_sim_objects, self._rates_plan
+
     @property
     def subSimObjects(self):
         """ Find SimulationObjects embedded within self.
         """
-
-        subSimObjects = []
-        defined_traits = self.__dict__["_trait_values"]
-        for attr in defined_traits.values():
-            if isinstance(attr, SimulationObject):
-                subSimObjects.append(attr)
-        return subSimObjects
+        return self._get_plan()[0]
 
     def get_variable(self, varname):
         """ Return the value of the specified state or rate variable.
@@ -100,7 +118,5 @@ class BaseEngine(HasTraits, DispatcherObject):
     def zerofy(self):
         """Zerofy the value of all rate variables of any sub-SimulationObjects.
         """
-        # Walk over possible sub-simulation objects.
-        if self.subSimObjects is not None:
-            for simobj in self.subSimObjects:
-                simobj.zerofy()
+        for rates in self._get_plan()[1]:
+            rates.zerofy()
@@ -4,6 +4,7 @@ and soil modules
 Written by: Allard de Wit (allard.dewit@wur.nl), April 2014
 Modified by Will Solow, 2024
 """
+import hashlib
 import logging
 from collections import Counter
 from collections.abc import MutableMapping
@@ -56,6 +57,12 @@ class ParameterProvider(MutableMapping):
     CROP_START signal. Finally, specific parameter values can be easily changed
     by setting an `override` on that parameter.
 
+    Lookups are done on a flat dictionary resolved from all parameter sets,
+    which is rebuilt after the active crop or site or the overridden
+    parameters change. Every change increments `version`, which can be used
+    by caches that depend on the parameter values. The parameter sets should
+    therefore only be changed through the methods of the ParameterProvider.
+
     See also the `MultiCropDataProvider` and the `MultieSiteDataProvider`
     """
     _maps = list()
@@ -67,6 +74,9 @@ class ParameterProvider(MutableMapping):
     _iter = 0  # Counter for iterator
     _ncrops_activated = 0  # Counts the number of times `set_crop_type()` has been called.
     _nsites_activated = 0  # Counts the number of times `set_site_type()` has been called.
+    _version = 0  # Incremented on every change of the parameter values
+    _resolved = None  # Flat dictionary of all parameters, see _get_resolved()
+    _parameter_key = None  # (version, key) returned by get_parameter_key()
 
     def __init__(self, sitedata: MultiSiteDataProvider=None, timerdata: dict=None,\
                  soildata: dict=None, cropdata: MultiCropDataProvider=None, override: dict=None):
@@ -128,6 +138,7 @@ class ParameterProvider(MutableMapping):
 
         self._ncrops_activated += 1
         self._test_uniqueness()
+        self._changed()
 
     
     def set_active_site(self, site_name: str=None, variation_name: str=None):
@@ -147,6 +158,7 @@ class ParameterProvider(MutableMapping):
 
         self._nsites_activated += 1
         self._test_uniqueness()
+        self._changed()
 
 
     @property
@@ -155,6 +167,59 @@ class ParameterProvider(MutableMapping):
                                 self.__class__.__name__)
         return logging.getLogger(loggername)
 
+    def copy(self):
+        """Returns a copy of the ParameterProvider.
+
+        The site, soil and crop data providers are shared with the copy, while
+        the override and timer data are copied as they change during a
+        simulation.
+        """
+        new = self.__class__.__new__(self.__class__)
+        new.__dict__.update(self.__dict__)
+        new._override = dict(self._override)
+        new._timerdata = dict(self._timerdata)
+        new._maps = [new._override, new._sitedata, new._timerdata, new._soildata, new._cropdata]
+        return new
+
+    @property
+    def version(self):
+        """Counter that is incremented every time the parameter values change.
+        """
+        return self._version
+
+    def _changed(self):
+        """Invalidates the resolved parameters after a change.
+        """
+        self._version += 1
+        self._resolved = None
+
+    def _get_resolved(self):
+        """Returns the flat dictionary with the value of every parameter,
+        resolved in the search order of self._maps.
+        """
+        resolved = self._resolved
+        if resolved is None:
+            resolved = {}
+            for mapping in reversed(self._maps):
+                resolved.update(mapping)
+            self._resolved = resolved
+        return resolved
+
+    def get_parameter_key(self):
+        """Returns a hashable key identifying the values of all parameters:
+        the overridden parameters and the active site, timer, soil and crop
+        parameters.
+
+        Together with the active crop and variety the key identifies the
+        parameter values a crop is initialized with. The key is a digest of
+        the resolved parameters and is computed once per `version`.
+        """
+        if self._parameter_key is None or self._parameter_key[0] != self._version:
+            items = repr(sorted(self._get_resolved().items()))
+            key = hashlib.sha1(items.encode("utf-8")).hexdigest()
+            self._parameter_key = (self._version, key)
+        return self._parameter_key[1]
+
     def set_override(self, varname, value, check=True):
         """"Override the value of parameter varname in the parameterprovider.
 
@@ -174,6 +239,7 @@ class ParameterProvider(MutableMapping):
                 raise exc.PCSEError(msg)
         else:
             self._override[varname] = value
+        self._changed()
 
     def clear_override(self, varname=None):
         """Removes parameter varname from the set of overridden parameters.
@@ -189,6 +255,7 @@ class ParameterProvider(MutableMapping):
             else:
                 msg = "Cannot clear varname '%s' from override" % varname
                 raise exc.PCSEError(msg)
+        self._changed()
 
     def _test_uniqueness(self):
         """Check if parameter names are unique and raise an error if duplicates occur.
@@ -212,10 +279,7 @@ class ParameterProvider(MutableMapping):
         This includes the parameters in self._override in order to be able to
         iterate over all parameters in the ParameterProvider.
         """
-        s = []
-        for mapping in self._maps:
-            s.extend(mapping.keys())
-        return sorted(list(set(s)))
+        return sorted(self._get_resolved())
 
     def __getitem__(self, key):
         """Returns the value of the given parameter (key).
@@ -225,16 +289,10 @@ class ParameterProvider(MutableMapping):
 
         :param key: parameter name to return
         """
-        for mapping in self._maps:
-            if key in mapping:
-                return mapping[key]
-        raise KeyError(key)
+        return self._get_resolved()[key]
 
     def __contains__(self, key):
-        for mapping in self._maps:
-            if key in mapping:
-                return True
-        return False
+        return key in self._get_resolved()
 
     def __str__(self):
         msg = "ParameterProvider providing %i parameters, %i parameters overridden: %s."
@@ -252,6 +310,7 @@ class ParameterProvider(MutableMapping):
         """
         if key in self:
             self._override[key] = value
+            self._changed()
         else:
             msg = "Cannot override parameter '%s', parameter does not exist. " \
                   "to bypass this check use: set_override(parameter, value, check=False)" % key
@@ -267,6 +326,7 @@ class ParameterProvider(MutableMapping):
         """
         if key in self._override:
             self._override.pop(key)
+            self._changed()
         elif key in self:
             msg = "Cannot delete default parameter: %s" % key
             raise exc.PCSEError(msg)
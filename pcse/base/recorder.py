@@ -0,0 +1,146 @@
+"""Columnar recording of model output
+
+The OutputRecorder stores the values of selected model variables at every
+OUTPUT signal in preallocated NumPy columns together with the day of the
+values. In full mode the columns grow as needed and hold the whole
+simulation, in ring mode only the last `maxlen` days are kept. Recorded
+output can be exported to NumPy without copying, or to a pandas DataFrame
+or an Arrow table when needed.
+
+Written by: Will Solow, 2024
+"""
+import numpy as np
+
+from ..utils import exceptions as exc
+
+
+class OutputRecorder(object):
+    """Records model variables in NumPy columns with a day index.
+
+    :param varnames: list of variable names to record
+    :param maxlen: keep only the values of the last `maxlen` days (ring
+        mode). When None all days are kept (full mode).
+    :param capacity: initial number of days allocated in full mode, the
+        columns are doubled in size when full.
+
+    Values are stored as floats, missing values as NaN and dates as
+    YYYYMMDD, as in the output buffer of the Engine.
+    """
+
+    def __init__(self, varnames, maxlen=None, capacity=366):
+        if maxlen is not None and maxlen < 1:
+            msg = "maxlen of the OutputRecorder should be at least 1, got %s." % maxlen
+            raise exc.PCSEError(msg)
+        self.varnames = tuple(varnames)
+        self.maxlen = maxlen
+        capacity = maxlen if maxlen is not None else max(int(capacity), 1)
+        self._values = np.full((len(self.varnames), capacity), np.nan)
+        self._days = np.zeros(capacity, dtype="datetime64[D]")
+        # Number of days recorded since the last clear()
+        self._count = 0
+
+    def __len__(self):
+        if self.maxlen is None:
+            return self._count
+        return min(self._count, self.maxlen)
+
+    def _grow(self):
+        """Doubles the capacity of the columns.
+        """
+        capacity = 2 * self._days.shape[0]
+        values = np.full((len(self.varnames), capacity), np.nan)
+        values[:, :self._count] = self._values[:, :self._count]
+        days = np.zeros(capacity, dtype="datetime64[D]")
+        days[:self._count] = self._days[:self._count]
+        self._values, self._days = values, days
+
+    def next_row(self, day):
+        """Adds day to the recorder and returns a view on the column values
+        of that day, to be filled by the caller.
+        """
+        capacity = self._days.shape[0]
+        if self.maxlen is None:
+            if self._count == capacity:
+                self._grow()
+            i = self._count
+        else:
+            i = self._count % capacity
+        self._count += 1
+        self._days[i] = day
+        return self._values[:, i]
+
+    def _order(self):
+        """Returns the slice or index array that puts the recorded days in
+        chronological order.
+        """
+        n = len(self)
+        if self.maxlen is None or self._count <= self.maxlen:
+            return slice(0, n)
+        start = self._count % self.maxlen
+        return np.r_[start:self.maxlen, 0:start]
+
+    @property
+    def days(self):
+        """Array with the recorded days in chronological order.
+        """
+        return self._days[self._order()]
+
+    def get(self, varname):
+        """Returns the recorded values of varname in chronological order.
+        """
+        try:
+            i = self.varnames.index(varname)
+        except ValueError:
+            msg = "Variable '%s' is not recorded by the OutputRecorder." % varname
+            raise exc.PCSEError(msg)
+        return self._values[i, self._order()]
+
+    def to_numpy(self):
+        """Returns the recorded days and an array of shape (days, variables)
+        with the recorded values.
+
+        In full mode and before a ring buffer has wrapped around, the arrays
+        are views on the columns of the recorder and are not copied.
+        """
+        order = self._order()
+        return self._days[order], self._values[:, order].T
+
+    def to_dataframe(self):
+        """Returns the recorded values as a pandas DataFrame indexed by day.
+        """
+        import pandas as pd
+        order = self._order()
+        columns = {varname: self._values[i, order] for i, varname in enumerate(self.varnames)}
+        return pd.DataFrame(columns, index=pd.Index(self._days[order], name="day"))
+
+    def to_arrow(self):
+        """Returns the recorded values as a pyarrow Table with a "day" column.
+        """
+        try:
+            import pyarrow as pa
+        except ImportError:
+            msg = "Exporting output to Arrow requires the pyarrow package."
+            raise exc.PCSEError(msg)
+        order = self._order()
+        columns = {"day": pa.array(self._days[order])}
+        for i, varname in enumerate(self.varnames):
+            columns[varname] = pa.array(self._values[i, order])
+        return pa.table(columns)
+
+    def clear(self):
+        """Removes all recorded values, the allocated columns are kept.
+        """
+        self._values[:, :] = np.nan
+        self._count = 0
+
+    def copy(self):
+        """Returns an independent copy of the recorder, used for engine
+        snapshots and forks.
+        """
+        new = object.__new__(OutputRecorder)
+        new.varnames = self.varnames
+        new.maxlen = self.maxlen
+        new._values = self._values.copy()
+        new._days = self._days.copy()
+        new._count = self._count
+        return new
@@ -17,6 +17,28 @@ from .variablekiosk import VariableKiosk
 from .states_rates import StatesTemplate, RatesTemplate, ParamTemplate
 from .parameter_providers import ParameterProvider
 
+def _structure_changed(kiosk):
+    """Invalidate the execution plans of the SimulationObjects and the Engine
+    using kiosk.
+    """
+    if kiosk is not None:
+        kiosk.structure_changed()
+
+def get_structure_version(kiosk):
+    """Returns the version of the structure of the SimulationObjects using
+    kiosk, or None without a kiosk.
+    """
+    if kiosk is None:
+        return None
+    return kiosk.structure_version
+
+def _changes_structure(obj, attr, value):
+    """Returns True if assigning value to attribute attr of obj changes the
+    sub-SimulationObjects or the rates of obj.
+    """
+    return attr == "rates" or isinstance(value, SimulationObject) or \
+        isinstance(obj.__dict__["_trait_values"].get(attr), SimulationObject)
+
 class SimulationObject(HasTraits, DispatcherObject):
     """Base class for PCSE simulation objects.
 
@@ -39,6 +61,11 @@ class SimulationObject(HasTraits, DispatcherObject):
     # Placeholder for variables that are to be set during finalizing.
     _for_finalize = Dict()
 
+    # Execution plan, see _get_plan()
+    _plan_version = -1
+    _sub_sim_objects = None
+    _rates_plan = None
+
     def __init__(self, day: date, kiosk: VariableKiosk, *args, **kwargs):
         """Initialize Simulation Object
         
@@ -104,11 +131,33 @@ class SimulationObject(HasTraits, DispatcherObject):
         if attr.startswith("_") or type(value) is types.FunctionType:
             HasTraits.__setattr__(self, attr, value)
         elif hasattr(self, attr):
+            if _changes_structure(self, attr, value):
+                _structure_changed(self.kiosk)
             HasTraits.__setattr__(self, attr, value)
         else:
             msg = "Assignment to non-existing attribute '%s' prevented." % attr
             raise AttributeError(msg)
 
+    def _get_plan(self):
+        """Returns the execution plan of this SimulationObject: the list of
+        sub-SimulationObjects and the list of rates objects of this object and
+        all objects below it, in the order in which they are zerofied.
+
+        The plan is rebuilt only after the structure of any SimulationObject
+        using the same kiosk has changed, see `__setattr__()`.
+        """
+        version = get_structure_version(self.kiosk)
+        if version is None or self._plan_version != version:
+            sub_sim_objects = [attr for attr in self.__dict__["_trait_values"].values()
+                               if isinstance(attr, SimulationObject)]
+            rates_plan = [] if self.rates is None else [self.rates]
+            for simobj in sub_sim_objects:
+                rates_plan.extend(simobj._get_plan()[1])
+            self._sub_sim_objects = sub_sim_objects
+            self._rates_plan = rates_plan
+            self._plan_version = version
+        return self._sub_sim_objects, self._rates_plan
+
     def get_variable(self, varname):
         """ Return the value of the specified state or rate variable.
 
@@ -195,13 +244,7 @@ class SimulationObject(HasTraits, DispatcherObject):
     def subSimObjects(self):
         """ Return SimulationObjects embedded within self.
         """
-
-        subSimObjects = []
-        defined_traits = self.__dict__["_trait_values"]
-        for attr in defined_traits.values():
-            if isinstance(attr, SimulationObject):
-                subSimObjects.append(attr)
-        return subSimObjects
+        return self._get_plan()[0]
 
     def finalize(self, day):
         """ Run the _finalize call on subsimulation objects
@@ -239,14 +282,8 @@ class SimulationObject(HasTraits, DispatcherObject):
     def zerofy(self):
         """Zerofy the value of all rate variables of this and any sub-SimulationObjects.
         """
-
-        if self.rates is not None:
-            self.rates.zerofy()
-
-        # Walk over possible sub-simulation objects.
-        if self.subSimObjects is not None:
-            for simobj in self.subSimObjects:
-                simobj.zerofy()
+        for rates in self._get_plan()[1]:
+            rates.zerofy()
 
 
 
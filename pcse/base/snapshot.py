@@ -0,0 +1,378 @@
+"""Snapshots and forks of the mutable state of a PCSE Engine
+
+A snapshot records the trait values of every HasTraits object that is
+reachable from an engine (agromanager, timer, crop and soil components and
+their states/rates objects), the contents of the VariableKiosk and the signal
+connections of the SignalBus of the kiosk. Restoring a snapshot puts the
+engine back in exactly that state without re-running the model configuration,
+the agromanager or the initialization of the SimulationObjects.
+
+A fork is an independent copy of a running engine. All HasTraits objects of
+the engine are copied while parameters, Afgen tables, the weather data and
+the model configuration are shared. The copy gets its own VariableKiosk and
+all signal handlers are reconnected to the new kiosk.
+
+A crop template is a copy of a freshly initialized crop simulation object
+that is not attached to any engine. New crops are created from it by copying
+the template and binding the copy to the kiosk of the engine, which avoids
+running the initialization of all crop components at every CROP_START.
+
+Written by: Will Solow, 2024
+"""
+import types
+from datetime import date
+from collections import deque, OrderedDict
+
+import numpy as np
+
+from ..utils.traitlets import HasTraits
+from .states_rates import ParamTemplate
+from .simulationobject import _structure_changed
+from .dispatcher import DispatcherObject
+from .recorder import OutputRecorder
+
+# Instance attributes that are managed by traitlets and are never part of
+# the model state
+_TRAIT_INTERNALS = ("_trait_values", "_trait_notifiers", "_trait_validators",
+                    "_cross_validation_lock")
+
+# Cached execution plans of the SimulationObjects, rebuilt after a restore
+_PLAN_ATTRS = ("_plan_version", "_sub_sim_objects", "_rates_plan")
+
+# Mutable containers that need to be copied instead of shared
+_MUTABLE_TYPES = (list, dict, set)
+
+
+def _copy_value(value):
+    """Return a copy of value if it is a mutable builtin container, otherwise
+    return value itself.
+
+    The copy is one level deep which suffices for the containers used by the
+    PCSE SimulationObjects (deques of floats, lists of output dicts, etc).
+    Subclasses such as the VariableKiosk are shared objects and are not copied.
+    """
+    value_type = type(value)
+    if value_type is deque:
+        return deque(value, maxlen=value.maxlen)
+    if value_type in _MUTABLE_TYPES or value_type is np.ndarray or value_type is OutputRecorder:
+        return value.copy()
+    return value
+
+
+def _copy_mapping(mapping):
+    """Copy a mapping of attribute names to values with _copy_value().
+    """
+    return {k: _copy_value(v) for k, v in mapping.items()}
+
+
+class EngineSnapshot(object):
+    """Frozen copy of the mutable state of an Engine.
+
+    :param engine: The Engine to take the snapshot from
+
+    Objects are stored by reference, values by (shallow) copy. Parameter
+    objects, the ParameterProvider, the WeatherDataProvider and the
+    model configuration are shared with the engine and are not copied as
+    they do not change during a simulation. A snapshot can only be restored
+    on the engine it was taken from, but it can be restored any number of
+    times.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._objects = []
+        self._collect(engine, set())
+
+        kiosk = engine.kiosk
+        self._kiosk = kiosk._get_state()
+        self._connections = kiosk.signal_bus._get_state()
+
+    def _collect(self, obj, visited):
+        """Record the trait values and plain instance attributes of obj and
+        recurse into all HasTraits objects it refers to.
+        """
+        visited.add(id(obj))
+        trait_values = obj.__dict__["_trait_values"]
+        attrs = {k: v for k, v in obj.__dict__.items()
+                 if k not in _TRAIT_INTERNALS and k not in _PLAN_ATTRS
+                 and type(v) is not types.FunctionType}
+        # Compact states/rates objects keep their variables in slots
+        for slot in getattr(obj, "_compact_slots", ()):
+            attrs[slot] = getattr(obj, slot)
+        self._objects.append((obj, _copy_mapping(trait_values), _copy_mapping(attrs)))
+
+        for value in list(trait_values.values()) + list(attrs.values()):
+            if isinstance(value, HasTraits) and not isinstance(value, ParamTemplate) \
+                    and id(value) not in visited:
+                self._collect(value, visited)
+
+    def restore(self):
+        """Write the recorded state back into the engine and its components.
+
+        Values are assigned directly into the trait storage, bypassing
+        validation and observers, as they were valid at the time the snapshot
+        was taken.
+        """
+        for obj, trait_values, attrs in self._objects:
+            values = obj.__dict__["_trait_values"]
+            values.clear()
+            values.update(_copy_mapping(trait_values))
+            for k, v in attrs.items():
+                object.__setattr__(obj, k, _copy_value(v))
+
+        kiosk = self.engine.kiosk
+        kiosk._set_state(self._kiosk)
+
+        # Replace the signal connections of the components of the engine so
+        # that components created after the snapshot was taken no longer
+        # receive signals. Handlers connected by the caller are kept as they
+        # are, see `Engine.restore()`.
+        bus = kiosk.signal_bus
+        current = bus._get_state()
+        connections = {}
+        for signal, receivers in self._connections.items():
+            connected = {r.key for r in current.get(signal, ())}
+            connections[signal] = [r for r in receivers
+                                   if _is_component_receiver(r) or r.key in connected]
+        for signal, receivers in current.items():
+            restored = connections.setdefault(signal, [])
+            keys = {r.key for r in restored}
+            restored.extend(r for r in receivers
+                            if r.key not in keys and not _is_component_receiver(r))
+        bus._set_state(connections)
+
+        # The restored objects may differ from those in the cached execution
+        # plans, e.g. a soil that was removed after the snapshot was taken.
+        _structure_changed(kiosk)
+
+
+def _is_component_receiver(receiver):
+    """Returns True if the handler of receiver is a method of a component of
+    an engine (a DispatcherObject) rather than a handler of the caller.
+    """
+    handler = receiver()
+    return isinstance(getattr(handler, "__self__", None), DispatcherObject)
+
+
+class ObjectCloner(object):
+    """Copies graphs of HasTraits objects without calling their constructors.
+
+    :param memo: optional dict mapping the id() of objects to the objects
+        that replace them in the copies, e.g. another VariableKiosk.
+
+    Every HasTraits object is copied once, with references between them
+    pointing to the copies. Parameter objects are shared and mutable
+    containers are copied with `_copy_value()`.
+    """
+
+    def __init__(self, memo=None):
+        self._memo = {} if memo is None else memo
+
+    def _new_id(self, oid):
+        """Return the id of the copy of the object with id oid.
+        """
+        if oid in self._memo:
+            return id(self._memo[oid])
+        return oid
+
+    def _remap(self, value):
+        """Return the counterpart of value in the copies.
+        """
+        if id(value) in self._memo:
+            return self._memo[id(value)]
+        if isinstance(value, HasTraits) and not isinstance(value, ParamTemplate):
+            return self._clone(value)
+        if isinstance(value, types.MethodType):
+            obj = self._remap(value.__self__)
+            if obj is not value.__self__:
+                return types.MethodType(value.__func__, obj)
+            return value
+
+        value_type = type(value)
+        if value_type is list:
+            return [self._remap(v) for v in value]
+        if value_type is dict:
+            return {k: self._remap(v) for k, v in value.items()}
+        return _copy_value(value)
+
+    def _clone(self, obj):
+        """Copy a HasTraits object without calling its constructor.
+        """
+        cls = obj.__class__
+        new = object.__new__(cls)
+        self._memo[id(obj)] = new
+
+        for k, v in obj.__dict__.items():
+            # Method wrappers of the prepare_rates/prepare_states decorators
+            # are bound to obj and are recreated on first access.
+            if type(v) is types.FunctionType:
+                continue
+            if k == "_trait_notifiers":
+                v = {name: {t: [self._remap(h) for h in handlers] for t, handlers in types_.items()}
+                     for name, types_ in v.items()}
+            else:
+                v = self._remap(v)
+            new.__dict__[k] = v
+        for slot in getattr(obj, "_compact_slots", ()):
+            object.__setattr__(new, slot, self._remap(getattr(obj, slot)))
+        return new
+
+    def _connect_signals(self, kiosk, new_kiosk):
+        """Connect the counterparts of all handlers listening to kiosk to
+        new_kiosk, in the same order.
+
+        Handlers of objects that are no longer part of the engine are skipped.
+        """
+        bus = kiosk.signal_bus
+        for signal in bus.signals():
+            for handler in bus.receivers(signal):
+                if isinstance(handler, types.MethodType):
+                    obj = handler.__self__
+                    if id(obj) in self._memo:
+                        handler = types.MethodType(handler.__func__, self._memo[id(obj)])
+                    elif isinstance(obj, HasTraits):
+                        continue
+                new_kiosk.signal_bus.connect(handler, signal)
+
+
+class EngineForker(ObjectCloner):
+    """Creates an independent copy of an Engine.
+
+    :param engine: The Engine to fork
+
+    Every HasTraits object reachable from the engine is copied once, with
+    references between them pointing to the copies. The VariableKiosk and
+    the ParameterProvider are replaced by new instances; parameter objects,
+    the WeatherDataProvider and the model configuration are shared.
+    Observers on the states/rates objects and signal handlers connected to
+    the kiosk are rebound to the copied objects.
+    """
+
+    def __init__(self, engine):
+        ObjectCloner.__init__(self)
+        self.engine = engine
+
+    def fork(self):
+        """Return the forked engine.
+        """
+        engine = self.engine
+        kiosk = engine.kiosk.__class__()
+        kiosk.states_rates_backend = engine.kiosk.states_rates_backend
+        self._memo[id(engine.kiosk)] = kiosk
+        if engine.parameterprovider is not None:
+            self._memo[id(engine.parameterprovider)] = engine.parameterprovider.copy()
+
+        new_engine = self._clone(engine)
+
+        # Registrations in the kiosk refer to the id() of the registering
+        # states/rates objects, which have changed.
+        values, *registrations = engine.kiosk._get_state()
+        registrations = [{varname: self._new_id(oid) for varname, oid in reg.items()}
+                         for reg in registrations]
+        kiosk._set_state((dict(values), *registrations))
+
+        self._connect_signals(engine.kiosk, kiosk)
+        return new_engine
+
+
+class CropTemplate(object):
+    """Initialized crop that can be instantiated on any engine.
+
+    :param crop: freshly initialized crop SimulationObject
+    :param kiosk: VariableKiosk the crop was initialized with
+    :param parameterprovider: ParameterProvider the crop was initialized with
+    :param day: day on which the crop was initialized
+
+    The template holds a copy of the crop bound to a private kiosk, together
+    with the variables the crop registered in the kiosk and the signal
+    handlers it connected. Parameter objects and Afgen tables are shared
+    with the copies.
+
+    The crop initialization may only depend on `day` through date valued
+    states (e.g. the day of planting), these are set to the day on which the
+    template is instantiated. Signals sent during the initialization of the
+    crop (`crop_emerged` for crops starting at emergence) are not sent again.
+    """
+
+    def __init__(self, crop, kiosk, parameterprovider, day):
+        self.day = day
+        self._kiosk = kiosk.__class__()
+        self._parameterprovider = parameterprovider.copy()
+        cloner = ObjectCloner({id(kiosk): self._kiosk,
+                               id(parameterprovider): self._parameterprovider})
+        self.crop = cloner._clone(crop)
+        memo = cloner._memo
+
+        # Registrations as (varname, type, published, has value, object)
+        self._variables = []
+        for vartype, registered, published in (("S", kiosk.registered_states, kiosk.published_states),
+                                               ("R", kiosk.registered_rates, kiosk.published_rates)):
+            for varname, oid in registered.items():
+                if oid in memo:
+                    self._variables.append((varname, vartype, varname in published,
+                                            varname in kiosk, memo[oid]))
+
+        self._handlers = []
+        bus = kiosk.signal_bus
+        for signal in bus.signals():
+            for handler in bus.receivers(signal):
+                if isinstance(handler, types.MethodType) and id(handler.__self__) in memo:
+                    self._handlers.append((signal, handler.__func__, memo[id(handler.__self__)]))
+
+    def instantiate(self, day, kiosk, parameterprovider):
+        """Return a new crop on day, registered in kiosk and using
+        parameterprovider.
+        """
+        cloner = ObjectCloner({id(self._kiosk): kiosk,
+                               id(self._parameterprovider): parameterprovider})
+        crop = cloner._clone(self.crop)
+        memo = cloner._memo
+
+        if day != self.day:
+            for obj in memo.values():
+                if isinstance(obj, HasTraits):
+                    self._set_day(obj, day)
+
+        for varname, vartype, published, has_value, obj in self._variables:
+            new = memo[id(obj)]
+            kiosk.register_variable(id(new), varname, vartype, publish=published)
+            if has_value:
+                kiosk.set_variable(id(new), varname, getattr(new, varname))
+
+        for signal, func, obj in self._handlers:
+            kiosk.signal_bus.connect(types.MethodType(func, memo[id(obj)]), signal)
+        return crop
+
+    def _set_day(self, obj, day):
+        """Replace the template day in the date valued traits of obj.
+        """
+        values = obj.__dict__["_trait_values"]
+        for k, v in values.items():
+            if isinstance(v, date) and v == self.day:
+                values[k] = day
+        for slot in getattr(obj, "_compact_slots", ()):
+            v = getattr(obj, slot, None)
+            if isinstance(v, date) and v == self.day:
+                object.__setattr__(obj, slot, day)
+
+
+_crop_templates = OrderedDict()
+# Maximum number of crop templates that are kept
+MAX_CROP_TEMPLATES = 32
+
+def get_crop_template(key):
+    """Returns the CropTemplate stored under key or None. Templates are kept
+    for at most MAX_CROP_TEMPLATES keys, the least recently used are
+    discarded.
+    """
+    template = _crop_templates.get(key)
+    if template is not None:
+        _crop_templates.move_to_end(key)
+    return template
+
+def add_crop_template(key, template):
+    """Stores template under key, see `get_crop_template()`.
+    """
+    _crop_templates[key] = template
+    while len(_crop_templates) > MAX_CROP_TEMPLATES:
+        _crop_templates.popitem(last=False)
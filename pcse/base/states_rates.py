@@ -8,11 +8,103 @@ Written by: Allard de Wit (allard.dewit@wur.nl), April 2014
 Modified by Will Solow, 2024
 """
 import logging
+from collections import OrderedDict
 
-from ..utils.traitlets import (HasTraits, Float, Int, Instance, Bool, All)
+import numpy as np
+
+from ..utils.traitlets import (HasTraits, Float, Int, Instance, Bool, All, Undefined)
 from ..utils import exceptions as exc
 from .variablekiosk import VariableKiosk
-from ..util import Afgen
+from ..util import Afgen, get_afgen
+
+# Storage backend for state/rate variables, see set_states_rates_backend()
+_BACKENDS = ("compact", "traitlets")
+_backend = "traitlets"
+
+# Compact classes by (template class, published variables)
+_compact_classes = {}
+
+
+def _check_backend(backend):
+    if backend not in _BACKENDS:
+        msg = "Unknown states/rates backend '%s', should be one of %s" % (backend, _BACKENDS)
+        raise exc.PCSEError(msg)
+    return backend
+
+
+def set_states_rates_backend(backend):
+    """Select how state and rate variables are stored by default.
+
+    :param backend: Either "traitlets" (default) or "compact".
+
+    The "traitlets" backend validates every assignment through the trait
+    type and publishes through trait observers. With the opt-in "compact"
+    backend each StatesTemplate/RatesTemplate subclass is compiled into a
+    subclass that stores its variables in `__slots__`. Assignments are plain
+    attribute stores and published variables are written straight into the
+    VariableKiosk, which is faster but assignments are NOT validated: a
+    value of the wrong type is stored as is instead of raising a
+    TraitError.
+
+    The backend applies to states/rates objects created after the call. An
+    engine can select its backend with the STATES_RATES_BACKEND item of the
+    model configuration, which takes precedence over the default.
+    """
+    global _backend
+    _backend = _check_backend(backend)
+
+
+def get_states_rates_backend(kiosk=None):
+    """Returns the name of the states/rates backend used for objects
+    registering with kiosk, or the default backend if kiosk is None or does
+    not select a backend.
+    """
+    backend = getattr(kiosk, "states_rates_backend", None)
+    return _backend if backend is None else backend
+
+
+def _published_property(name, member):
+    """Returns a property storing the value of variable name in the slot
+    `member` and publishing it in the VariableKiosk.
+    """
+    def fget(self):
+        return member.__get__(self)
+
+    def fset(self, value):
+        member.__set__(self, value)
+        self._kiosk._publish(name, value)
+
+    return property(fget, fset)
+
+
+def _get_compact_class(cls, publish):
+    """Returns the compact version of template class cls for the given set
+    of published variables, compiling it on first use.
+    """
+    key = (cls, frozenset(publish))
+    try:
+        return _compact_classes[key]
+    except KeyError:
+        pass
+
+    traits = cls.class_traits()
+    variables = {name: trait for name, trait in traits.items()
+                 if not (name.startswith("_") or name.startswith("trait"))}
+    slot_of = {name: ("_s_" + name if name in publish else name) for name in variables}
+    slots = tuple(sorted(slot_of.values())) + ("_kiosk", "_locked")
+    namespace = {"__slots__": slots,
+                 "__module__": cls.__module__,
+                 "__qualname__": cls.__qualname__,
+                 "__doc__": cls.__doc__,
+                 "_compact_traits": variables,
+                 "_compact_slot_of": slot_of,
+                 "_compact_slots": slots}
+    compact_cls = type(cls)(cls.__name__, (cls,), namespace)
+    for name, slot in slot_of.items():
+        if name != slot:
+            setattr(compact_cls, name, _published_property(name, getattr(compact_cls, slot)))
+    _compact_classes[key] = compact_cls
+    return compact_cls
 
 
 def check_publish(publish):
@@ -31,6 +123,23 @@ def check_publish(publish):
         raise RuntimeError(msg)
     return set(publish)
 
+# Shared parameter objects by (template class, parameter values)
+_parameter_sets = OrderedDict()
+# Maximum number of parameter objects that are kept
+MAX_PARAMETER_SETS = 1024
+
+
+def _freeze(value):
+    """Returns a hashable version of a parameter value, lists and arrays are
+    converted to tuples.
+    """
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, np.ndarray):
+        return _freeze(value.tolist())
+    return value
+
+
 class ParamTemplate(HasTraits):
     """Template for storing parameter values.
 
@@ -64,36 +173,88 @@ class ParamTemplate(HasTraits):
           File "pcse/base.py", line 205, in __init__
             raise exc.ParameterError(msg)
         pcse.exceptions.ParameterError: Value for parameter C missing.
+
+    Parameter objects are read-only once initialized. Objects of the same
+    class with the same parameter values are created only once and shared,
+    also between engines, at most MAX_PARAMETER_SETS are kept. AFGEN tables
+    are shared through `get_afgen()`.
     """
+    _frozen = False
+
+    def __new__(cls, parvalues:dict, *args, **kwargs):
+        key = cls._get_key(parvalues)
+        if key is None:
+            return HasTraits.__new__(cls, parvalues, *args, **kwargs)
+        params = _parameter_sets.get(key)
+        if params is None:
+            params = HasTraits.__new__(cls, parvalues, *args, **kwargs)
+            params.__init__(parvalues)
+            _parameter_sets[key] = params
+            while len(_parameter_sets) > MAX_PARAMETER_SETS:
+                _parameter_sets.popitem(last=False)
+        else:
+            _parameter_sets.move_to_end(key)
+        return params
+
+    @classmethod
+    def _parameter_names(cls):
+        """Returns the names of the parameters of the template class.
+        """
+        names = cls.__dict__.get("_parnames")
+        if names is None:
+            # Attributes starting with "trait" are special attributes and not
+            # WOFOST parameters
+            names = tuple(name for name in cls.class_trait_names() if not name.startswith("trait"))
+            cls._parnames = names
+        return names
+
+    @classmethod
+    def _get_key(cls, parvalues):
+        """Returns the key identifying the parameter object of this class for
+        parvalues, or None if a value cannot be hashed.
+        """
+        values = []
+        for parname in cls._parameter_names():
+            if parname not in parvalues:
+                msg = "Value for parameter %s missing." % parname
+                raise exc.ParameterError(msg)
+            values.append(_freeze(parvalues[parname]))
+        key = (cls, tuple(values))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
 
     def __init__(self, parvalues:dict):
         """Initialize parameter template
         Args:
             parvalues - parameter values to include 
         """
+        if self._frozen:
+            return
         HasTraits.__init__(self)
 
-        for parname in self.trait_names():
-            # If the attribute of the class starts with "trait" than
-            # this is a special attribute and not a WOFOST parameter
-            if parname.startswith("trait"):
-                continue
-            # else check if the parname is available in the dictionary
-            # of parvalues
+        for parname in self._parameter_names():
+            # check if the parname is available in the dictionary of parvalues
             if parname not in parvalues:
                 msg = "Value for parameter %s missing." % parname
                 raise exc.ParameterError(msg)
             value = parvalues[parname]
             if isinstance(getattr(self, parname), (Afgen)):
                 # AFGEN table parameter
-                setattr(self, parname, Afgen(value))
+                setattr(self, parname, get_afgen(value))
             else:
                 # Single value parameter
                 setattr(self, parname, value)
+        self._frozen = True
 
     def __setattr__(self, attr, value):
         if attr.startswith("_"):
             HasTraits.__setattr__(self, attr, value)
+        elif self._frozen:
+            msg = "Parameter '%s' is read-only, parameter objects are shared." % attr
+            raise AttributeError(msg)
         elif hasattr(self, attr):
             HasTraits.__setattr__(self, attr, value)
         else:
@@ -108,6 +269,23 @@ class StatesRatesCommon(HasTraits):
     _valid_vars = Instance(set)
     _locked = Bool(False)
 
+    # Set on the compact classes, see _get_compact_class()
+    _compact_traits = None
+    _compact_slot_of = None
+    _compact_slots = ()
+    _allow_compact = True
+
+    def __new__(cls, *args, **kwargs):
+        """Substitute the compact version of cls when the compact backend
+        is used for the kiosk.
+        """
+        kiosk = args[0] if args else kwargs.get("kiosk")
+        if get_states_rates_backend(kiosk) == "compact" and cls._compact_traits is None \
+                and cls._allow_compact:
+            publish = args[1] if len(args) > 1 else kwargs.get("publish")
+            cls = _get_compact_class(cls, check_publish(publish))
+        return super(StatesRatesCommon, cls).__new__(cls, *args, **kwargs)
+
     def __init__(self, kiosk:VariableKiosk=None, publish=None):
         """Set up the common stuff for the states and rates template
         including variables that have to be published in the kiosk
@@ -121,6 +299,7 @@ class StatesRatesCommon(HasTraits):
                    "or state variables.")
             raise RuntimeError(msg)
         self._kiosk = kiosk
+        self._locked = False
 
         # Check publish variable for correct usage
         publish = check_publish(publish)
@@ -128,6 +307,12 @@ class StatesRatesCommon(HasTraits):
         # Determine the rate/state attributes defined by the user
         self._valid_vars = self._find_valid_variables()
 
+        # Slots of compact classes start out with the trait defaults
+        if self._compact_traits is not None:
+            for name, trait in self._compact_traits.items():
+                value = trait.default(self)
+                setattr(self, self._compact_slot_of[name], None if value is Undefined else value)
+
         # Register all variables with the kiosk and optionally publish them.
         self._register_with_kiosk(publish)
 
@@ -137,9 +322,18 @@ class StatesRatesCommon(HasTraits):
         """
 
         valid = lambda s: not (s.startswith("_") or s.startswith("trait"))
-        r = [name for name in self.trait_names() if valid(name)]
+        r = [name for name in self._variable_traits() if valid(name)]
         return set(r)
 
+    def _variable_traits(self):
+        """Returns a dict with the traits of the class. On compact classes the
+        state/rate variables are slots and the traits are taken from the
+        template class.
+        """
+        if self._compact_traits is not None:
+            return self._compact_traits
+        return self.traits()
+
     def _register_with_kiosk(self, publish):
         """Register the variable with the variable kiosk.
 
@@ -160,7 +354,9 @@ class StatesRatesCommon(HasTraits):
                 publish.remove(attr)
                 self._kiosk.register_variable(id(self), attr, type=self._vartype,
                                               publish=True)
-                self.observe(handler=self._update_kiosk, names=attr, type=All)
+                # Compact classes publish through a property
+                if self._compact_traits is None:
+                    self.observe(handler=self._update_kiosk, names=attr, type=All)
             else:
                 self._kiosk.register_variable(id(self), attr, type=self._vartype,
                                               publish=False)
@@ -304,6 +500,7 @@ class StatesWithImplicitRatesTemplate(StatesTemplate):
 
     rates = {}
     __initialized = False
+    _allow_compact = False
 
     def __setattr__(self, name, value):
         if name in self.rates:
@@ -396,7 +593,7 @@ class RatesTemplate(StatesRatesCommon):
         zero_value = {Bool: False, Int: 0, Float: 0.}
 
         d = {}
-        for name, value in self.traits().items():
+        for name, value in self._variable_traits().items():
             if name not in self._valid_vars:
                 continue
             try:
@@ -412,4 +609,9 @@ class RatesTemplate(StatesRatesCommon):
         """Sets the values of all rate values to zero (Int, Float)
         or False (Boolean).
         """
-        self._trait_values.update(self._rate_vars_zero)
+        if self._compact_traits is not None:
+            slot_of = self._compact_slot_of
+            for name, zero in self._rate_vars_zero.items():
+                setattr(self, slot_of[name], zero)
+        else:
+            self._trait_values.update(self._rate_vars_zero)
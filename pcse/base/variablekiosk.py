@@ -4,7 +4,14 @@ passing throughout various sub-objects of the crop and soil model
 Written by: Allard de Wit (allard.dewit@wur.nl), April 2014
 Modified by Will Solow, 2024
 """
+import itertools
+
 from ..utils import exceptions as exc
+from .dispatcher import SignalBus
+
+# Source of the structure versions of all kiosks, a version is never used by
+# two kiosks.
+_structure_versions = itertools.count()
 
 
 class VariableKiosk(dict):
@@ -85,6 +92,10 @@ class VariableKiosk(dict):
           - variable VAR3, value: undefined
     """
 
+    # Stores the value of a published variable without checks. Used by the
+    # compact states/rates objects which can only publish their own variables.
+    _publish = dict.__setitem__
+
     def __init__(self):
         """Initialize the class `VariableKiosk`
         """
@@ -93,6 +104,14 @@ class VariableKiosk(dict):
         self.registered_rates = {}
         self.published_states = {}
         self.published_rates = {}
+        # Signals sent by the components using this kiosk
+        self.signal_bus = SignalBus()
+        # Storage of the states/rates objects registering with this kiosk,
+        # None uses the default, see get_states_rates_backend()
+        self.states_rates_backend = None
+        # Version of the structure of the SimulationObjects using this kiosk,
+        # see SimulationObject._get_plan()
+        self.structure_version = next(_structure_versions)
 
     def __setitem__(self, item, value):
         msg = "See set_variable() for setting a variable."
@@ -246,3 +265,248 @@ class VariableKiosk(dict):
         """
         for key in self.published_states.keys():
             self.pop(key, None)
+
+    def structure_changed(self):
+        """Invalidate the execution plans of the SimulationObjects and the
+        Engine using this kiosk.
+        """
+        self.structure_version = next(_structure_versions)
+
+    def _get_state(self):
+        """Return a copy of the published values and the variable registrations
+        of the kiosk. Used for taking engine snapshots.
+        """
+        return (dict(self), dict(self.registered_states), dict(self.registered_rates),
+                dict(self.published_states), dict(self.published_rates))
+
+    def _set_state(self, state):
+        """Restore the published values and variable registrations from a state
+        returned by `_get_state()`.
+        """
+        values, reg_states, reg_rates, pub_states, pub_rates = state
+        dict.clear(self)
+        dict.update(self, values)
+        for current, saved in ((self.registered_states, reg_states),
+                               (self.registered_rates, reg_rates),
+                               (self.published_states, pub_states),
+                               (self.published_rates, pub_rates)):
+            current.clear()
+            current.update(saved)
+
+
+class IndexedVariableKiosk(VariableKiosk):
+    """VariableKiosk that stores published values in slots.
+
+    Each published variable is assigned an integer slot at registration
+    time. Values of published states and rates are kept in two lists with a
+    bytearray marking which slots hold a valid value, so that
+    `flush_states()` and `flush_rates()` reset a mask instead of removing
+    every variable separately. Lookups go through a table mapping the
+    variable name to its slot.
+
+    The interface is the same as that of the `VariableKiosk`: values can be
+    retrieved with bracket or attribute notation and membership tests
+    check if a published variable currently has a value.
+    """
+
+    def __init__(self):
+        """Initialize the class `IndexedVariableKiosk`
+        """
+        self._state_values = []
+        self._state_mask = bytearray()
+        self._rate_values = []
+        self._rate_mask = bytearray()
+        self._free_slots = {"S": [], "R": []}
+        self._slots = {}
+        VariableKiosk.__init__(self)
+
+    def _assign_slot(self, varname, type):
+        """Assign a slot to published variable varname of type "S" or "R".
+        """
+        if type == "S":
+            values, mask = self._state_values, self._state_mask
+        else:
+            values, mask = self._rate_values, self._rate_mask
+        free = self._free_slots[type]
+        if free:
+            index = free.pop()
+        else:
+            index = len(values)
+            values.append(None)
+            mask.append(0)
+        self._slots[varname] = (values, mask, index)
+
+    def _release_slot(self, varname):
+        """Release the slot of published variable varname.
+        """
+        values, mask, index = self._slots.pop(varname)
+        values[index] = None
+        mask[index] = 0
+        type = "S" if values is self._state_values else "R"
+        self._free_slots[type].append(index)
+
+    def __getitem__(self, item):
+        try:
+            values, mask, index = self._slots[item]
+        except KeyError:
+            raise KeyError(item)
+        if mask[index]:
+            return values[index]
+        raise KeyError(item)
+
+    def __getattr__(self, item):
+        """Allow use of attribute notation (eg "kiosk.LAI") on published rates or states.
+        """
+        return self.__getitem__(item)
+
+    def __contains__(self, item):
+        """Checks if a published variable currently has a value.
+        """
+        try:
+            values, mask, index = self._slots[item]
+        except KeyError:
+            return False
+        return bool(mask[index])
+
+    def __iter__(self):
+        for varname, (values, mask, index) in list(self._slots.items()):
+            if mask[index]:
+                yield varname
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __bool__(self):
+        return any(self._state_mask) or any(self._rate_mask)
+
+    def keys(self):
+        return list(self)
+
+    def values(self):
+        return [self[varname] for varname in self]
+
+    def items(self):
+        return [(varname, self[varname]) for varname in self]
+
+    def get(self, item, default=None):
+        try:
+            return self.__getitem__(item)
+        except KeyError:
+            return default
+
+    def pop(self, item, *default):
+        try:
+            value = self.__getitem__(item)
+        except KeyError:
+            if default:
+                return default[0]
+            raise
+        values, mask, index = self._slots[item]
+        values[index] = None
+        mask[index] = 0
+        return value
+
+    def clear(self):
+        self._state_values[:] = [None] * len(self._state_values)
+        self._state_mask[:] = bytes(len(self._state_mask))
+        self._rate_values[:] = [None] * len(self._rate_values)
+        self._rate_mask[:] = bytes(len(self._rate_mask))
+
+    def _publish(self, varname, value):
+        values, mask, index = self._slots[varname]
+        values[index] = value
+        mask[index] = 1
+
+    def register_variable(self, oid, varname, type, publish=False):
+        """Register a varname from object with id, with given type
+
+        See `VariableKiosk.register_variable()`. Published variables are
+        assigned a slot.
+        """
+        VariableKiosk.register_variable(self, oid, varname, type, publish)
+        if publish is True:
+            self._assign_slot(varname, type.upper())
+
+    def deregister_variable(self, oid, varname):
+        """Object with id(object) asks to deregister varname from kiosk
+
+        See `VariableKiosk.deregister_variable()`.
+        """
+        VariableKiosk.deregister_variable(self, oid, varname)
+        if varname in self._slots:
+            self._release_slot(varname)
+
+    def set_variable(self, id, varname, value):
+        """Let object with id, set the value of variable varname
+
+        See `VariableKiosk.set_variable()`.
+        """
+        if varname in self.published_rates:
+            owner = self.published_rates[varname]
+        elif varname in self.published_states:
+            owner = self.published_states[varname]
+        else:
+            msg = "Variable '%s' not published in VariableKiosk."
+            raise exc.VariableKioskError(msg % varname)
+        if owner != id:
+            msg = "Unregistered object tried to set the value " + \
+                  "of variable '%s': access denied."
+            raise exc.VariableKioskError(msg % varname)
+        self._publish(varname, value)
+
+    def flush_rates(self):
+        """flush the values of all published rate variable from the kiosk.
+        """
+        self._rate_mask[:] = bytes(len(self._rate_mask))
+
+    def flush_states(self):
+        """flush the values of all state variable from the kiosk.
+        """
+        self._state_mask[:] = bytes(len(self._state_mask))
+
+    def _get_state(self):
+        """Return a copy of the published values and the variable registrations
+        of the kiosk. Used for taking engine snapshots.
+        """
+        return (dict(self.items()), dict(self.registered_states), dict(self.registered_rates),
+                dict(self.published_states), dict(self.published_rates))
+
+    def _set_state(self, state):
+        """Restore the published values and variable registrations from a state
+        returned by `_get_state()`.
+        """
+        values, reg_states, reg_rates, pub_states, pub_rates = state
+        for varname in list(self._slots):
+            self._release_slot(varname)
+        VariableKiosk._set_state(self, ({}, reg_states, reg_rates, pub_states, pub_rates))
+        for varname in pub_states:
+            if varname not in self._slots:
+                self._assign_slot(varname, "S")
+        for varname in pub_rates:
+            if varname not in self._slots:
+                self._assign_slot(varname, "R")
+        for varname, value in values.items():
+            self._publish(varname, value)
+
+
+# Available kiosk implementations by mode name
+_KIOSK_MODES = {"dict": VariableKiosk, "indexed": IndexedVariableKiosk}
+
+
+def create_kiosk(mode="dict", states_rates_backend=None):
+    """Returns a new variable kiosk of the given mode.
+
+    :param mode: "dict" for the `VariableKiosk` or "indexed" for the
+        `IndexedVariableKiosk`.
+    :param states_rates_backend: storage of the states/rates objects
+        registering with the kiosk, see `set_states_rates_backend()`. None
+        uses the default backend.
+    """
+    try:
+        kiosk_class = _KIOSK_MODES[mode]
+    except KeyError:
+        msg = "Unknown kiosk mode '%s', should be one of %s" % (mode, list(_KIOSK_MODES))
+        raise exc.PCSEError(msg)
+    kiosk = kiosk_class()
+    kiosk.states_rates_backend = states_rates_backend
+    return kiosk
@@ -11,4 +11,5 @@ from . import respiration
 from . import root_dynamics
 from . import stem_dynamics
 from . import storage_organ_dynamics
-from . import leaf_dynamics
\ No newline at end of file
+from . import leaf_dynamics
+from .batch_wofost8 import BatchWofost80
@@ -8,8 +8,10 @@ from math import sqrt, exp, cos, pi
 from collections import deque
 from datetime import date
 
-from ..utils.traitlets import Instance, Float 
-from ..util import astro, AfgenTrait
+import numpy as np
+
+from ..utils.traitlets import Instance, Float, Int
+from ..util import drv_astro, AfgenTrait
 from ..base import ParamTemplate, SimulationObject, VariableKiosk
 from ..nasapower import WeatherDataProvider
 
@@ -132,6 +134,79 @@ def assim(AMAX, EFF, LAI, KDIF, SINB, PARDIR, PARDIF):
     FGROS  = FGROS*LAI
     return FGROS
 
+def totass_array(DAYL, AMAX, EFF, LAI, KDIF, AVRAD, DIFPP, DSINBE, SINLD, COSLD):
+    """Array version of `totass()`, all arguments are arrays of the same
+    shape (or scalars) and the daily total gross assimilation is returned
+    for each element.
+    """
+    # Gauss points and weights
+    XGAUSS = [0.1127017, 0.5000000, 0.8872983]
+    WGAUSS = [0.2777778, 0.4444444, 0.2777778]
+
+    # calculation of assimilation is done only when it will not be zero
+    # (AMAX >0, LAI >0, DAYL >0)
+    active = (AMAX > 0.) & (LAI > 0.) & (DAYL > 0.)
+    DTGA = np.zeros(np.shape(active))
+    with np.errstate(divide="ignore", invalid="ignore", over="ignore"):
+        for i in range(3):
+            HOUR   = 12.0+0.5*DAYL*XGAUSS[i]
+            SINB   = np.maximum(0.,SINLD+COSLD*np.cos(2.*pi*(HOUR+12.)/24.))
+            PAR    = 0.5*AVRAD*SINB*(1.+0.4*SINB)/DSINBE
+            PARDIF = np.minimum(PAR,SINB*DIFPP)
+            PARDIR = PAR-PARDIF
+            FGROS = assim_array(AMAX,EFF,LAI,KDIF,SINB,PARDIR,PARDIF)
+            DTGA += np.where(active, FGROS*WGAUSS[i], 0.)
+    DTGA *= DAYL
+
+    return DTGA
+
+def assim_array(AMAX, EFF, LAI, KDIF, SINB, PARDIR, PARDIF):
+    """Array version of `assim()`.
+    """
+    # Gauss points and weights
+    XGAUSS = [0.1127017, 0.5000000, 0.8872983]
+    WGAUSS = [0.2777778, 0.4444444, 0.2777778]
+
+    SCV = 0.2
+
+    # 13.2 extinction coefficients KDIF, KDIRBL, KDIRT
+    REFH = (1.-sqrt(1.-SCV))/(1.+sqrt(1.-SCV))
+    REFS = REFH*2./(1.+1.6*SINB)
+    KDIRBL = (0.5/SINB)*KDIF/(0.8*sqrt(1.-SCV))
+    KDIRT = KDIRBL*sqrt(1.-SCV)
+
+    #13.3 three-point Gaussian integration over LAI
+    FGROS = 0.
+    for i in range(3):
+        LAIC = LAI*XGAUSS[i]
+        # absorbed diffuse radiation (VISDF),light from direct
+        # origine (VIST) and direct light (VISD)
+        VISDF  = (1.-REFS)*PARDIF*KDIF  *np.exp(-KDIF  *LAIC)
+        VIST   = (1.-REFS)*PARDIR*KDIRT *np.exp(-KDIRT *LAIC)
+        VISD   = (1.-SCV) *PARDIR*KDIRBL*np.exp(-KDIRBL*LAIC)
+
+        # absorbed flux in W/m2 for shaded leaves and assimilation
+        VISSHD = VISDF+VIST-VISD
+        FGRSH  = AMAX*(1.-np.exp(-VISSHD*EFF/np.maximum(2.0, AMAX)))
+
+        # direct light absorbed by leaves perpendicular on direct
+        # beam and assimilation of sunlit leaf area
+        VISPP  = (1.-SCV)*PARDIR/SINB
+        FGRSUN = np.where(VISPP <= 0., FGRSH,
+                          AMAX*(1.-(AMAX-FGRSH) \
+                          *(1.-np.exp(-VISPP*EFF/np.maximum(2.0,AMAX)))/ (EFF*VISPP)))
+
+        # fraction of sunlit leaf area (FSLLA) and local
+        # assimilation rate (FGL)
+        FSLLA  = np.exp(-KDIRBL*LAIC)
+        FGL    = FSLLA*FGRSUN+(1.-FSLLA)*FGRSH
+
+        # integration
+        FGROS += FGL*WGAUSS[i]
+
+    FGROS  = FGROS*LAI
+    return FGROS
+
 class WOFOST_Assimilation(SimulationObject):
     """Class implementing a WOFOST/SUCROS style assimilation routine including
     effect of changes in atmospheric CO2 concentration.
@@ -189,6 +264,7 @@ class WOFOST_Assimilation(SimulationObject):
     """
 
     _TMNSAV = Instance(deque)
+    _NTMIN = Int(0)
 
     class Parameters(ParamTemplate):
         AMAXTB = AfgenTrait()
@@ -211,6 +287,7 @@ class WOFOST_Assimilation(SimulationObject):
         self.params = self.Parameters(cropdata)
         self.kiosk = kiosk
         self._TMNSAV = deque(maxlen=7)
+        self._NTMIN = 0
 
     def __call__(self, day:date, drv:WeatherDataProvider):
         """Computes the assimilation of CO2 into the crop
@@ -222,12 +299,17 @@ class WOFOST_Assimilation(SimulationObject):
         DVS = k.DVS
         LAI = k.LAI
 
-        # 7-day running average of TMIN
-        self._TMNSAV.appendleft(drv.TMIN)
-        TMINRA = sum(self._TMNSAV)/len(self._TMNSAV)
+        # 7-day running average of TMIN, precomputed on the driver table
+        # of a columnar weather store for windows of 1 to 7 days
+        self._NTMIN = min(self._NTMIN + 1, 7)
+        if hasattr(drv, "TMINRA"):
+            TMINRA = drv.TMINRA[self._NTMIN - 1]
+        else:
+            self._TMNSAV.appendleft(drv.TMIN)
+            TMINRA = sum(self._TMNSAV)/len(self._TMNSAV)
 
         # 2.19  photoperiodic daylength
-        DAYL, DAYLP, SINLD, COSLD, DIFPP, ATMTR, DSINBE, ANGOT = astro(day, drv.LAT, drv.IRRAD)
+        DAYL, DAYLP, SINLD, COSLD, DIFPP, ATMTR, DSINBE, ANGOT = drv_astro(day, drv)
 
         # daily dry matter production
 
@@ -251,4 +333,5 @@ class WOFOST_Assimilation(SimulationObject):
     def reset(self):
         """Reset states and rates
         """
-        self._TMNSAV = deque(maxlen=7)
\ No newline at end of file
+        self._TMNSAV = deque(maxlen=7)
+        self._NTMIN = 0
\ No newline at end of file
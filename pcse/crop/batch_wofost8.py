@@ -0,0 +1,1031 @@
+"""Batched WOFOST 8.0 crop model simulating the crops of many fields at once
+
+`BatchWofost80` holds the states and rates of the crops of N fields in
+NumPy arrays of shape (N,) and computes the daily rates and state updates of
+all fields with array operations. It implements the same processes as
+`Wofost80` with annual phenology, partitioning, assimilation, maintenance
+respiration, evapotranspiration, root, stem, storage organ and leaf dynamics
+and the N/P/K crop dynamics. The expressions follow the scalar modules term
+by term so that a field in a batch gives the same results as a Wofost80 for
+the same inputs.
+
+Each method takes the indices of the fields it applies to, fields without a
+crop or with a crop before emergence are simply left out, so that events
+such as crop start, finish and harvest can happen on different days for
+different fields.
+
+Written by: Will Solow, 2024
+"""
+from datetime import date
+
+import numpy as np
+
+from ..base import BatchParameters, BatchVariables
+from ..base.batch import values_changed
+from ..util import limit_array, ordinals_to_datetime64
+from .. import exceptions as exc
+from .wofost8 import Wofost80
+from .phenology import Annual_Phenology, Vernalisation
+from .partitioning import Annual_Partitioning_NPK as Annual_Partitioning
+from .assimilation import WOFOST_Assimilation as Assimilation, totass_array
+from .respiration import WOFOST_Maintenance_Respiration as MaintenanceRespiration
+from .evapotranspiration import EvapotranspirationCO2 as Evapotranspiration, SWEAF_array
+from .root_dynamics import Annual_WOFOST_Root_Dynamics as Annual_Root_Dynamics
+from .stem_dynamics import Annual_WOFOST_Stem_Dynamics as Annual_Stem_Dynamics
+from .storage_organ_dynamics import Annual_WOFOST_Storage_Organ_Dynamics as \
+    Annual_Storage_Organ_Dynamics
+from .leaf_dynamics import Annual_WOFOST_Leaf_Dynamics_NPK as Annual_Leaf_Dynamics
+from .npk_dynamics import NPK_Crop_Dynamics as NPK_crop
+from .nutrients.npk_translocation import NPK_Translocation
+from .nutrients.npk_demand_uptake import NPK_Demand_Uptake
+from .nutrients.npk_stress import NPK_Stress
+
+# Phenological stages, STAGE holds the index in this tuple
+STAGES = ("sowing", "emerging", "vegetative", "reproductive", "mature", "dead")
+SOWING, EMERGING, VEGETATIVE, REPRODUCTIVE, MATURE, DEAD = range(len(STAGES))
+# Stage after crop start for each crop start type
+START_STAGES = {"dormant": SOWING, "sowing": EMERGING, "emergence": VEGETATIVE}
+
+_NPK = ("N", "P", "K")
+_ORGANS = ("LV", "ST", "RT")
+
+
+def _names(fmt, organs=_ORGANS + ("SO",)):
+    """Returns the variable names fmt % (nutrient, organ) for N, P and K and
+    the given organs.
+    """
+    return tuple(fmt % (x, o) for x in _NPK for o in organs)
+
+
+class BatchWofost80(object):
+    """Array version of `Wofost80` for the crops of a batch of fields.
+
+    :param n: number of fields
+
+    Crops are started with `start()` for a subset of the fields, after which
+    `calc_rates()` and `integrate()` advance the crops of the fields that are
+    given. The values of a variable for all fields are returned by
+    `get_variable()`, the values of fields without a crop are meaningless
+    and should be masked by the caller.
+
+    The leaf classes of the fields are kept in arrays of shape (N, C) in
+    order of creation. The living classes of a field are those between the
+    pointers `lv_lo` (oldest) and `lv_hi` (youngest + 1), leaf death moves
+    `lv_lo` and new leaves are added at `lv_hi`. The capacity C doubles when
+    needed. Sums over the leaf classes are taken from the youngest to the
+    oldest class as in the scalar model.
+    """
+
+    # Parameter templates of the crop components
+    templates = (Wofost80.Parameters, Annual_Phenology.Parameters,
+                 Annual_Partitioning.Parameters, Assimilation.Parameters,
+                 MaintenanceRespiration.Parameters, Evapotranspiration.Parameters,
+                 Annual_Root_Dynamics.Parameters, Annual_Stem_Dynamics.Parameters,
+                 Annual_Storage_Organ_Dynamics.Parameters, Annual_Leaf_Dynamics.Parameters,
+                 NPK_crop.Parameters, NPK_Translocation.Parameters,
+                 NPK_Demand_Uptake.Parameters, NPK_Stress.Parameters)
+
+    state_names = ("TAGP", "GASST", "MREST", "CTRAT", "CEVST", "HI", "FIN",
+                   "DVS", "TSUM", "TSUME", "DATBE", "VERN", "ISVERNALISED",
+                   "FR", "FL", "FS", "FO", "IDOST", "IDWST",
+                   "RD", "RDM", "WRT", "DWRT", "TWRT",
+                   "WST", "DWST", "TWST", "SAI",
+                   "WSO", "DWSO", "TWSO", "HWSO", "PAI", "LHW",
+                   "LAIEM", "LASUM", "LAIEXP", "LAIMAX", "LAI", "WLV", "DWLV", "TWLV") + \
+        _names("%samount%s") + \
+        ("NuptakeTotal", "PuptakeTotal", "KuptakeTotal", "NfixTotal",
+         "NlossesTotal", "PlossesTotal", "KlossesTotal") + \
+        _names("%stranslocatable%s", _ORGANS) + \
+        ("Ntranslocatable", "Ptranslocatable", "Ktranslocatable")
+
+    rate_names = ("GASS", "PGASS", "MRES", "ASRC", "DMI", "ADMI",
+                  "DTSUME", "DTSUM", "DVR", "RDEM", "VERNR", "VERNFAC", "PMRES",
+                  "EVWMX", "EVSMX", "TRAMX", "TRA", "IDOS", "IDWS", "RFWS", "RFOS", "RFTRA",
+                  "NNI", "PNI", "KNI", "NPKI", "RFNPK",
+                  "RR", "GRRT", "DRRT1", "DRRT2", "DRRT3", "DRRT", "GWRT",
+                  "GRST", "DRST", "GWST", "GRSO", "DRSO", "GWSO", "DHSO",
+                  "GRLV", "DSLV1", "DSLV2", "DSLV3", "DSLV4", "DSLV", "DALV", "DRLV",
+                  "SLAT", "FYSAGE", "GLAIEX", "GLASOL") + \
+        tuple("R" + name for name in _names("%samount%s")) + \
+        tuple("R" + name for name in _names("%sdeath%s", _ORGANS)) + \
+        ("RNloss", "RPloss", "RKloss") + \
+        tuple("R" + name for name in _names("%suptake%s")) + \
+        ("RNuptake", "RPuptake", "RKuptake", "RNfixation") + \
+        _names("%sdemand%s") + ("Ndemand", "Pdemand", "Kdemand") + \
+        tuple("R" + name for name in _names("%stranslocation%s", _ORGANS))
+
+    # Variables only defined for crops with vernalisation (IDSL >= 2)
+    vernalisation_names = ("VERN", "ISVERNALISED", "VERNR", "VERNFAC")
+
+    # States that are not assigned at every state integration, rates that are
+    # assigned before emergence and rates that are only assigned under some
+    # conditions, see published()
+    held_states = ("FIN", "HI", "IDOST", "IDWST", "RDM", "LHW", "LAIEM",
+                   "STAGE", "DOP", "DOF", "FINISH_TYPE")
+    pre_emergence_rates = ("DTSUME", "DTSUM", "DVR", "RDEM")
+    conditional_rates = ("GLAIEX", "GLASOL", "IDOS", "IDWS")
+
+    # Initial capacity for the leaf classes
+    LEAF_CLASSES = 64
+
+    def __init__(self, n:int):
+        self.n = n
+        self.params = BatchParameters(n)
+        self.states = BatchVariables(n, self.state_names)
+        self.rates = BatchVariables(n, self.rate_names)
+        # Initial N/P/K amounts for the nutrient balance
+        self.initial = BatchVariables(n, [name + "I" for name in _names("%samount%s")])
+
+        self.STAGE = np.zeros(n, dtype=np.intp)
+        self.DOP = np.full(n, np.nan)
+        self.DOF = np.full(n, np.nan)
+        self.FINISH_TYPE = np.full(n, None, dtype=object)
+        # Values applied at finalize, see Wofost80._on_CROP_FINISH
+        self._DOF = np.full(n, np.nan)
+        self._FINISH_TYPE = np.full(n, None, dtype=object)
+
+        self._force_vernalisation = np.zeros(n, dtype=bool)
+        self._NTMIN = np.zeros(n, dtype=np.intp)
+        self._IDWST = np.zeros(n)
+        self._IDOST = np.zeros(n)
+        self._THRESHOLD_N_FLAG = np.zeros(n, dtype=bool)
+        self._THRESHOLD_N = np.zeros(n)
+
+        # Leaf classes
+        self.LV = np.zeros((n, self.LEAF_CLASSES))
+        self.SLA = np.zeros((n, self.LEAF_CLASSES))
+        self.LVAGE = np.zeros((n, self.LEAF_CLASSES))
+        self.lv_lo = np.zeros(n, dtype=np.intp)
+        self.lv_hi = np.zeros(n, dtype=np.intp)
+
+        # Held states at the last flush of the VariableKiosk
+        self._flushed = {name: self._held(name).copy() for name in self.held_states}
+
+    def start(self, idx, day, parvalues:list):
+        """Start the crops of the fields idx.
+
+        :param idx: array with the indices of the fields
+        :param day: array with the current day ordinal of every field
+        :param parvalues: list with the ParameterProvider of each field, with
+            the crop and site set
+        """
+        p = self.params
+        s = self.states
+        for template in self.templates:
+            p.set(template, idx, parvalues)
+        vernalised = p.IDSL[idx] >= 2
+        if vernalised.any():
+            p.set(Vernalisation.Parameters, idx[vernalised],
+                  [pv for pv, v in zip(parvalues, vernalised) if v])
+
+        self.rates.zerofy(idx)
+        s.zerofy(idx)
+
+        # Phenology
+        start_type = p.CROP_START_TYPE[idx]
+        for crop_start_type in start_type:
+            if crop_start_type not in START_STAGES:
+                msg = "Unknown start type: %s. Are you using the corect Phenology \
+                module (Calling the correct Gym Environment)?" % crop_start_type
+                raise exc.PCSEError(msg)
+        self.STAGE[idx] = [START_STAGES[t] for t in start_type]
+        s.DVS[idx] = np.where(start_type == "emergence", p.DVSI[idx], -0.1)
+        self.DOP[idx] = day[idx]
+        self._force_vernalisation[idx] = False
+
+        DVS = s.DVS[idx]
+
+        # Partitioning
+        FR = s.FR[idx] = p.FRTB(DVS, idx)
+        FL = s.FL[idx] = p.FLTB(DVS, idx)
+        FS = s.FS[idx] = p.FSTB(DVS, idx)
+        FO = s.FO[idx] = p.FOTB(DVS, idx)
+
+        # Assimilation and evapotranspiration
+        self._NTMIN[idx] = 0
+        s.IDOST[idx] = -999
+        s.IDWST[idx] = -999
+        self._IDWST[idx] = 0
+        self._IDOST[idx] = 0
+
+        # Roots
+        TDWI = p.TDWI[idx]
+        s.RDM[idx] = np.maximum(p.RDI[idx], np.minimum(p.RDMCR[idx], p.RDMSOL[idx]))
+        s.RD[idx] = p.RDI[idx]
+        WRT = s.WRT[idx] = TDWI * FR
+        s.TWRT[idx] = WRT + s.DWRT[idx]
+
+        # Stems
+        WST = s.WST[idx] = (TDWI * (1-FR)) * FS
+        s.TWST[idx] = WST + s.DWST[idx]
+        SAI = s.SAI[idx] = WST * p.SSATB(DVS, idx)
+
+        # Storage organs
+        WSO = s.WSO[idx] = (TDWI * (1-FR)) * FO
+        TWSO = s.TWSO[idx] = WSO + s.DWSO[idx]
+        PAI = s.PAI[idx] = WSO * p.SPA(DVS, idx)
+
+        # Leaves, a single leaf class
+        WLV = s.WLV[idx] = (TDWI * (1-FR)) * FL
+        TWLV = s.TWLV[idx] = WLV + s.DWLV[idx]
+        SLA = p.SLATB(DVS, idx)
+        for a in (self.LV, self.SLA, self.LVAGE):
+            a[idx] = 0.
+        self.LV[idx, 0] = WLV
+        self.SLA[idx, 0] = SLA
+        self.lv_lo[idx] = 0
+        self.lv_hi[idx] = 1
+        LAIEM = WLV * SLA
+        s.LAIEM[idx] = s.LASUM[idx] = s.LAIEXP[idx] = s.LAIMAX[idx] = LAIEM
+        s.LAI[idx] = LAIEM + SAI + PAI
+
+        # N/P/K amounts in the crop
+        for x in _NPK:
+            XMAXLV = getattr(p, x + "MAXLV_TB")(DVS, idx)
+            amounts = {"LV": WLV * XMAXLV,
+                       "ST": WST * XMAXLV * getattr(p, x + "MAXST_FR")[idx],
+                       "RT": WRT * XMAXLV * getattr(p, x + "MAXRT_FR")[idx],
+                       "SO": 0.}
+            for organ, amount in amounts.items():
+                getattr(s, "%samount%s" % (x, organ))[idx] = amount
+                getattr(self.initial, "%samount%sI" % (x, organ))[idx] = amount
+
+        # Crop
+        TAGP = s.TAGP[idx] = TWLV + s.TWST[idx] + TWSO
+        self.DOF[idx] = np.nan
+        self.FINISH_TYPE[idx] = None
+        self._DOF[idx] = np.nan
+        self._FINISH_TYPE[idx] = None
+
+        checksum = TDWI - TAGP - s.TWRT[idx]
+        if (np.abs(checksum) > 0.0001).any():
+            msg = "Error in partitioning of initial biomass (TDWI)!"
+            raise exc.PartitioningError(msg)
+
+    def calc_rates(self, idx, day, drv, soil):
+        """Calculate the rates of the crops of the fields idx.
+
+        :param day: array with the current day ordinal of every field
+        :param drv: a WeatherBatchView with the weather of all fields
+        :param soil: the BatchSoil of the fields
+        """
+        self._phenology_rates(idx, drv)
+
+        # Before emergence only the phenology is running
+        a = idx[self.STAGE[idx] != EMERGING]
+        if len(a) == 0:
+            return
+        p = self.params
+        r = self.rates
+
+        PGASS = r.PGASS[a] = self._assimilation(a, drv)
+        self._evapotranspiration(a, drv, soil)
+        self._npk_stress(a)
+
+        # Select minimum of nutrient and water/oxygen stress
+        reduction = np.minimum(r.RFNPK[a], r.RFTRA[a])
+        GASS = r.GASS[a] = PGASS * reduction
+
+        PMRES = self._respiration(a, drv)
+        MRES = r.MRES[a] = np.minimum(GASS, PMRES)
+        ASRC = r.ASRC[a] = GASS - MRES
+
+        self._partitioning_rates(a, soil)
+        s = self.states
+        FR, FL, FS, FO = s.FR[a], s.FL[a], s.FS[a], s.FO[a]
+        CVF = 1./((FL/p.CVL[a] + FS/p.CVS[a] + FO/p.CVO[a]) *
+                  (1.-FR) + FR/p.CVR[a])
+        r.DMI[a] = CVF * ASRC
+
+        self._root_rates(a, soil)
+        r.ADMI[a] = (1. - FR) * r.DMI[a]
+        self._stem_rates(a)
+        self._storage_organ_rates(a, drv)
+        self._leaf_rates(a, drv)
+        self._npk_rates(a, day, soil)
+
+    def integrate(self, idx, soil):
+        """Integrate the states of the crops of the fields idx.
+
+        Returns a tuple with the indices of the fields whose crop reached
+        its CROP_END_TYPE and the finish types.
+        """
+        stage = self.STAGE[idx].copy()
+        finished = self._phenology_integrate(idx)
+
+        a = idx[stage != EMERGING]
+        if len(a) > 0:
+            s = self.states
+            r = self.rates
+            self._partitioning_integrate(a)
+            self._root_integrate(a)
+            self._storage_organ_integrate(a)
+            self._stem_integrate(a)
+            self._leaf_integrate(a)
+            self._npk_integrate(a)
+
+            s.TAGP[a] = s.TWLV[a] + s.TWST[a] + s.TWSO[a]
+            s.GASST[a] += r.GASS[a]
+            s.MREST[a] += r.MRES[a]
+            s.CTRAT[a] += r.TRA[a]
+            s.CEVST[a] += soil.rates.EVS[a]
+        return finished
+
+    def zerofy(self, idx):
+        """Set the rates of the fields idx to zero.
+        """
+        self.rates.zerofy(idx)
+
+    def finish(self, idx, day, finish_type=None):
+        """Register the finish of the crops of the fields idx, see
+        `Wofost80._on_CROP_FINISH()`.
+
+        :param day: array with the current day ordinal of every field
+        :param finish_type: the finish type or a list with the finish type
+            of each field
+        """
+        self.states.FIN[idx] = 1.
+        self._DOF[idx] = day[idx]
+        self._FINISH_TYPE[idx] = finish_type
+
+    def finalize(self, idx):
+        """Finalize the crops of the fields idx.
+        """
+        s = self.states
+        TAGP = s.TAGP[idx]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            s.HI[idx] = np.where(TAGP > 0, s.TWSO[idx]/TAGP, -1.)
+        s.IDWST[idx] = self._IDWST[idx]
+        s.IDOST[idx] = self._IDOST[idx]
+        self.DOF[idx] = self._DOF[idx]
+        self.FINISH_TYPE[idx] = self._FINISH_TYPE[idx]
+
+    def harvest(self, idx, efficiency):
+        """Harvest the storage organs of the crops of the fields idx.
+
+        Returns the indices of the fields whose crop finishes by the harvest,
+        i.e. those with CROP_END_TYPE "harvest".
+        """
+        s = self.states
+        HWSO = s.HWSO[idx]
+        s.LHW[idx] = (efficiency) * HWSO
+        s.HWSO[idx] = (1-efficiency) * HWSO
+        return idx[self.params.CROP_END_TYPE[idx] == "harvest"]
+
+    def get_variable(self, varname:str):
+        """Returns an array with the value of varname for all fields, or None
+        if the crop has no variable varname.
+        """
+        if varname in self.vernalisation_names:
+            values = getattr(self.states, varname, None)
+            if values is None:
+                values = getattr(self.rates, varname)
+            IDSL = getattr(self.params, "IDSL", np.full(self.n, np.nan))
+            return np.where(IDSL >= 2, values, np.nan)
+        if varname in self.states:
+            return getattr(self.states, varname)
+        if varname in self.rates:
+            return getattr(self.rates, varname)
+        if varname == "STAGE":
+            return np.array(STAGES, dtype=object)[self.STAGE]
+        if varname in ("DOP", "DOF"):
+            return ordinals_to_datetime64(getattr(self, varname))
+        if varname == "FINISH_TYPE":
+            return self.FINISH_TYPE.copy()
+        return None
+
+    def _held(self, varname:str):
+        """Returns the array holding held state varname for all fields.
+        """
+        if varname in self.states:
+            return getattr(self.states, varname)
+        return getattr(self, varname)
+
+    def flush(self, idx):
+        """Keep the values of the held states of the fields idx at a flush of
+        the VariableKiosk before the state integration.
+        """
+        for name in self.held_states:
+            self._flushed[name][idx] = self._held(name)[idx]
+
+    def published(self, varname:str):
+        """Returns a boolean array that is True for the fields where varname
+        was assigned since the last flush of the VariableKiosk.
+
+        `Engine` finds the variables of a removed crop in the VariableKiosk
+        until the next flush. States are assigned at every integration except
+        the held states, which are published when they change. Rates are
+        assigned at every rate calculation after emergence.
+        """
+        if varname in self.held_states:
+            return values_changed(self._held(varname), self._flushed[varname])
+        if varname in self.states:
+            return np.ones(self.n, dtype=bool)
+        if varname in self.conditional_rates:
+            return getattr(self.rates, varname) != 0.
+        if varname in self.pre_emergence_rates:
+            return np.ones(self.n, dtype=bool)
+        if varname in ("VERNR", "VERNFAC"):
+            return self.STAGE == VEGETATIVE
+        return self.STAGE > EMERGING
+
+    def _phenology_rates(self, idx, drv):
+        """Phenological development rates, see `Base_Phenology.calc_rates()`.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+        stage = self.STAGE[idx]
+        TEMP = drv.TEMP[idx]
+
+        # Day length sensitivity
+        IDSL = p.IDSL[idx]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            DVRED = np.where(IDSL >= 1,
+                             limit_array(0., 1., (drv.DAYLP[idx] - p.DLC[idx])/(p.DLO[idx] - p.DLC[idx])),
+                             1.)
+
+        # Vernalisation
+        VERNFAC = np.ones(len(idx))
+        vern = (IDSL >= 2) & (stage == VEGETATIVE)
+        if vern.any():
+            v = idx[vern]
+            active = (s.ISVERNALISED[v] == 0.) & (s.DVS[v] < p.VERNDVS[v])
+            # Critical DVS reached without vernalisation, forced from now on
+            forced = (s.ISVERNALISED[v] == 0.) & ~active
+            self._force_vernalisation[v[forced]] = True
+            r.VERNR[v] = np.where(active, p.VERNRTB(TEMP[vern], v), 0.)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                r.VERNFAC[v] = np.where(active, limit_array(0., 1., (s.VERN[v] - p.VERNBASE[v])/
+                                                            (p.VERNSAT[v] - p.VERNBASE[v])), 1.)
+            VERNFAC[vern] = r.VERNFAC[v]
+
+        DTSUME = np.zeros(len(idx))
+        DTSUM = np.zeros(len(idx))
+        DVR = np.zeros(len(idx))
+        RDEM = np.zeros(len(idx))
+        DTSMTB = p.DTSMTB(TEMP, idx)
+
+        sowing = stage == SOWING
+        RDEM[sowing] = np.where(TEMP[sowing] > p.TBASEM[idx[sowing]], 1., 0.)
+
+        m = stage == EMERGING
+        i = idx[m]
+        DTSUME[m] = limit_array(0., (p.TEFFMX[i] - p.TBASEM[i]), (TEMP[m] - p.TBASEM[i]))
+        DVR[m] = 0.1 * DTSUME[m]/p.TSUMEM[i]
+
+        m = stage == VEGETATIVE
+        DTSUM[m] = DTSMTB[m] * VERNFAC[m] * DVRED[m]
+        DVR[m] = DTSUM[m]/p.TSUM1[idx[m]]
+
+        for stage_, TSUM in ((REPRODUCTIVE, p.TSUM2), (MATURE, p.TSUM3)):
+            m = stage == stage_
+            DTSUM[m] = DTSMTB[m]
+            DVR[m] = DTSUM[m]/TSUM[idx[m]]
+
+        r.DTSUME[idx] = DTSUME
+        r.DTSUM[idx] = DTSUM
+        r.DVR[idx] = DVR
+        r.RDEM[idx] = RDEM
+
+    def _phenology_integrate(self, idx):
+        """Phenological development and stage changes, see
+        `Base_Phenology.integrate()`. Returns the fields that finished and
+        the finish types.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+        stage = self.STAGE[idx]
+
+        # Vernalisation
+        vern = idx[(p.IDSL[idx] >= 2) & (stage == VEGETATIVE)]
+        s.VERN[vern] += r.VERNR[vern]
+        s.ISVERNALISED[vern] = (s.VERN[vern] >= p.VERNSAT[vern]) | self._force_vernalisation[vern]
+
+        s.TSUME[idx] += r.DTSUME[idx]
+        s.DVS[idx] += r.DVR[idx]
+        s.TSUM[idx] += r.DTSUM[idx]
+        s.DATBE[idx] += r.RDEM[idx]
+
+        DVS = s.DVS[idx]
+        next_stage = {SOWING: s.DATBE[idx] >= p.DTBEM[idx],
+                      EMERGING: DVS >= 0.0,
+                      VEGETATIVE: DVS >= 1.0,
+                      REPRODUCTIVE: DVS >= p.DVSM[idx],
+                      MATURE: DVS >= p.DVSEND[idx]}
+        new_DVS = {SOWING: -0.1, EMERGING: 0., VEGETATIVE: 1.0,
+                   REPRODUCTIVE: p.DVSM, MATURE: p.DVSEND}
+        # Crop end type reached when entering the next stage
+        end_types = {EMERGING: "emergence", REPRODUCTIVE: "maturity", MATURE: "death"}
+
+        finished = []
+        finish_types = []
+        for stage_, reached in next_stage.items():
+            i = idx[(stage == stage_) & reached]
+            if len(i) == 0:
+                continue
+            self.STAGE[i] = stage_ + 1
+            value = new_DVS[stage_]
+            s.DVS[i] = value[i] if isinstance(value, np.ndarray) else value
+            if stage_ == SOWING:
+                s.DATBE[i] = 0
+            end_type = end_types.get(stage_)
+            if end_type is not None:
+                i = i[p.CROP_END_TYPE[i] == end_type]
+                finished.extend(i)
+                finish_types.extend([end_type] * len(i))
+        return np.array(finished, dtype=np.intp), finish_types
+
+    def _assimilation(self, a, drv):
+        """Potential assimilation, see `WOFOST_Assimilation.__call__()`.
+        """
+        p = self.params
+        s = self.states
+
+        self._NTMIN[a] = np.minimum(self._NTMIN[a] + 1, 7)
+        TMINRA = drv.TMINRA[self._NTMIN[a] - 1, a]
+
+        DVS = s.DVS[a]
+        DTEMP = drv.DTEMP[a]
+        CO2 = p.CO2[a]
+        AMAX = p.AMAXTB(DVS, a)
+        AMAX *= p.CO2AMAXTB(CO2, a)
+        AMAX *= p.TMPFTB(DTEMP, a)
+        KDIF = p.KDIFTB(DVS, a)
+        EFF  = p.EFFTB(DTEMP, a) * p.CO2EFFTB(CO2, a)
+        DTGA = totass_array(drv.DAYL[a], AMAX, EFF, s.LAI[a], KDIF, drv.IRRAD[a],
+                            drv.DIFPP[a], drv.DSINBE[a], drv.SINLD[a], drv.COSLD[a])
+
+        # correction for low minimum temperature potential
+        DTGA *= p.TMNFTB(TMINRA, a)
+
+        # assimilation in kg CH2O per ha
+        return DTGA * 30./44.
+
+    def _evapotranspiration(self, a, drv, soil):
+        """Evapotranspiration and water/oxygen stress, see
+        `EvapotranspirationCO2.__call__()`.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+
+        RF_TRAMX_CO2 = p.CO2TRATB(p.CO2[a], a)
+        ET0_CROP = np.maximum(0., p.CFET[a] * drv.ET0[a])
+        KGLOB = 0.75*p.KDIFTB(s.DVS[a], a)
+        EKL = np.exp(-KGLOB * s.LAI[a])
+        r.EVWMX[a] = drv.E0[a] * EKL
+        r.EVSMX[a] = np.maximum(0., drv.ES0[a] * EKL)
+        TRAMX = r.TRAMX[a] = ET0_CROP * (1.-EKL) * RF_TRAMX_CO2
+
+        SMW = p.SMW[a]
+        SM = soil.states.SM[a]
+        SWDEP = SWEAF_array(ET0_CROP, p.DEPNR[a])
+        SMCR = (1.-SWDEP)*(p.SMFCF[a]-SMW) + SMW
+        RFWS = limit_array(0., 1., (SM-SMW)/(SMCR-SMW))
+
+        # reduction in transpiration in case of oxygen shortage
+        oxygen = (p.IAIRDU[a] == 0) & (p.IOX[a] == 1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            RFOSMX = limit_array(0., 1., (p.SM0[a] - SM)/p.CRAIRC[a])
+        RFOS = np.where(oxygen,
+                        RFOSMX + (1. - np.minimum(soil.states.DSOS[a], 4)/4.)*(1.-RFOSMX),
+                        1.)
+
+        RFTRA = r.RFTRA[a] = RFOS * RFWS
+        r.TRA[a] = TRAMX * RFTRA
+        r.RFWS[a] = RFWS
+        r.RFOS[a] = RFOS
+        r.IDWS[a] = RFWS < 1.
+        r.IDOS[a] = RFOS < 1.
+        self._IDWST[a] += RFWS < 1.
+        self._IDOST[a] += RFOS < 1.
+
+    def _npk_stress(self, a):
+        """Nutrient stress factors, see `NPK_Stress.__call__()`.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+        DVS = s.DVS[a]
+        WLV = s.WLV[a]
+        WST = s.WST[a]
+
+        NMAXLV = p.NMAXLV_TB(DVS, a)
+        PMAXLV = p.PMAXLV_TB(DVS, a)
+        KMAXLV = p.KMAXLV_TB(DVS, a)
+        MAXLV = {"N": NMAXLV, "P": PMAXLV, "K": KMAXLV}
+        MAXST = {"N": p.NMAXST_FR[a] * NMAXLV,
+                 "P": p.PMAXRT_FR[a] * PMAXLV,
+                 "K": p.KMAXST_FR[a] * KMAXLV}
+
+        VBM = WLV + WST
+        biomass = VBM > 0.
+        for x in _NPK:
+            CRIT_FR = getattr(p, x + "CRIT_FR")[a]
+            criticalLV = CRIT_FR * MAXLV[x] * WLV
+            criticalST = CRIT_FR * MAXST[x] * WST
+            with np.errstate(divide="ignore", invalid="ignore"):
+                criticalVBM = np.where(biomass, (criticalLV + criticalST)/VBM, 0.)
+                concentrationVBM = np.where(biomass, (getattr(s, x + "amountLV")[a] +
+                                                      getattr(s, x + "amountST")[a])/VBM, 0.)
+                residualVBM = np.where(biomass, (WLV * getattr(p, x + "RESIDLV")[a] +
+                                                 WST * getattr(p, x + "RESIDST")[a])/VBM, 0.)
+                XNI = np.where((criticalVBM - residualVBM) > 0.,
+                               limit_array(0.001, 1.0, (concentrationVBM - residualVBM)/
+                                           (criticalVBM - residualVBM)),
+                               0.001)
+            getattr(r, x + "NI")[a] = XNI
+
+        NPKI = r.NPKI[a] = np.minimum(np.minimum(r.NNI[a], r.PNI[a]), r.KNI[a])
+        r.RFNPK[a] = limit_array(0., 1.0, 1. - (p.NLUE_NPK[a] * (1.0001 - NPKI) ** 2))
+
+    def _respiration(self, a, drv):
+        """Maintenance respiration, see `WOFOST_Maintenance_Respiration.__call__()`.
+        """
+        p = self.params
+        s = self.states
+        RMRES = (p.RMR[a] * s.WRT[a] +
+                 p.RML[a] * s.WLV[a] +
+                 p.RMS[a] * s.WST[a] +
+                 p.RMO[a] * s.WSO[a])
+        RMRES *= p.RFSETB(s.DVS[a], a)
+        TEFF = p.Q10[a]**((drv.TEMP[a]-25.)/10.)
+        PMRES = self.rates.PMRES[a] = RMRES * TEFF
+        return PMRES
+
+    def _partitioning_rates(self, a, soil):
+        """Excess N flag for partitioning, see `Base_Partitioning_NPK.calc_rates()`.
+        """
+        SURFACE_N = soil.states.SURFACE_N[a]
+        flag = SURFACE_N > self.params.NTHRESH[a]
+        self._THRESHOLD_N_FLAG[a] = flag
+        self._THRESHOLD_N[a] = np.where(flag, SURFACE_N, 0.)
+
+    def _partitioning_integrate(self, a):
+        """Partitioning factors, see `Base_Partitioning_NPK.integrate()`.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+        DVS = s.DVS[a]
+        RFTRA = r.RFTRA[a]
+        NNI = r.NNI[a]
+        FRTB = p.FRTB(DVS, a)
+        FLTB = p.FLTB(DVS, a)
+        FSTB = p.FSTB(DVS, a)
+        FOTB = p.FOTB(DVS, a)
+
+        # Water stress more severe than nitrogen stress
+        water = RFTRA < NNI
+        FRTMOD = np.maximum(1., 1./(RFTRA + 0.5))
+        FLVMOD = np.exp(-p.NPART[a] * (1.0 - NNI))
+        FL = np.where(water, FLTB, FLTB * FLVMOD)
+        FS = np.where(water, FSTB, FSTB + FLTB - FL)
+        FR = np.where(water, np.minimum(0.6, FRTB * FRTMOD), FRTB)
+        FO = FOTB
+
+        # Excess nitrogen
+        flag = self._THRESHOLD_N_FLAG[a]
+        if flag.any():
+            with np.errstate(over="ignore"):
+                FLVMOD = 1 / np.exp(-p.NPART[a] * (1.0 - (self._THRESHOLD_N[a] / p.NTHRESH[a])))
+            FO_N = FOTB * FLVMOD
+            FO = np.where(flag, FO_N, FO)
+            FL = np.where(flag, FLTB + FOTB - FO_N, FL)
+            FS = np.where(flag, FSTB, FS)
+            FR = np.where(flag, FRTB, FR)
+
+        s.FR[a] = FR
+        s.FL[a] = FL
+        s.FS[a] = FS
+        s.FO[a] = FO
+
+    def _root_rates(self, a, soil):
+        """Root growth and death, see `Base_WOFOST_Root_Dynamics.calc_rates()`.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+        ss = soil.states
+        FR = s.FR[a]
+        WRT = s.WRT[a]
+
+        GRRT = r.GRRT[a] = FR * r.DMI[a]
+        RDRNPK = np.maximum(np.maximum(ss.SURFACE_N[a] / p.NTHRESH[a],
+                                       ss.SURFACE_P[a] / p.PTHRESH[a]),
+                            ss.SURFACE_K[a] / p.KTHRESH[a])
+        DRRT1 = r.DRRT1[a] = p.RDRRTB(s.DVS[a], a)
+        DRRT2 = r.DRRT2[a] = p.RDRROS(r.RFOS[a], a)
+        DRRT3 = r.DRRT3[a] = p.RDRRNPK(RDRNPK, a)
+        DRRT = r.DRRT[a] = WRT * limit_array(0, 1, np.maximum(DRRT1, DRRT2+DRRT3))
+        r.GWRT[a] = GRRT - DRRT
+
+        RR = np.minimum((s.RDM[a] - s.RD[a]), p.RRI[a])
+        r.RR[a] = np.where(FR == 0., 0., RR)
+
+    def _root_integrate(self, a):
+        r = self.rates
+        s = self.states
+        s.WRT[a] += r.GWRT[a]
+        s.DWRT[a] += r.DRRT[a]
+        s.TWRT[a] = s.WRT[a] + s.DWRT[a]
+        s.RD[a] += r.RR[a]
+
+    def _stem_rates(self, a):
+        """Stem growth and death, see `Base_WOFOST_Stem_Dynamics.calc_rates()`.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+        GRST = r.GRST[a] = r.ADMI[a] * s.FS[a]
+        DRST = r.DRST[a] = p.RDRSTB(s.DVS[a], a) * s.WST[a]
+        r.GWST[a] = GRST - DRST
+
+    def _stem_integrate(self, a):
+        p = self.params
+        r = self.rates
+        s = self.states
+        s.WST[a] += r.GWST[a]
+        s.DWST[a] += r.DRST[a]
+        s.TWST[a] = s.WST[a] + s.DWST[a]
+        s.SAI[a] = s.WST[a] * p.SSATB(s.DVS[a], a)
+
+    def _storage_organ_rates(self, a, drv):
+        """Storage organ growth and death, see
+        `Base_WOFOST_Storage_Organ_Dynamics.calc_rates()`.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+        GRSO = r.GRSO[a] = r.ADMI[a] * s.FO[a]
+        death = limit_array(0, 1, p.RDRSOB(s.DVS[a], a) + p.RDRSOF(drv.TEMP[a], a))
+        DRSO = r.DRSO[a] = s.WSO[a] * death
+        r.DHSO[a] = s.HWSO[a] * death
+        r.GWSO[a] = GRSO - DRSO
+
+    def _storage_organ_integrate(self, a):
+        p = self.params
+        r = self.rates
+        s = self.states
+        s.WSO[a] += r.GWSO[a]
+        s.HWSO[a] += r.GRSO[a] - r.DHSO[a]
+        s.DWSO[a] += r.DRSO[a]
+        s.TWSO[a] = s.WSO[a] + s.DWSO[a]
+        s.HWSO[a] = limit_array(0, s.WSO[a], s.HWSO[a])
+        s.PAI[a] = s.WSO[a] * p.SPA(s.DVS[a], a)
+
+    def _leaf_sum(self, values, a):
+        """Sum of values over the leaf classes of the fields a, from the
+        youngest to the oldest class.
+        """
+        lo = self.lv_lo[a].min()
+        hi = self.lv_hi[a].max()
+        if hi <= lo:
+            return np.zeros(len(a))
+        return np.cumsum(values[:, lo:hi][:, ::-1], axis=1)[:, -1]
+
+    def _leaf_rates(self, a, drv):
+        """Leaf growth and death, see `Base_WOFOST_Leaf_Dynamics_NPK.calc_rates()`.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+        DVS = s.DVS[a]
+        WLV = s.WLV[a]
+        LAI = s.LAI[a]
+        NPKI = r.NPKI[a]
+        RFTRA = r.RFTRA[a]
+        TEMP = drv.TEMP[a]
+        TBASE = p.TBASE[a]
+
+        GRLV = r.GRLV[a] = r.ADMI[a] * s.FL[a]
+
+        # death of leaves due to water/oxygen stress, self shading, frost
+        # and nutrient stress
+        DSLV1 = r.DSLV1[a] = WLV * (1.-RFTRA) * p.PERDL[a]
+        LAICR = 3.2/p.KDIFTB(DVS, a)
+        DSLV2 = r.DSLV2[a] = WLV * limit_array(0., 0.03, 0.03*(LAI-LAICR)/LAICR)
+        DSLV3 = r.DSLV3[a] = 0.
+        DSLV4 = r.DSLV4[a] = WLV * p.RDRLV_NPK[a] * (1.0 - NPKI)
+        DSLV = r.DSLV[a] = np.maximum(np.maximum(DSLV1, DSLV2), DSLV3) + DSLV4
+
+        # Leaf classes that exceed their life span
+        SPAN = p.SPAN[a]
+        DALV = r.DALV[a] = self._leaf_sum(np.where(self.LVAGE[a] > SPAN[:, None], self.LV[a], 0.), a)
+        r.DRLV[a] = np.maximum(DSLV, DALV)
+
+        # physiologic ageing of leaves per time step
+        r.FYSAGE[a] = np.maximum(0., (TEMP - TBASE)/(35. - TBASE))
+
+        # specific leaf area of leaves per time step, corrected for nutrient stress
+        SLAT = p.SLATB(DVS, a) * np.exp(-p.NSLA_NPK[a] * (1.0 - NPKI))
+
+        # leaf area not to exceed exponential growth curve
+        LAIEXP = s.LAIEXP[a]
+        exponential = LAIEXP < 6.
+        DTEFF = np.maximum(0., TEMP-TBASE)
+        juvenile = (DVS < 0.2) & (LAI < 0.75)
+        factor = np.where(juvenile, RFTRA * np.exp(-p.NLAI_NPK[a] * (1.0 - NPKI)), 1.)
+        GLAIEX = np.where(exponential, LAIEXP * p.RGRLAI[a] * DTEFF * factor, 0.)
+        GLASOL = np.where(exponential, GRLV * SLAT, 0.)
+        GLA = np.minimum(GLAIEX, GLASOL)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            SLAT = np.where(exponential & (GRLV > 0.), GLA/GRLV, SLAT)
+        r.GLAIEX[a] = GLAIEX
+        r.GLASOL[a] = GLASOL
+        r.SLAT[a] = SLAT
+
+    def _leaf_integrate(self, a):
+        """Leaf death, ageing and growth, see
+        `Base_WOFOST_Leaf_Dynamics_NPK.integrate()`.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+        lo = self.lv_lo
+        hi = self.lv_hi
+
+        # Leaf death is imposed on the oldest leaf classes
+        tDRLV = r.DRLV[a].copy()
+        while True:
+            dying = np.flatnonzero((tDRLV > 0.) & (lo[a] < hi[a]))
+            if len(dying) == 0:
+                break
+            fields = a[dying]
+            oldest = self.LV[fields, lo[fields]]
+            complete = tDRLV[dying] >= oldest
+            # remove complete leaf classes
+            i = dying[complete]
+            f = fields[complete]
+            tDRLV[i] -= oldest[complete]
+            self.LV[f, lo[f]] = 0.
+            self.SLA[f, lo[f]] = 0.
+            self.LVAGE[f, lo[f]] = 0.
+            lo[f] += 1
+            # decrease the value of the oldest leaf class
+            i = dying[~complete]
+            f = fields[~complete]
+            self.LV[f, lo[f]] -= tDRLV[i]
+            tDRLV[i] = 0.
+
+        # Integration of physiological age
+        start = lo[a].min()
+        end = hi[a].max()
+        self.LVAGE[a, start:end] += r.FYSAGE[a][:, None]
+
+        # new leaves in the youngest class
+        if end >= self.LV.shape[1]:
+            pad = ((0, 0), (0, self.LV.shape[1]))
+            self.LV = np.pad(self.LV, pad)
+            self.SLA = np.pad(self.SLA, pad)
+            self.LVAGE = np.pad(self.LVAGE, pad)
+        self.LV[a, hi[a]] = r.GRLV[a]
+        self.SLA[a, hi[a]] = r.SLAT[a]
+        self.LVAGE[a, hi[a]] = 0.
+        hi[a] += 1
+
+        # calculation of new leaf area
+        LV = self.LV[a]
+        s.LASUM[a] = self._leaf_sum(LV * self.SLA[a], a)
+        s.LAI[a] = s.LASUM[a] + s.SAI[a] + s.PAI[a]
+        s.LAIMAX[a] = np.maximum(s.LAI[a], s.LAIMAX[a])
+
+        # exponential growth curve
+        s.LAIEXP[a] += r.GLAIEX[a]
+
+        # Update leaf biomass states
+        s.WLV[a] = self._leaf_sum(LV, a)
+        s.DWLV[a] += r.DRLV[a]
+        s.TWLV[a] = s.WLV[a] + s.DWLV[a]
+
+    def _npk_rates(self, a, day, soil):
+        """N/P/K demand, uptake, translocation and death rates of the crop,
+        see `NPK_Crop_Dynamics.calc_rates()`.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+        DVS = s.DVS[a]
+        W = {"LV": s.WLV[a], "ST": s.WST[a], "RT": s.WRT[a], "SO": s.WSO[a]}
+        GR = {"LV": r.GRLV[a], "ST": r.GRST[a], "RT": r.GRRT[a]}
+        DR = {"LV": r.DRLV[a], "ST": r.DRST[a], "RT": r.DRRT[a]}
+        AVAIL = {"N": soil.states.NAVAIL[a], "P": soil.states.PAVAIL[a],
+                 "K": soil.states.KAVAIL[a]}
+
+        # Demand and uptake, see NPK_Demand_Uptake.calc_rates()
+        LIMIT = np.where(r.RFTRA[a] > 0.01, 1.0, 0.)
+        stop = DVS < p.DVS_NPK_STOP[a]
+        for x in _NPK:
+            MAXLV = getattr(p, x + "MAXLV_TB")(DVS, a)
+            mc = {"LV": MAXLV,
+                  "ST": getattr(p, x + "MAXST_FR")[a] * MAXLV,
+                  "RT": getattr(p, x + "MAXRT_FR")[a] * MAXLV,
+                  "SO": getattr(p, x + "MAXSO")[a]}
+            demand = {}
+            for organ in _ORGANS:
+                demand[organ] = np.maximum(mc[organ] * W[organ] - getattr(s, x + "amount" + organ)[a], 0.) + \
+                    np.maximum(GR[organ] * mc[organ], 0) * 1.0
+            demand["SO"] = np.maximum(mc["SO"] * W["SO"] - getattr(s, x + "amountSO")[a], 0.)
+            total = demand["LV"] + demand["ST"] + demand["RT"]
+            for organ, value in demand.items():
+                getattr(r, x + "demand" + organ)[a] = value
+            getattr(r, x + "demand")[a] = total
+
+            uptakeSO = np.minimum(demand["SO"], getattr(s, x + "translocatable")[a]) / \
+                getattr(p, "TC%sT" % x)[a]
+            getattr(r, "R%suptakeSO" % x)[a] = uptakeSO
+
+            UPTAKEMAX = getattr(p, "R%sUPTAKEMAX" % x)[a]
+            if x == "N":
+                fixation = r.RNfixation[a] = np.maximum(0., p.NFIX_FR[a] * total) * LIMIT
+                uptake = np.maximum(0., np.minimum(np.minimum(total - fixation, AVAIL[x]),
+                                                   UPTAKEMAX)) * LIMIT
+            else:
+                uptake = np.maximum(0., np.minimum(np.minimum(total, AVAIL[x]), UPTAKEMAX)) * LIMIT
+            uptake = np.where(stop, uptake, 0.)
+            getattr(r, "R%suptake" % x)[a] = uptake
+            if x == "N":
+                uptake = uptake + fixation
+
+            with np.errstate(divide="ignore", invalid="ignore"):
+                for organ in _ORGANS:
+                    getattr(r, "R%suptake%s" % (x, organ))[a] = \
+                        np.where(total == 0., 0., (demand[organ] / total) * uptake)
+
+        # Translocation, see NPK_Translocation.calc_rates()
+        for x in _NPK:
+            translocatable = getattr(s, x + "translocatable")[a]
+            uptakeSO = getattr(r, "R%suptakeSO" % x)[a]
+            with np.errstate(divide="ignore", invalid="ignore"):
+                for organ in _ORGANS:
+                    getattr(r, "R%stranslocation%s" % (x, organ))[a] = \
+                        np.where(translocatable > 0.,
+                                 uptakeSO * getattr(s, x + "translocatable" + organ)[a] / translocatable,
+                                 0.)
+
+        # Loss of N/P/K due to death of plant material and net rates
+        for x in _NPK:
+            for organ in _ORGANS:
+                death = getattr(p, x + "RESID" + organ)[a] * DR[organ]
+                getattr(r, "R%sdeath%s" % (x, organ))[a] = death
+                getattr(r, "R%samount%s" % (x, organ))[a] = \
+                    getattr(r, "R%suptake%s" % (x, organ))[a] - \
+                    getattr(r, "R%stranslocation%s" % (x, organ))[a] - death
+            getattr(r, "R%samountSO" % x)[a] = getattr(r, "R%suptakeSO" % x)[a]
+            getattr(r, "R%sloss" % x)[a] = getattr(r, "R%sdeathLV" % x)[a] + \
+                getattr(r, "R%sdeathST" % x)[a] + getattr(r, "R%sdeathRT" % x)[a]
+
+        for x in _NPK:
+            self._check_balance(a, day, x)
+
+    def _check_balance(self, a, day, x:str):
+        """Check that the N, P or K balance of the crops of the fields a is
+        valid, see `NPK_Crop_Dynamics._check_N_balance()`.
+        """
+        s = self.states
+        initial = [getattr(self.initial, "%samount%sI" % (x, o))[a] for o in _ORGANS + ("SO",)]
+        amounts = [getattr(s, "%samount%s" % (x, o))[a] for o in _ORGANS + ("SO",)]
+        uptake = getattr(s, x + "uptakeTotal")[a]
+        if x == "N":
+            uptake = uptake + s.NfixTotal[a]
+        losses = getattr(s, x + "lossesTotal")[a]
+        checksum = np.abs(uptake + (initial[0] + initial[1] + initial[2] + initial[3]) -
+                          (amounts[0] + amounts[1] + amounts[2] + amounts[3] + losses))
+        failed = np.flatnonzero(checksum >= 1.0)
+        if len(failed) > 0:
+            i = failed[0]
+            msg = "%s flows not balanced on day %s\n" % (x, date.fromordinal(int(day[a[i]])))
+            msg += "Field: %i, Checksum: %f, %suptake_T: %f\n" % (a[i], checksum[i], x, uptake[i])
+            msg += ("%samountLVI: %f, %samountSTI: %f, %samountRTI: %f, %samountSOI: %f\n" %
+                    (x, initial[0][i], x, initial[1][i], x, initial[2][i], x, initial[3][i]))
+            msg += ("%samountLV: %f, %samountST: %f, %samountRT: %f, %samountSO: %f\n" %
+                    (x, amounts[0][i], x, amounts[1][i], x, amounts[2][i], x, amounts[3][i]))
+            msg += "%sLOSST: %f\n" % (x, losses[i])
+            raise exc.NutrientBalanceError(msg)
+
+    def _npk_integrate(self, a):
+        """N/P/K amounts in the crop, see `NPK_Crop_Dynamics.integrate()`.
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+        W = {"LV": s.WLV[a], "ST": s.WST[a], "RT": s.WRT[a]}
+        translocation = s.DVS[a] > p.DVS_NPK_TRANSL[a]
+        for x in _NPK:
+            for organ in _ORGANS + ("SO",):
+                getattr(s, "%samount%s" % (x, organ))[a] += getattr(r, "R%samount%s" % (x, organ))[a]
+
+            # Translocatable amounts, see NPK_Translocation.integrate()
+            for organ in _ORGANS:
+                getattr(s, "%stranslocatable%s" % (x, organ))[a] = \
+                    np.maximum(0., getattr(s, "%samount%s" % (x, organ))[a] -
+                               W[organ] * getattr(p, "%sRESID%s" % (x, organ))[a])
+            total = getattr(s, x + "translocatableLV")[a] + \
+                getattr(s, x + "translocatableST")[a] + getattr(s, x + "translocatableRT")[a]
+            getattr(s, x + "translocatable")[a] = np.where(translocation, total, 0.)
+
+            getattr(s, x + "uptakeTotal")[a] += getattr(r, "R%suptake" % x)[a]
+            getattr(s, x + "lossesTotal")[a] += getattr(r, "R%sloss" % x)[a]
+        s.NfixTotal[a] += r.RNfixation[a]
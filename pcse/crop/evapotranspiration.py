@@ -6,11 +6,13 @@ Modified by Will Solow, 2024
 from math import exp
 from datetime import date
 
+import numpy as np
+
 from ..utils.traitlets import Float, Int, Bool
 from ..utils.decorators import prepare_rates, prepare_states
 from ..base import ParamTemplate, StatesTemplate, RatesTemplate, \
                          SimulationObject, VariableKiosk
-from ..util import limit, AfgenTrait
+from ..util import limit, limit_array, AfgenTrait
 from ..nasapower import WeatherDataProvider
 
 
@@ -39,6 +41,20 @@ def SWEAF(ET0, DEPNR):
 
     return limit(0.10, 0.95, sweaf)
 
+def SWEAF_array(ET0, DEPNR):
+    """Array version of `SWEAF()`.
+    """
+    A = 0.76
+    B = 1.5
+    # curve for CGNR 5, and other curves at fixed distance below it
+    sweaf = 1./(A+B*ET0) - (5.-DEPNR)*0.10
+
+    # Correction for lower curves (CGNR less than 3)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sweaf = np.where(DEPNR < 3., sweaf + (ET0-0.6)/(DEPNR*(DEPNR+3.)), sweaf)
+
+    return limit_array(0.10, 0.95, sweaf)
+
 class EvapotranspirationCO2(SimulationObject):
     """Calculation of evaporation (water and soil) and transpiration rates
     taking into account the CO2 effect on crop transpiration.
@@ -12,7 +12,7 @@ import datetime
 from ..utils.traitlets import Float, Instance, Enum, Bool, Int
 from ..utils.decorators import prepare_rates, prepare_states
 
-from ..util import limit, AfgenTrait, daylength
+from ..util import limit, AfgenTrait, drv_daylength
 from ..base import ParamTemplate, StatesTemplate, RatesTemplate, \
      SimulationObject, VariableKiosk
 from ..utils import signals
@@ -393,7 +393,7 @@ class Base_Phenology(SimulationObject):
         # Day length sensitivity
         DVRED = 1.
         if p.IDSL >= 1:
-            DAYLP = daylength(day, drv.LAT)
+            DAYLP = drv_daylength(day, drv)
             DVRED = limit(0., 1., (DAYLP - p.DLC)/(p.DLO - p.DLC))
 
         # Vernalisation
@@ -694,7 +694,7 @@ class Perennial_Phenology(Base_Phenology):
 
         # Day length sensitivity
         DVRED = 1.
-        DAYLP = daylength(day, drv.LAT)
+        DAYLP = drv_daylength(day, drv)
         self._DAY_LENGTH = DAYLP
         if p.IDSL >= 1:
             DVRED = limit(0., 1., (DAYLP - p.DLC)/(p.DLO - p.DLC))
@@ -1131,7 +1131,7 @@ class Grape_Phenology(SimulationObject):
         # Day length sensitivity
         """Unused in grapevines"""
         DVRED = 1.
-        DAYLP = daylength(day, drv.LAT)
+        DAYLP = drv_daylength(day, drv)
         self._DAY_LENGTH = DAYLP
         if p.IDSL >= 1:
             DVRED = limit(0., 1., (DAYLP - p.DLC)/(p.DLO - p.DLC))
@@ -13,7 +13,7 @@ from ..utils.decorators import prepare_rates, prepare_states
 from ..base import ParamTemplate, StatesTemplate, RatesTemplate, \
      SimulationObject, VariableKiosk
 from .. import signals
-from ..util import Afgen, AfgenTrait
+from ..util import get_afgen, AfgenTrait
 from .. import exceptions as exc
 from .phenology import Annual_Phenology, Perennial_Phenology, Grape_Phenology
 from .respiration import WOFOST_Maintenance_Respiration as MaintenanceRespiration
@@ -404,7 +404,7 @@ class Wofost80Perennial(BaseCropModel):
 
         AGE = self.kiosk["AGE"]
         # Check partitioning of TDWI over plant organs
-        checksum = Afgen(self._par_values["TDWI"])(AGE) - self.states.TAGP - self.kiosk.TWRT
+        checksum = get_afgen(self._par_values["TDWI"])(AGE) - self.states.TAGP - self.kiosk.TWRT
         if abs(checksum) > 0.0001:
             msg = "Error in partitioning of initial biomass (TDWI)!"
             #raise exc.PartitioningError(msg)
@@ -550,7 +550,7 @@ class Wofost80Perennial(BaseCropModel):
 
         AGE = self.kiosk["AGE"]
         # Check partitioning of TDWI over plant organs
-        checksum = Afgen(self._par_values["TDWI"])(AGE) - self.states.TAGP - self.kiosk.TWRT
+        checksum = get_afgen(self._par_values["TDWI"])(AGE) - self.states.TAGP - self.kiosk.TWRT
         if abs(checksum) > 0.0001:
             msg = "Error in partitioning of initial biomass (TDWI)!"
             #raise exc.PartitioningError(msg)
@@ -16,13 +16,23 @@ Modified by Will Solow, 2024
 """
 from datetime import date
 
+import numpy as np
+
 from .utils.traitlets import Instance, Bool, List, Dict
 from .base import (VariableKiosk, AncillaryObject, SimulationObject,
                            BaseEngine, ParameterProvider)
-from .nasapower import WeatherDataProvider, WeatherDataContainer
-from .agromanager import BaseAgroManager
-from .util import ConfigurationLoader
+from .nasapower import WeatherDataProvider, WeatherDataContainer, WeatherDayView, WeatherBatchView
+from .agromanager import BaseAgroManager, AgroManagerAnnual
+from .util import ConfigurationLoader, get_model_config, ordinals_to_datetime64
 from .base.timer import Timer
+from .base.variablekiosk import create_kiosk
+from .base.recorder import OutputRecorder
+from .base.snapshot import (EngineSnapshot, EngineForker, CropTemplate, get_crop_template,
+                            add_crop_template)
+from .base.states_rates import get_states_rates_backend, _check_backend
+from .crop.wofost8 import Wofost80
+from .crop.batch_wofost8 import BatchWofost80, EMERGING
+from .soil.batch_soil import BatchSoil, SOIL_MODULES
 from . import signals
 from . import exceptions as exc
 
@@ -90,6 +100,8 @@ class Engine(BaseEngine):
     agromanager = Instance(AncillaryObject)
     weatherdataprovider = Instance(WeatherDataProvider)
     drv = None
+    # create crops from cached templates, see CropTemplate
+    use_crop_templates = True
     kiosk = Instance(VariableKiosk)
     timer = Instance(Timer)
     day = Instance(date)
@@ -124,17 +136,29 @@ class Engine(BaseEngine):
         BaseEngine.__init__(self)
 
         # Load the model configuration
-        self.mconf = ConfigurationLoader(config)
+        self.mconf = get_model_config(config)
         self.parameterprovider = parameterprovider
 
         # Variable kiosk for registering and publishing variables
-        self.kiosk = VariableKiosk()
+        backend = self.mconf.STATES_RATES_BACKEND
+        if backend is not None:
+            _check_backend(backend)
+        self.kiosk = create_kiosk(self.mconf.KIOSK_MODE, backend)
 
         # Placeholder for variables to be saved during a model run
         self._saved_output = list()
         self._saved_summary_output = list()
         self._saved_terminal_output = dict()
 
+        # Optional preallocated array receiving selected output variables,
+        # see set_output_buffer()
+        self._output_buffer = None
+        self._output_buffer_vars = None
+        self._output_day = None
+        self._save_full_output = True
+        # Optional recorder of the output of every day, see set_output_recorder()
+        self._output_recorder = None
+
         # register handlers for starting/finishing the crop simulation, for
         # handling output and terminating the system
         self._connect_signal(self._on_CROP_START, signal=signals.crop_start)
@@ -272,8 +296,20 @@ class Engine(BaseEngine):
 
         self.parameterprovider.set_active_crop(crop_name, variety_name, crop_start_type,
                                                crop_end_type)  
-                  
-        self.crop = self.mconf.CROP(day, self.kiosk, self.parameterprovider)
+
+        if not self.use_crop_templates:
+            self.crop = self.mconf.CROP(day, self.kiosk, self.parameterprovider)
+            return
+
+        # Crops are copied from a template initialized with the same parameters
+        key = (self.mconf.CROP, crop_name, variety_name, crop_start_type, crop_end_type,
+               get_states_rates_backend(self.kiosk), self.parameterprovider.get_parameter_key())
+        template = get_crop_template(key)
+        if template is None:
+            self.crop = self.mconf.CROP(day, self.kiosk, self.parameterprovider)
+            add_crop_template(key, CropTemplate(self.crop, self.kiosk, self.parameterprovider, day))
+        else:
+            self.crop = template.instantiate(day, self.kiosk, self.parameterprovider)
  
     def _on_SITE_START(self, day:date, site_name:str=None, variation_name:str=None):
         """Starts the site
@@ -386,8 +422,11 @@ class Engine(BaseEngine):
     def _get_driving_variables(self, day:date):
         """Get driving variables, compute derived properties and return it.
         """
-        drv = self.weatherdataprovider(day)
-        
+        drv = self.weatherdataprovider.day_view(day)
+        # Day views of a columnar store already carry the derived variables
+        if type(drv) is WeatherDayView:
+            return drv
+
         # average temperature and average daytemperature (if needed)
         if not hasattr(drv, "TEMP"):
             drv.add_variable("TEMP", (drv.TMIN + drv.TMAX)/2., "Celcius")
@@ -402,12 +441,40 @@ class Engine(BaseEngine):
         # Switch off the flag for generating output
         self.flag_output = False
 
+        if self._output_buffer is not None:
+            self._fill_output_buffer(day)
+        if self._output_recorder is not None:
+            recorder = self._output_recorder
+            self._write_output_values(recorder.varnames, recorder.next_row(day))
+        if not self._save_full_output:
+            return
+
         # find current value of variables to are to be saved
         states = {"day":day}
         for var in self.mconf.OUTPUT_VARS:
             states[var] = self.get_variable(var)
         self._saved_output = [states]
 
+    def _fill_output_buffer(self, day:date):
+        """Writes the current value of the output buffer variables into the
+        output buffer.
+        """
+        self._write_output_values(self._output_buffer_vars, self._output_buffer)
+        self._output_day = day
+
+    def _write_output_values(self, varnames:list, out:np.ndarray):
+        """Writes the current value of varnames into the float array out.
+        Missing values become NaN and dates are stored as YYYYMMDD.
+        """
+        for i, var in enumerate(varnames):
+            value = self.get_variable(var)
+            if value is None:
+                out[i] = np.nan
+            elif isinstance(value, date):
+                out[i] = value.year * 10000 + value.month * 100 + value.day
+            else:
+                out[i] = value
+
     def _save_summary_output(self):
         """Appends selected model variables to self._saved_summary_output.
         """
@@ -468,6 +535,62 @@ class Engine(BaseEngine):
 
         return self._saved_output
 
+    def set_output_buffer(self, varnames:list, save_output:bool=False):
+        """Writes the values of `varnames` into a preallocated float array at
+        each OUTPUT signal.
+
+        :param varnames: list of variable names to store in the buffer
+        :param save_output: keep saving all OUTPUT_VARS for `get_output()`
+            as well. When False only the buffer variables are retrieved from
+            the model, which is much cheaper.
+
+        The buffer is overwritten at every OUTPUT signal and can be retrieved
+        with `get_output_buffer()`, the day of the values with
+        `get_output_day()`.
+        """
+        self._output_buffer_vars = list(varnames)
+        self._output_buffer = np.full(len(self._output_buffer_vars), np.nan)
+        self._output_day = None
+        self._save_full_output = save_output
+        return self._output_buffer
+
+    def get_output_buffer(self):
+        """Returns the output buffer set with `set_output_buffer()`, or None.
+        """
+
+        return self._output_buffer
+
+    def get_output_day(self):
+        """Returns the day on which the output buffer was last written.
+        """
+
+        return self._output_day
+
+    def set_output_recorder(self, varnames:list, maxlen:int=None, save_output:bool=False):
+        """Records the values of `varnames` at every OUTPUT signal in an
+        OutputRecorder.
+
+        :param varnames: list of variable names to record, their values
+            should be numbers or dates
+        :param maxlen: keep only the last `maxlen` days. When None the whole
+            simulation is recorded.
+        :param save_output: keep saving all OUTPUT_VARS for `get_output()`
+            as well, see `set_output_buffer()`.
+
+        Unlike `get_output()`, which only holds the output of the last day,
+        the recorder holds the trajectory of a run with `run(days=365)` and
+        can be exported with `to_numpy()`, `to_dataframe()` or `to_arrow()`.
+        """
+        self._output_recorder = OutputRecorder(varnames, maxlen=maxlen)
+        self._save_full_output = save_output
+        return self._output_recorder
+
+    def get_output_recorder(self):
+        """Returns the OutputRecorder set with `set_output_recorder()`, or None.
+        """
+
+        return self._output_recorder
+
     def get_summary_output(self):
         """Returns the summary variables have have been stored during the simulation.
         """
@@ -480,6 +603,68 @@ class Engine(BaseEngine):
 
         return self._saved_terminal_output
 
+    def snapshot(self):
+        """Returns a snapshot of the current state of the simulation.
+
+        The snapshot holds a copy of the state of the engine, the agromanager,
+        the timer, all crop and soil components and the VariableKiosk. It can
+        be passed to `restore()` any number of times to return the engine to
+        this point in the simulation, which is much cheaper than building a
+        new engine. Parameters, the ParameterProvider and the
+        WeatherDataProvider are shared and not part of the snapshot.
+        """
+        return EngineSnapshot(self)
+
+    def restore(self, snapshot:EngineSnapshot):
+        """Restores the state of the simulation from a snapshot taken with
+        `snapshot()` on this engine.
+
+        The signal connections of the components of the engine (the
+        SimulationObjects, the agromanager and the engine itself) are reset to
+        those at the time of the snapshot. Handlers connected by the caller to
+        the SignalBus of the kiosk are left as they are: handlers connected
+        after the snapshot remain connected and handlers disconnected after
+        the snapshot are not reconnected.
+        """
+        if not isinstance(snapshot, EngineSnapshot):
+            msg = "Expected an EngineSnapshot, got '%s'." % type(snapshot).__name__
+            raise exc.PCSEError(msg)
+        if snapshot.engine is not self:
+            msg = "Snapshot was taken from a different engine and cannot be restored."
+            raise exc.PCSEError(msg)
+        snapshot.restore()
+
+    def fork(self):
+        """Returns an independent copy of the engine at the current point of
+        the simulation.
+
+        The copy shares the parameters, Afgen tables, WeatherDataProvider and
+        model configuration with this engine but has its own copy of all state
+        and rate variables, its own VariableKiosk and its signal handlers
+        connected to that kiosk. Running either engine does not affect the
+        other. Useful for lookahead planning and tree search.
+        """
+        return EngineForker(self).fork()
+
+    def close(self):
+        """Releases the simulation objects of the engine.
+
+        The crop and soil components deregister their variables from the
+        VariableKiosk, all signal handlers are disconnected and the kiosk is
+        emptied, after which the engine cannot be run anymore. The output
+        saved during the simulation remains available. Calling close() more
+        than once has no effect.
+        """
+        for simobj in (self.crop, self.soil):
+            if simobj is not None:
+                simobj._delete()
+        self.crop = None
+        self.soil = None
+        self.drv = None
+        self.kiosk.signal_bus.clear()
+        self.kiosk._set_state(({}, {}, {}, {}, {}))
+        self.flag_terminate = True
+
 class Wofost8Engine(Engine):
     """Convenience class for running WOFOST8.0 nutrient and water-limited production
 
@@ -495,3 +680,530 @@ class Wofost8Engine(Engine):
         """
         Engine.__init__(self, parameterprovider, weatherdataprovider, agromanagement,
                     config=config)
+
+
+
+
+class BatchWofost8Engine(object):
+    """Runs N independent WOFOST8.0 simulations as a batch on NumPy arrays.
+
+    :param parameterprovider: A ParameterProvider shared by all fields or a
+        list with one ParameterProvider per field. The ParameterProviders are
+        copied for each field as the engine changes their active crop and
+        overrides.
+    :param weatherdataprovider: A WeatherDataProvider shared by all fields or a
+        list with one WeatherDataProvider per field
+    :param agromanagement: Agromanagement data shared by all fields or a list
+        with agromanagement data per field
+    :param config: model configuration dictionary
+    :param n: the number of fields, only needed when none of the inputs is
+        given as a list
+
+    The crops and soils of the fields are simulated by a `BatchWofost80` and a
+    `BatchSoil` which hold their states and rates in arrays of shape (N,), so
+    that one day of N fields costs a handful of array operations instead of N
+    engine steps. Each day follows the order of `Engine._run()`: the timer,
+    state integration, driving variables, agromanagement and rate calculation.
+    Events such as crop start and finish are applied to the fields they
+    concern with index arrays, so fields can start, finish and terminate on
+    different days.
+
+    Only configurations of `Wofost8Engine` with the `Wofost80` crop, one of
+    the classic soil module wrappers and `AgroManagerAnnual` can be batched,
+    other configurations raise a PCSEError. Model variables are returned as
+    NumPy arrays of shape (N,) and events such as irrigation, fertilization and
+    harvest are sent to the fields selected by a boolean mask of shape (N,).
+    Amounts can be given as a scalar or as an array with a value per field.
+    Fields can be restarted with `reset()`, e.g. when an episode of a vector
+    environment ends.
+    """
+
+    def __init__(self, parameterprovider, weatherdataprovider, agromanagement,
+                 config:dict, n:int=None):
+        """Initialize the BatchWofost8Engine Class
+        """
+        inputs = [parameterprovider, weatherdataprovider, agromanagement]
+        sizes = set([len(x) for x in inputs if isinstance(x, (list, tuple))])
+        if n is not None:
+            sizes.add(n)
+        if len(sizes) != 1:
+            msg = ("Number of fields cannot be determined from the inputs: give n " +
+                   "or lists of equal length.")
+            raise exc.PCSEError(msg)
+        self.n = sizes.pop()
+
+        self.mconf = get_model_config(config)
+        if self.mconf.CROP is not Wofost80 or self.mconf.SOIL not in SOIL_MODULES \
+                or self.mconf.AGROMANAGEMENT is not AgroManagerAnnual:
+            msg = ("Only the Wofost80 crop with a classic soil module wrapper and the " +
+                   "AgroManagerAnnual can be simulated as a batch.")
+            raise exc.PCSEError(msg)
+
+        # The ParameterProviders are copied for each field as the engine
+        # changes their active crop and overrides, see reset()
+        self._parameterprovider_sources = self._per_field(parameterprovider)
+        self.parameterproviders = [pp.copy() for pp in self._parameterprovider_sources]
+
+        # Weather of each field, fields sharing a provider share its store
+        self._stores = []
+        for wdp in self._per_field(weatherdataprovider):
+            if wdp.supports_ensembles:
+                msg = "Weather ensembles cannot be simulated as a batch."
+                raise exc.PCSEError(msg)
+            self._stores.append(wdp.columnar_store())
+
+        # Site and crop calendars of each field
+        self._sites = [None] * self.n
+        self._crops = [None] * self.n
+        self.start_date = np.zeros(self.n, dtype=np.int64)
+        self.end_date = np.zeros(self.n, dtype=np.int64)
+        self._crop_start_date = np.zeros(self.n, dtype=np.int64)
+        self._crop_end_date = np.zeros(self.n, dtype=np.int64)
+        self._crop_end_harvest = np.zeros(self.n, dtype=bool)
+        self._max_duration = np.zeros(self.n, dtype=np.int64)
+        idx = np.arange(self.n)
+        self._set_calendars(idx, self._per_field(agromanagement))
+
+        # State of the timer and agromanagement of each field
+        self._day = self.start_date.copy()
+        self._day_counter = np.zeros(self.n, dtype=np.int64)
+        self._duration = np.zeros(self.n, dtype=np.int64)
+        self._in_crop_cycle = np.zeros(self.n, dtype=bool)
+
+        # flags that are being set by events
+        self.flag_terminate = np.zeros(self.n, dtype=bool)
+        self._flag_output = np.zeros(self.n, dtype=bool)
+        self._flag_crop_finish = np.zeros(self.n, dtype=bool)
+        self._flag_site_delete = np.zeros(self.n, dtype=bool)
+
+        # Fields with a crop/soil and fields with a removed crop/soil whose
+        # variables can still be in the kiosk, see get_variable()
+        self._crop_present = np.zeros(self.n, dtype=bool)
+        self._crop_stale = np.zeros(self.n, dtype=bool)
+        self._soil_present = np.zeros(self.n, dtype=bool)
+        self._soil_stale = np.zeros(self.n, dtype=bool)
+
+        self.crop = BatchWofost80(self.n)
+        self.soil = BatchSoil(self.n, self.mconf.SOIL)
+
+        # Optional preallocated array receiving selected output variables,
+        # see set_output_buffer()
+        self._output_buffer = None
+        self._output_buffer_vars = None
+        self._output_day = None
+
+        self._start(idx)
+
+    def _set_calendars(self, idx, agromanagement:list):
+        """Sets the site and crop calendars of the fields idx from their
+        agromanagement, parsed and validated by the AgroManager of the scalar
+        engine.
+        """
+        for i, am in zip(idx, agromanagement):
+            agromanager = AgroManagerAnnual(VariableKiosk(), am)
+            sc = agromanager._site_calendar
+            cc = agromanager._crop_calendar
+            if sc is None:
+                msg = "A SiteCalendar is needed for each field."
+                raise exc.PCSEError(msg)
+            self._sites[i] = (sc.site_name, sc.variation_name)
+            self.start_date[i] = sc.site_start_date.toordinal()
+            self.end_date[i] = sc.site_end_date.toordinal()
+            if cc is None:
+                self._crops[i] = None
+                self._crop_start_date[i] = -1
+                self._crop_end_date[i] = -1
+                self._crop_end_harvest[i] = False
+                self._max_duration[i] = -1
+            else:
+                self._crops[i] = (cc.crop_name, cc.variety_name, cc.crop_start_type,
+                                  cc.crop_end_type)
+                self._crop_start_date[i] = cc.crop_start_date.toordinal()
+                self._crop_end_date[i] = -1 if cc.crop_end_date is None \
+                    else cc.crop_end_date.toordinal()
+                self._crop_end_harvest[i] = cc.crop_end_type == "harvest"
+                self._max_duration[i] = cc.max_duration
+
+    def _start(self, idx):
+        """Starts the simulation of the fields idx at their site start date,
+        see `Engine.__init__()`.
+        """
+        self._day[idx] = self.start_date[idx]
+        self._day_counter[idx] = 0
+        self._duration[idx] = 0
+        self._in_crop_cycle[idx] = False
+        for flag in (self.flag_terminate, self._flag_output, self._flag_crop_finish,
+                     self._flag_site_delete, self._crop_present, self._crop_stale,
+                     self._soil_present, self._soil_stale):
+            flag[idx] = False
+        if self._output_buffer is not None:
+            self._output_buffer[idx] = np.nan
+            self._output_day[idx] = np.datetime64("NaT")
+
+        self._timer(idx)
+        self.drv = WeatherBatchView(self._stores, self._day, idx)
+        self._agromanager(idx)
+        self._calc_rates(idx)
+
+    def reset(self, mask=None, agromanagement=None):
+        """Restarts the simulation of the fields selected by mask, as if they
+        were created anew. The fields keep their agromanagement unless new
+        agromanagement is given, shared by the selected fields or as a list
+        with agromanagement per selected field.
+        """
+        idx = self._field_indices(mask)
+        if agromanagement is not None:
+            if not isinstance(agromanagement, (list, tuple)):
+                agromanagement = [agromanagement] * len(idx)
+            if len(agromanagement) != len(idx):
+                msg = "Agromanagement should be given for %i fields, got %i." % \
+                      (len(idx), len(agromanagement))
+                raise exc.PCSEError(msg)
+            self._set_calendars(idx, agromanagement)
+        for i in idx:
+            self.parameterproviders[i] = self._parameterprovider_sources[i].copy()
+        self._start(idx)
+
+    def _per_field(self, value):
+        """Return a list with the value for each field.
+        """
+        if isinstance(value, (list, tuple)):
+            return list(value)
+        return [value] * self.n
+
+    def _field_indices(self, mask):
+        """Return the indices of the fields selected by mask.
+        """
+        if mask is None:
+            return np.arange(self.n)
+        mask = np.asarray(mask, dtype=bool)
+        if mask.shape != (self.n,):
+            msg = "Mask should have shape (%i,), got %s." % (self.n, mask.shape)
+            raise exc.PCSEError(msg)
+        return np.flatnonzero(mask)
+
+    @property
+    def terminated(self):
+        """Boolean array that is True for the fields whose simulation has terminated.
+        """
+        return self.flag_terminate.copy()
+
+    @property
+    def day(self):
+        """Array of datetime64 with the current date of each field.
+        """
+        return ordinals_to_datetime64(self._day)
+
+    def run(self, days:int=1, mask=None):
+        """Advances the fields selected by mask with given number of days.
+        Fields that have terminated are not advanced.
+        """
+        selected = np.zeros(self.n, dtype=bool)
+        selected[self._field_indices(mask)] = True
+        for _ in range(days):
+            idx = np.flatnonzero(selected & ~self.flag_terminate)
+            if len(idx) == 0:
+                break
+            self._run(idx)
+
+    def _run(self, idx):
+        """Make one time step of the simulation for the fields idx.
+        """
+        # Update timer
+        self._day[idx] += 1
+        self._day_counter[idx] += 1
+        self._timer(idx)
+
+        # State integration
+        self._integrate(idx)
+
+        # Driving variables
+        self.drv = WeatherBatchView(self._stores, self._day, idx)
+
+        # Agromanagement decisions
+        self._agromanager(idx)
+
+        # Rate calculation
+        self._calc_rates(idx)
+
+        terminated = idx[self.flag_terminate[idx] & self._soil_present[idx]]
+        if len(terminated) > 0:
+            self.soil.finalize(terminated)
+
+    def _timer(self, idx):
+        """Sets the output and terminate flags of the fields idx, see
+        `Timer.__call__()`.
+        """
+        mconf = self.mconf
+        if mconf.OUTPUT_VARS:
+            interval_type = mconf.OUTPUT_INTERVAL.lower()
+            if interval_type == "daily":
+                output = (self._day_counter[idx] % mconf.OUTPUT_INTERVAL_DAYS) == 0
+            else:
+                checks = {"weekly": lambda day: Timer.is_a_week(day, mconf.OUTPUT_WEEKDAY),
+                          "dekadal": Timer.is_a_dekad,
+                          "monthly": Timer.is_a_month}
+                check = checks[interval_type]
+                output = np.array([check(date.fromordinal(int(day))) for day in self._day[idx]],
+                                  dtype=bool)
+            self._flag_output[idx] |= output
+        self.flag_terminate[idx] |= self._day[idx] >= self.end_date[idx]
+
+    def _integrate(self, idx):
+        """Integrate rates with states for the fields idx.
+        """
+        # Flush the states of the kiosk
+        self._crop_stale[idx] = False
+        self.crop.flush(idx)
+        self.soil.flush(idx)
+
+        crop = idx[self._crop_present[idx]]
+        if len(crop) > 0:
+            finished, finish_types = self.crop.integrate(crop, self.soil)
+            self._finish_crops(finished, finish_types)
+
+        soil = idx[self._soil_present[idx]]
+        if len(soil) > 0:
+            self.soil.integrate(soil, self.crop, self._crop_present[soil])
+
+        # Set all rate variables to zero
+        self.crop.zerofy(crop)
+        self.soil.rates.zerofy(soil)
+
+    def _agromanager(self, idx):
+        """Runs the site and crop calendars of the fields idx, see
+        `BaseAgroManager.__call__()`.
+        """
+        day = self._day[idx]
+
+        # Start and end of the site cycle
+        start = idx[day == self.start_date[idx]]
+        if len(start) > 0:
+            for i in start:
+                self.parameterproviders[i].set_active_site(*self._sites[i])
+            self.soil.start(start, [self.parameterproviders[i] for i in start])
+            self._soil_present[start] = True
+            self._soil_stale[start] = False
+
+        end = idx[day == self.end_date[idx]]
+        if len(end) > 0:
+            self._flag_site_delete[end] = True
+            crop = end[self._crop_present[end]]
+            self._finish_crops(crop, None)
+            self.flag_terminate[end] = True
+
+        # Start of the crop cycle
+        self._duration[idx[self._in_crop_cycle[idx]]] += 1
+        start = idx[day == self._crop_start_date[idx]]
+        if len(start) > 0:
+            if self._crop_present[start].any():
+                msg = ("A CROP_START signal was received while self.cropsimulation "
+                       "still holds a valid cropsimulation object. It looks like "
+                       "you forgot to send a CROP_FINISH signal with option "
+                       "crop_delete=True")
+                raise exc.PCSEError(msg)
+            for i in start:
+                self.parameterproviders[i].set_active_crop(*self._crops[i])
+            self.crop.start(start, self._day, [self.parameterproviders[i] for i in start])
+            self.soil.crop_start(start)
+            self._in_crop_cycle[start] = True
+            self._duration[start] = 0
+            self._crop_present[start] = True
+
+        # End of the crop cycle at the harvest date or the maximum duration
+        cycle = idx[self._in_crop_cycle[idx]]
+        harvest = self._crop_end_harvest[cycle] & (self._day[cycle] == self._crop_end_date[cycle])
+        max_duration = self._duration[cycle] == self._max_duration[cycle]
+        finished = harvest | max_duration
+        if finished.any():
+            finish_types = np.where(max_duration, "max_duration", "harvest")[finished]
+            self._finish_crops(cycle[finished], list(finish_types))
+
+    def _finish_crops(self, idx, finish_type):
+        """Finishes the crops of the fields idx, see the CROP_FINISH handlers
+        of the crop, soil, crop calendar and `Engine`.
+        """
+        if len(idx) == 0:
+            return
+        self.crop.finish(idx, self._day, finish_type)
+        self.soil.crop_finish(idx)
+        self._in_crop_cycle[idx] = False
+        self._flag_crop_finish[idx] = True
+
+    def _calc_rates(self, idx):
+        """Calculate the rates of the fields idx.
+        """
+        crop = idx[self._crop_present[idx]]
+        if len(crop) > 0:
+            self.crop.calc_rates(crop, self._day, self.drv, self.soil)
+
+        soil = idx[self._soil_present[idx]]
+        if len(soil) > 0:
+            # Crops before emergence do not transpire or take up nutrients
+            present = self._crop_present[soil]
+            active = present & (self.crop.STAGE[soil] != EMERGING)
+            self.soil.calc_rates(soil, self.drv, self.crop, active, present)
+
+        # Save state variables of the model
+        output = idx[self._flag_output[idx]]
+        if len(output) > 0:
+            self._save_output(output)
+
+        # Finish the crop and site simulations
+        finish = idx[self._flag_crop_finish[idx] & self._crop_present[idx]]
+        self._flag_crop_finish[idx] = False
+        if len(finish) > 0:
+            self.crop.finalize(finish)
+            for i in finish:
+                self.parameterproviders[i].clear_override()
+            self._crop_present[finish] = False
+            self._crop_stale[finish] = True
+
+        delete = idx[self._flag_site_delete[idx] & self._soil_present[idx]]
+        self._flag_site_delete[idx] = False
+        if len(delete) > 0:
+            self.soil.finalize(delete)
+            for i in delete:
+                self.parameterproviders[i].clear_override()
+            self._soil_present[delete] = False
+            self._soil_stale[delete] = True
+
+    def _save_output(self, idx):
+        """Writes the output buffer variables of the fields idx into the
+        output buffer.
+        """
+        # Switch off the flag for generating output
+        self._flag_output[idx] = False
+
+        if self._output_buffer is None:
+            return
+        for j, var in enumerate(self._output_buffer_vars):
+            self._output_buffer[idx, j] = self._to_float(self.get_variable(var))[idx]
+        self._output_day[idx] = ordinals_to_datetime64(self._day[idx])
+
+    @staticmethod
+    def _to_float(values):
+        """Returns values as a float array, dates are stored as YYYYMMDD and
+        other values that are not numbers become NaN.
+        """
+        if np.issubdtype(values.dtype, np.datetime64):
+            days = values.astype("datetime64[D]")
+            months = days.astype("datetime64[M]")
+            years = months.astype("datetime64[Y]")
+            out = ((years.astype(np.float64) + 1970) * 10000 +
+                   (months - years).astype(np.float64) * 100 + 100 +
+                   (days - months).astype(np.float64) + 1)
+            return np.where(np.isnat(values), np.nan, out)
+        if values.dtype == object:
+            return np.full(len(values), np.nan)
+        return values.astype(np.float64)
+
+    def send_signal(self, signal, mask=None, **kwargs):
+        """Send signal to the fields selected by mask. Keyword arguments given as
+        an array of shape (N,) are passed with the value for each field.
+
+        The IRRIGATE, APPLY_NPK and CROP_HARVEST signals are supported.
+        """
+        idx = self._field_indices(mask)
+
+        def field_values(value, fields):
+            if np.ndim(value) > 0:
+                return np.broadcast_to(value, (self.n,))[fields]
+            return value
+
+        if signal == signals.irrigate:
+            soil = idx[self._soil_present[idx]]
+            self.soil.irrigate(soil, field_values(kwargs["amount"], soil),
+                               field_values(kwargs.get("efficiency", 1.0), soil))
+        elif signal == signals.apply_npk:
+            soil = idx[self._soil_present[idx]]
+            self.soil.apply_npk(soil, **{k: field_values(v, soil) for k, v in kwargs.items()})
+        elif signal == signals.crop_harvest:
+            crop = idx[self._crop_present[idx]]
+            finished = self.crop.harvest(crop, field_values(kwargs.get("efficiency", 1.0), crop))
+            self._finish_crops(finished, "harvest")
+        else:
+            msg = "Signal %s cannot be sent to a batch of fields." % signal
+            raise exc.PCSEError(msg)
+
+    def irrigate(self, amount, efficiency=1.0, mask=None):
+        """Irrigate the fields selected by mask with amount (cm).
+        """
+        self.send_signal(signals.irrigate, mask=mask, amount=amount, efficiency=efficiency)
+
+    def apply_npk(self, mask=None, **kwargs):
+        """Apply fertilizer to the fields selected by mask. Takes the keyword
+        arguments of the APPLY_NPK signal (N_amount, N_recovery, etc).
+        """
+        self.send_signal(signals.apply_npk, mask=mask, **kwargs)
+
+    def harvest(self, efficiency=1.0, mask=None):
+        """Harvest the storage organs of the crops of the fields selected by
+        mask. Crops with CROP_END_TYPE "harvest" are finished.
+        """
+        self.send_signal(signals.crop_harvest, mask=mask, efficiency=efficiency)
+
+    def get_variable(self, varname:str):
+        """Returns an array with the value of varname for each field. Values
+        that are not available (e.g. no crop present) are NaN, or NaT and None
+        for dates and other values.
+
+        As in `Engine`, the variables of a crop or soil that has been removed
+        are available as long as their value is in the VariableKiosk, see
+        `BatchWofost80.published()` and `BatchSoil.published()`.
+        """
+        for name in (varname, varname.upper()):
+            for component, present, stale in ((self.crop, self._crop_present, self._crop_stale),
+                                              (self.soil, self._soil_present, self._soil_stale)):
+                values = component.get_variable(name)
+                if values is None:
+                    continue
+                visible = present
+                if stale.any():
+                    visible = present | (stale & component.published(name))
+                return self._mask(values, visible)
+        return np.full(self.n, np.nan)
+
+    @staticmethod
+    def _mask(values, visible):
+        """Returns a copy of values with the values of the fields that are
+        not visible replaced by NaN, NaT or None.
+        """
+        if values.dtype == object:
+            missing = None
+        elif np.issubdtype(values.dtype, np.datetime64):
+            missing = np.datetime64("NaT")
+        else:
+            missing = np.nan
+        return np.where(visible, values, missing)
+
+    def get_variables(self, varnames:list):
+        """Returns an array of shape (N, len(varnames)) with the value of each
+        of varnames for each field.
+        """
+        return np.stack([self.get_variable(v) for v in varnames], axis=1)
+
+    def set_output_buffer(self, varnames:list):
+        """Writes the values of `varnames` into a preallocated float array of
+        shape (N, len(varnames)) at each OUTPUT signal of a field.
+
+        The row of a field is overwritten at every OUTPUT signal of that field
+        and can be retrieved with `get_output_buffer()`, the day of the values
+        with `get_output_day()`. Dates are stored as YYYYMMDD and values that
+        are not available or not numbers as NaN.
+        """
+        self._output_buffer_vars = list(varnames)
+        self._output_buffer = np.full((self.n, len(self._output_buffer_vars)), np.nan)
+        self._output_day = np.full(self.n, np.datetime64("NaT"), dtype="datetime64[D]")
+        return self._output_buffer
+
+    def get_output_buffer(self):
+        """Returns the output buffer set with `set_output_buffer()`, or None.
+        """
+        return self._output_buffer
+
+    def get_output_day(self):
+        """Returns an array of datetime64 with the day on which the output
+        buffer was last written for each field.
+        """
+        return self._output_day
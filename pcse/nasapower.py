@@ -12,8 +12,12 @@ import pandas as pd
 import requests
 import logging
 import pickle
+import json
+import threading
+import zlib
+from collections import OrderedDict
 
-from .util import reference_ET, check_angstromAB
+from .util import reference_ET_array, check_angstromAB, get_astro_table, astro_nt
 from .utils import exceptions as exc
 from math import exp
 
@@ -52,6 +56,20 @@ def ea_from_tdew(tdew):
     tmp = (17.27 * tdew) / (tdew + 237.3)
     ea = 0.6108 * exp(tmp)
     return ea
+
+
+def ea_from_tdew_array(tdew):
+    """Array version of `ea_from_tdew()`, returns actual vapour pressure
+    [kPa] for an array of dewpoint temperatures [deg C].
+    """
+    tdew = np.asarray(tdew, dtype=np.float64)
+    out_of_range = (tdew < -95.0) | (tdew > 65.0)
+    if out_of_range.any():
+        msg = 'tdew=%g is not in range -95 to +60 deg C' % tdew[out_of_range][0]
+        raise ValueError(msg)
+
+    tmp = (17.27 * tdew) / (tdew + 237.3)
+    return 0.6108 * np.exp(tmp)
  
 class SlotPickleMixin(object):
     """This mixin makes it possible to pickle/unpickle objects with __slots__ defined.
@@ -218,6 +236,54 @@ class WeatherDataContainer(SlotPickleMixin):
         msg += ("Elevation (ELEV): %6.1f m.\n" % self.ELEV)
         return msg
 
+    @classmethod
+    def from_arrays(cls, DAY, LAT, LON, ELEV, **variables):
+        """Create WeatherDataContainers for a sequence of days at one site.
+
+        :param DAY: sequence of dates
+        :param LAT, LON, ELEV: site variables
+        :param variables: arrays with the values of the weather variables,
+            one value for each day
+
+        The values are range checked for all days at once, which is much
+        faster than creating the containers one by one.
+        """
+        site = {"LAT": float(LAT), "LON": float(LON), "ELEV": float(ELEV)}
+        for varname, value in site.items():
+            vmin, vmax = cls.ranges[varname]
+            if not vmin <= value <= vmax:
+                msg = "Value (%s) for meteo variable '%s' outside allowed range (%s, %s)." % (
+                    value, varname, vmin, vmax)
+                raise exc.PCSEError(msg)
+
+        columns = {}
+        for varname, values in variables.items():
+            if varname not in cls.__slots__:
+                msg = "WeatherDataContainer: unknown keywords '%s' are ignored!"
+                logging.warning(msg, varname)
+                continue
+            values = np.asarray(values, dtype=np.float64)
+            vmin, vmax = cls.ranges[varname]
+            invalid = ~((vmin <= values) & (values <= vmax))
+            if invalid.any():
+                msg = "Value (%s) for meteo variable '%s' outside allowed range (%s, %s)." % (
+                    values[invalid][0], varname, vmin, vmax)
+                raise exc.PCSEError(msg)
+            columns[varname] = values.tolist()
+
+        setter = object.__setattr__
+        names = list(columns)
+        wdcs = []
+        for day, row in zip(DAY, zip(*columns.values())):
+            wdc = cls.__new__(cls)
+            for varname, value in site.items():
+                setter(wdc, varname, value)
+            setter(wdc, "DAY", day)
+            for varname, value in zip(names, row):
+                setter(wdc, varname, value)
+            wdcs.append(wdc)
+        return wdcs
+
     def add_variable(self, varname, value, unit):
         """Adds an attribute <varname> with <value> and given <unit>
 
@@ -231,12 +297,279 @@ class WeatherDataContainer(SlotPickleMixin):
         setattr(self, varname, value)
 
 
+class ColumnarWeatherStore(object):
+    """Column oriented copy of the weather data of a WeatherDataProvider.
+
+    :param first_date: date of the first day in the store
+    :param data: array of shape (len(variables), ndays) with the values of
+        the weather variables for consecutive days, NaN where missing
+    :param available: boolean array of length ndays, True for days with data
+    :param site: tuple of (LAT, LON, ELEV)
+
+    Each weather variable is stored as one contiguous float array indexed by
+    the offset of the day ordinal to the first date. Date ranges can be
+    retrieved as zero-copy slices with `get_range()` and `day_view()` returns
+    a lightweight WeatherDayView for a single day that can be used in place
+    of a WeatherDataContainer.
+
+    The driving variables derived from the weather data (TEMP where missing,
+    DTEMP, the running averages of TMIN and the astronomical variables) are
+    computed once for all days with `drivers()`, the day views only index
+    this table.
+    """
+    variables = ("TMIN", "TMAX", "TEMP", "IRRAD", "RAIN", "WIND", "VAP", "E0", "ES0", "ET0")
+    # Length of the window for the running average of TMIN
+    TMINRA_DAYS = 7
+    # Rows of the driver table
+    driver_variables = variables + ("DTEMP",) + \
+        tuple("TMINRA%i" % i for i in range(1, TMINRA_DAYS + 1)) + astro_nt._fields
+
+    def __init__(self, first_date, data, available, site):
+        self.first_date = first_date
+        self.start = first_date.toordinal()
+        self.data = np.ascontiguousarray(data, dtype=np.float64)
+        self.available = np.asarray(available, dtype=bool)
+        self.ndays = self.data.shape[1]
+        self.LAT, self.LON, self.ELEV = site
+        self.columns = {v: self.data[i] for i, v in enumerate(self.variables)}
+        self._drivers = None
+
+    @classmethod
+    def from_provider(cls, provider):
+        """Build the store from the WeatherDataContainers of a
+        WeatherDataProvider, ensemble members other than 0 are ignored.
+        """
+        return cls.from_store(provider.store)
+
+    @classmethod
+    def from_store(cls, store):
+        """Build the store from a dict of WeatherDataContainers keyed by
+        (date, member_id) as used by WeatherDataProvider.store.
+        """
+        days = [day for (day, member_id) in store if member_id == 0]
+        if not days:
+            msg = "No weather data available to build a columnar store."
+            raise exc.WeatherDataProviderError(msg)
+        first_date = min(days)
+        start = first_date.toordinal()
+        ndays = max(days).toordinal() - start + 1
+
+        data = np.full((len(cls.variables), ndays), np.nan)
+        available = np.zeros(ndays, dtype=bool)
+        site = None
+        for (day, member_id), wdc in store.items():
+            if member_id != 0:
+                continue
+            i = day.toordinal() - start
+            available[i] = True
+            for j, varname in enumerate(cls.variables):
+                data[j, i] = getattr(wdc, varname, np.nan)
+            if site is None:
+                site = (wdc.LAT, wdc.LON, wdc.ELEV)
+        return cls(first_date, data, available, site)
+
+    @property
+    def last_date(self):
+        return self.first_date + dt.timedelta(days=self.ndays - 1)
+
+    @property
+    def nbytes(self):
+        nbytes = self.data.nbytes + self.available.nbytes
+        if self._drivers is not None:
+            nbytes += self._drivers.nbytes
+        return nbytes
+
+    def index(self, day):
+        """Return the column index of day, raises WeatherDataProviderError if
+        there is no weather data for that day.
+        """
+        i = day.toordinal() - self.start
+        if not (0 <= i < self.ndays and self.available[i]):
+            msg = "No weather data for %s." % day
+            raise exc.WeatherDataProviderError(msg)
+        return i
+
+    def __contains__(self, day):
+        i = day.toordinal() - self.start
+        return 0 <= i < self.ndays and bool(self.available[i])
+
+    def get_range(self, varname, start, end):
+        """Return the values of varname from start up to and including end as
+        a read-only view on the column.
+
+        Days without weather data in the range are NaN.
+        """
+        i = start.toordinal() - self.start
+        j = end.toordinal() - self.start + 1
+        if i < 0 or j > self.ndays or i >= j:
+            msg = "No weather data for range %s - %s." % (start, end)
+            raise exc.WeatherDataProviderError(msg)
+        view = self.columns[varname][i:j]
+        view.flags.writeable = False
+        return view
+
+    def day_view(self, day):
+        """Return a WeatherDayView with the weather data of day.
+        """
+        return WeatherDayView(self, self.index(day), day)
+
+    @property
+    def day_of_year(self):
+        """Array with the day-of-year of each day in the store.
+        """
+        days = np.arange(self.start, self.start + self.ndays) - dt.date(1970, 1, 1).toordinal()
+        days = days.astype("datetime64[D]")
+        return (days - days.astype("datetime64[Y]").astype("datetime64[D]")).astype(int) + 1
+
+    def astro(self):
+        """Returns an array of shape (len(astro_nt._fields), ndays) with the
+        results of `pcse.util.astro()` for every day in the store, computed
+        in batch from the AstroTable of the site latitude and the radiation.
+        """
+        return self.drivers()[-len(astro_nt._fields):]
+
+    def tmin_running_average(self):
+        """Returns an array of shape (TMINRA_DAYS, ndays) where row k-1 holds
+        the average TMIN over the last k days, NaN where the window extends
+        before the first day in the store.
+
+        The values are summed from the most recent day backwards so that they
+        are identical to the running average kept by WOFOST_Assimilation.
+        """
+        tmin = self.columns["TMIN"]
+        total = tmin.copy()
+        tminra = np.full((self.TMINRA_DAYS, self.ndays), np.nan)
+        tminra[0] = tmin
+        for k in range(1, self.TMINRA_DAYS):
+            total[k:] += tmin[:-k]
+            total[:k] = np.nan
+            tminra[k] = total / (k + 1)
+        return tminra
+
+    def drivers(self):
+        """Returns the driver table: an array of shape
+        (len(driver_variables), ndays) with the weather variables and the
+        driving variables derived from them for every day in the store.
+
+        The table is computed on first use and kept with the store so that it
+        is shared by all simulations that use the same weather data.
+        """
+        if self._drivers is None:
+            TMIN, TMAX = self.columns["TMIN"], self.columns["TMAX"]
+            TEMP = self.columns["TEMP"]
+            TEMP = np.where(np.isnan(TEMP), (TMIN + TMAX)/2., TEMP)
+            DTEMP = (TEMP + TMAX)/2.
+
+            table = get_astro_table(self.LAT)
+            astro = table.astro_columns(self.day_of_year, self.columns["IRRAD"])
+
+            drivers = np.empty((len(self.driver_variables), self.ndays))
+            nvars = len(self.variables)
+            drivers[:nvars] = self.data
+            drivers[self.variables.index("TEMP")] = TEMP
+            drivers[nvars] = DTEMP
+            drivers[nvars + 1:nvars + 1 + self.TMINRA_DAYS] = self.tmin_running_average()
+            drivers[nvars + 1 + self.TMINRA_DAYS:] = astro
+            self._drivers = drivers
+        return self._drivers
+
+
+class WeatherDayView(object):
+    """Weather data of a single day taken from a ColumnarWeatherStore.
+
+    Provides the same attributes as a WeatherDataContainer. Variables that
+    are missing for the day are not set, so `hasattr()` can be used to check
+    for them as with a WeatherDataContainer. Derived variables can be
+    added with `add_variable()`; they are kept on the view only.
+
+    The derived driving variables are taken from the driver table of the
+    store: TEMP and DTEMP are always set, TMINRA is a tuple with the average
+    TMIN over the last 1..7 days and ASTRO holds the results of
+    `pcse.util.astro()` for the day, see `pcse.util.drv_astro()`.
+    """
+    __slots__ = ColumnarWeatherStore.variables + \
+        ("DTEMP", "TMINRA", "LAT", "LON", "ELEV", "DAY", "ASTRO", "__dict__")
+
+    def __init__(self, store, index, day):
+        self.DAY = day
+        self.LAT = store.LAT
+        self.LON = store.LON
+        self.ELEV = store.ELEV
+        # A single tolist() is much faster than indexing the columns one
+        # element at a time
+        values = store.drivers()[:, index].tolist()
+        nvars = len(store.variables)
+        for varname, value in zip(store.variables, values[:nvars]):
+            if value == value:  # skip NaN
+                setattr(self, varname, value)
+        self.DTEMP = values[nvars]
+        self.TMINRA = tuple(values[nvars + 1:nvars + 1 + store.TMINRA_DAYS])
+        self.ASTRO = astro_nt(*values[nvars + 1 + store.TMINRA_DAYS:])
+
+    def add_variable(self, varname, value, unit):
+        """Adds an attribute <varname> with <value>, the unit is ignored.
+        """
+        setattr(self, varname, value)
+
+
+class WeatherBatchView(object):
+    """Weather data of a batch of fields, each on its own day, taken from
+    the driver tables of ColumnarWeatherStores.
+
+    :param stores: list with the ColumnarWeatherStore of each field
+    :param days: array with the day ordinal of each field
+    :param idx: indices of the fields to gather, all fields when None
+
+    Every driver variable of the stores (see
+    `ColumnarWeatherStore.driver_variables`) is an attribute holding an array
+    of shape (N,) with its value for each field, except TMINRA which is an
+    array of shape (TMINRA_DAYS, N) with the average TMIN over the last
+    1..7 days. Missing weather variables and fields not in idx are NaN.
+    Fields sharing a store are gathered with a single fancy index on its
+    driver table.
+    """
+
+    def __init__(self, stores:list, days, idx=None):
+        days = np.asarray(days)
+        if idx is None:
+            idx = range(len(days))
+        table = np.full((len(ColumnarWeatherStore.driver_variables), len(days)), np.nan)
+        groups = {}
+        for i in idx:
+            store = stores[i]
+            groups.setdefault(id(store), (store, []))[1].append(i)
+        for store, fields in groups.values():
+            fields = np.array(fields)
+            index = days[fields] - store.start
+            ok = (index >= 0) & (index < store.ndays)
+            ok[ok] = store.available[index[ok]]
+            if not ok.all():
+                day = dt.date.fromordinal(int(days[fields[~ok][0]]))
+                msg = "No weather data for %s." % day
+                raise exc.WeatherDataProviderError(msg)
+            table[:, fields] = store.drivers()[:, index]
+        self.table = table
+
+        nvars = len(ColumnarWeatherStore.variables)
+        ndays = ColumnarWeatherStore.TMINRA_DAYS
+        for i, varname in enumerate(ColumnarWeatherStore.variables):
+            setattr(self, varname, table[i])
+        self.DTEMP = table[nvars]
+        self.TMINRA = table[nvars + 1:nvars + 1 + ndays]
+        for i, varname in enumerate(astro_nt._fields):
+            setattr(self, varname, table[nvars + 1 + ndays + i])
+
+
 class WeatherDataProvider(object):
     """Base class for all weather data providers.
 
     Support for weather ensembles in a WeatherDataProvider has to be indicated
     by setting the class variable `supports_ensembles = True`
 
+    Providers that hold their weather data only in a ColumnarWeatherStore,
+    without WeatherDataContainers in self.store, serve all requests from the
+    columnar store.
+
     Example::
 
         class MyWeatherDataProviderWithEnsembles(WeatherDataProvider):
@@ -260,9 +593,21 @@ class WeatherDataProvider(object):
     angstB = None
     # model used for reference ET
     ETmodel = "PM"
+    # Columnar copy of self.store, built on first use
+    _columnar = None
+    # Frozen providers are shared and reject new weather data
+    _frozen = False
 
     def __init__(self):
         self.store = {}
+        self._columnar = None
+        self._frozen = False
+
+    @property
+    def _columnar_only(self):
+        """True if the weather data are only available in the columnar store.
+        """
+        return not self.store and self._columnar is not None
 
     @property
     def logger(self):
@@ -296,6 +641,7 @@ class WeatherDataProvider(object):
             raise exc.PCSEError(msg)
 
         self.store.update(store)
+        self._columnar = None
 
     def export(self):
         """Exports the contents of the WeatherDataProvider as a list of dictionaries.
@@ -307,6 +653,12 @@ class WeatherDataProvider(object):
         if self.supports_ensembles:
             # We have to include the member_id in each dict with weather data
             pass
+        elif self._columnar_only:
+            store = self._columnar
+            keys = ("LAT", "LON", "ELEV", "DAY") + store.variables
+            for i in np.flatnonzero(store.available):
+                wdv = self.day_view(store.first_date + dt.timedelta(days=int(i)))
+                weather_data.append({key: getattr(wdv, key) for key in keys if hasattr(wdv, key)})
         else:
             days = sorted([r[0] for r in self.store.keys()])
             for day in days:
@@ -317,6 +669,9 @@ class WeatherDataProvider(object):
 
     @property
     def first_date(self):
+        if self._columnar_only:
+            store = self._columnar
+            return store.first_date + dt.timedelta(days=int(np.argmax(store.available)))
         try:
             self._first_date = min(self.store)[0]
         except ValueError:
@@ -325,6 +680,9 @@ class WeatherDataProvider(object):
 
     @property
     def last_date(self):
+        if self._columnar_only:
+            store = self._columnar
+            return store.last_date - dt.timedelta(days=int(np.argmax(store.available[::-1])))
         try:
             self._last_date = max(self.store)[0]
         except ValueError:
@@ -333,11 +691,19 @@ class WeatherDataProvider(object):
 
     @property
     def missing(self):
+        if self._columnar_only:
+            return (self.last_date - self.first_date).days - int(self._columnar.available.sum()) + 1
         missing = (self.last_date - self.first_date).days - len(self.store) + 1
         return missing
 
     @property
     def missing_days(self):
+        if self._columnar_only:
+            store = self._columnar
+            start = (self.first_date - store.first_date).days
+            stop = (self.last_date - store.first_date).days
+            return [store.first_date + dt.timedelta(days=int(i))
+                    for i in np.flatnonzero(~store.available[start:stop]) + start]
         numdays = (self.last_date - self.first_date).days
         all_days = {self.first_date + dt.timedelta(days=i) for i in range(numdays)}
         avail_days = {t[0] for t in self.store.keys()}
@@ -379,6 +745,9 @@ class WeatherDataProvider(object):
         """Stores the WDC under given keydate and member_id.
         """
 
+        if self._frozen:
+            msg = "Cannot store weather data in a frozen %s." % self.__class__.__name__
+            raise exc.WeatherDataProviderError(msg)
         if member_id != 0 and self.supports_ensembles is False:
             msg = "Storing ensemble weather is not supported."
             raise exc.WeatherDataProviderError(msg)
@@ -389,6 +758,37 @@ class WeatherDataProvider(object):
             raise exc.WeatherDataProviderError(msg)
 
         self.store[(kd, member_id)] = wdc
+        self._columnar = None
+
+    def freeze(self):
+        """Makes the provider immutable so that it can be shared, e.g. by
+        the WeatherDataRegistry. Also builds the columnar store.
+        """
+        self.columnar_store()
+        self._frozen = True
+
+    @property
+    def frozen(self):
+        return self._frozen
+
+    def columnar_store(self):
+        """Returns a ColumnarWeatherStore with the weather data of this
+        provider. It is built on first use and rebuilt after the data change.
+        """
+        if self._columnar is None:
+            self._columnar = ColumnarWeatherStore.from_provider(self)
+        return self._columnar
+
+    def day_view(self, day, member_id=0):
+        """Returns the weather data for day as a WeatherDayView from the
+        columnar store. Falls back to `__call__()` for providers that support
+        ensembles.
+        """
+        if self.supports_ensembles:
+            return self(day, member_id)
+        if type(day) is not dt.date:
+            day = self.check_keydate(day)
+        return self.columnar_store().day_view(day)
 
     def __call__(self, day, member_id=0):
 
@@ -397,6 +797,8 @@ class WeatherDataProvider(object):
             raise exc.WeatherDataProviderError(msg)
 
         keydate = self.check_keydate(day)
+        if self.supports_ensembles is False and self._columnar_only:
+            return self.day_view(keydate)
         if self.supports_ensembles is False:
             msg = "Retrieving weather data for day %s" % keydate
             self.logger.debug(msg)
@@ -434,6 +836,109 @@ class WeatherDataProvider(object):
 
 
 
+def get_grid_cell(latitude, longitude):
+    """Returns the 0.1 degree grid cell of latitude/longitude as used in the
+    names of the NASA POWER cache files, e.g. LAT00525_LON-1247 for lat/lon
+    52.56/-124.78.
+    """
+    return "LAT%05i_LON%05i" % (int(latitude*10), int(longitude*10))
+
+
+class WeatherCacheFile(object):
+    """Binary cache file with the weather data of a single site.
+
+    The file starts with an 8 byte magic number, the format version and the
+    length of a JSON header as little endian uint32. The header holds the
+    site metadata (latitude, longitude, elevation, description, ETmodel and
+    Angstrom coefficients), the weather variables, the first day and the
+    number of days together with the size and CRC32 checksum of the payload.
+    The payload is the zlib compressed float64 array of shape
+    (len(variables), ndays) followed by a uint8 array flagging the days with
+    data, as in a ColumnarWeatherStore.
+
+    A cache file is read with a single read and decoded into a
+    ColumnarWeatherStore without creating WeatherDataContainers.
+    """
+    MAGIC = b"PCSEWXC\x00"
+    VERSION = 1
+    extension = ".wcache"
+
+    @classmethod
+    def write(cls, fname, store, meta):
+        """Writes the ColumnarWeatherStore store and the site metadata meta
+        (a dict with description, ETmodel, angstA and angstB) to fname.
+
+        The file is written to a temporary file first and then moved into
+        place so that concurrent readers never see a partial file.
+        """
+        payload = zlib.compress(store.data.astype("<f8").tobytes() +
+                                store.available.astype(np.uint8).tobytes())
+        header = {"version": cls.VERSION,
+                  "variables": list(store.variables),
+                  "first_date": store.start,
+                  "ndays": store.ndays,
+                  "site": [store.LAT, store.LON, store.ELEV],
+                  "description": list(meta["description"]),
+                  "ETmodel": meta["ETmodel"],
+                  "angstA": meta["angstA"],
+                  "angstB": meta["angstB"],
+                  "compression": "zlib",
+                  "nbytes": len(payload),
+                  "crc32": zlib.crc32(payload)}
+        header = json.dumps(header).encode("utf-8")
+
+        tmp_fname = "%s.%i.tmp" % (fname, os.getpid())
+        with open(tmp_fname, "wb") as fp:
+            fp.write(cls.MAGIC)
+            fp.write(np.array([cls.VERSION, len(header)], dtype="<u4").tobytes())
+            fp.write(header)
+            fp.write(payload)
+        os.replace(tmp_fname, fname)
+
+    @classmethod
+    def read(cls, fname):
+        """Reads fname and returns a tuple (store, meta) with the
+        ColumnarWeatherStore and the site metadata.
+
+        Raises a WeatherDataProviderError if the file is not a weather cache
+        file, has an unsupported version or fails the integrity checks.
+        """
+        with open(fname, "rb") as fp:
+            buf = fp.read()
+
+        n = len(cls.MAGIC)
+        if buf[:n] != cls.MAGIC or len(buf) < n + 8:
+            msg = "File '%s' is not a weather cache file." % fname
+            raise exc.WeatherDataProviderError(msg)
+        version, header_length = np.frombuffer(buf, dtype="<u4", count=2, offset=n).tolist()
+        if version != cls.VERSION:
+            msg = "Unsupported version %i of weather cache file '%s'." % (version, fname)
+            raise exc.WeatherDataProviderError(msg)
+        try:
+            header = json.loads(buf[n + 8:n + 8 + header_length].decode("utf-8"))
+        except ValueError as e:
+            msg = "Corrupt header in weather cache file '%s': %s" % (fname, e)
+            raise exc.WeatherDataProviderError(msg)
+
+        payload = buf[n + 8 + header_length:]
+        if len(payload) != header["nbytes"] or zlib.crc32(payload) != header["crc32"]:
+            msg = "Checksum mismatch in weather cache file '%s'." % fname
+            raise exc.WeatherDataProviderError(msg)
+        if tuple(header["variables"]) != ColumnarWeatherStore.variables:
+            msg = "Weather variables in cache file '%s' do not match %s." % \
+                  (fname, ColumnarWeatherStore.variables)
+            raise exc.WeatherDataProviderError(msg)
+
+        payload = zlib.decompress(payload)
+        nvars, ndays = len(ColumnarWeatherStore.variables), header["ndays"]
+        data = np.frombuffer(payload, dtype="<f8", count=nvars*ndays).reshape(nvars, ndays)
+        available = np.frombuffer(payload, dtype=np.uint8, count=ndays, offset=data.nbytes)
+        store = ColumnarWeatherStore(dt.date.fromordinal(header["first_date"]), data,
+                                     available, tuple(header["site"]))
+        meta = {k: header[k] for k in ("description", "ETmodel", "angstA", "angstB")}
+        return store, meta
+
+
 class NASAPowerWeatherDataProvider(WeatherDataProvider):
     """WeatherDataProvider for using the NASA POWER database with PCSE
 
@@ -462,9 +967,11 @@ class NASAPowerWeatherDataProvider(WeatherDataProvider):
     The `NASAPowerWeatherDataProvider` retrieves the weather from the
     th NASA POWER API and does the necessary conversions to be compatible
     with PCSE. After the data has been retrieved and stored, the contents
-    are dumped to a binary cache file. If another request is made for the
-    same location, the cache file is loaded instead of a full request to the
-    NASA Power server.
+    are dumped to a binary cache file (see `WeatherCacheFile`). If another
+    request is made for the same location, the cache file is loaded instead
+    of a full request to the NASA Power server. Weather loaded from a cache
+    file is only held in a ColumnarWeatherStore. Legacy pickled cache files
+    are still read and are converted to the binary format on first use.
 
     Cache files are used until they are older then 90 days. After 90 days
     the NASAPowerWeatherDataProvider will make a new request to obtain
@@ -487,6 +994,11 @@ class NASAPowerWeatherDataProvider(WeatherDataProvider):
     HTTP_OK = 200
     angstA = 0.29
     angstB = 0.49
+    # URL of the POWER daily point API, can be pointed to a local stand-in
+    # server, see pcse.powerserver
+    power_url = "https://power.larc.nasa.gov/api/temporal/daily/point"
+    # First day with data in the POWER database
+    power_start_date = dt.date(1983, 7, 1)
 
     def __init__(self, latitude, longitude, force_update=False, ETmodel="PM"):
 
@@ -546,10 +1058,28 @@ class NASAPowerWeatherDataProvider(WeatherDataProvider):
                     msg = "Outdated cache file failed loading."
                     raise exc.PCSEError(msg)
 
+    @classmethod
+    def from_POWER_data(cls, latitude, longitude, powerdata, ETmodel="PM"):
+        """Creates the provider from a response of the POWER API, e.g. one
+        retrieved by pcse.prefetch, and writes it to the cache file.
+        """
+        provider = cls.__new__(cls)
+        WeatherDataProvider.__init__(provider)
+        provider.latitude = float(latitude)
+        provider.longitude = float(longitude)
+        provider.ETmodel = ETmodel
+        provider._process_NASAPower(powerdata, provider.latitude, provider.longitude)
+        return provider
+
     def _get_and_process_NASAPower(self, latitude, longitude):
         """Handles the retrieval and processing of the NASA Power data
         """
         powerdata = self._query_NASAPower_server(latitude, longitude)
+        self._process_NASAPower(powerdata, latitude, longitude)
+
+    def _process_NASAPower(self, powerdata, latitude, longitude):
+        """Processes the POWER data and dumps them to the cache file
+        """
         if not powerdata:
             msg = "Failure retrieving POWER data from server. This can be a connection problem with " \
                   "the NASA POWER server, retry again later."
@@ -567,7 +1097,7 @@ class NASAPowerWeatherDataProvider(WeatherDataProvider):
         df_pcse = self._POWER_to_PCSE(df_power)
 
         # Start building the weather data containers
-        self._make_WeatherDataContainers(df_pcse.to_dict(orient="records"))
+        self._make_WeatherDataContainers(df_pcse)
 
         # dump contents to a cache file
         cache_filename = self._get_cache_filename(latitude, longitude)
@@ -624,24 +1154,11 @@ class NASAPowerWeatherDataProvider(WeatherDataProvider):
         """Query the NASA Power server for data on given latitude/longitude
         """
 
-        start_date = dt.date(1983,7,1)
-        end_date = dt.date.today()
-
         # build URL for retrieving data, using new NASA POWER api
-        server = "https://power.larc.nasa.gov/api/temporal/daily/point"
-        payload = {"request": "execute",
-                   "parameters": ",".join(self.power_variables),
-                   "latitude": latitude,
-                   "longitude": longitude,
-                   "start": start_date.strftime("%Y%m%d"),
-                   "end": end_date.strftime("%Y%m%d"),
-                   "community": "AG",
-                   "format": "JSON",
-                   "user": "anonymous"
-                   }
+        payload = self.power_payload(latitude, longitude)
         msg = "Starting retrieval from NASA Power"
         self.logger.debug(msg)
-        req = requests.get(server, params=payload)
+        req = requests.get(self.power_url, params=payload)
 
         if req.status_code != self.HTTP_OK:
             msg = ("Failed retrieving POWER data, server returned HTTP " +
@@ -652,34 +1169,83 @@ class NASAPowerWeatherDataProvider(WeatherDataProvider):
         self.logger.debug(msg)
         return req.json()
 
+    @classmethod
+    def power_payload(cls, latitude, longitude, start_date=None, end_date=None):
+        """Returns the query parameters of a POWER API request for the
+        weather from start_date up to end_date, by default the full record.
+        """
+        start_date = cls.power_start_date if start_date is None else start_date
+        end_date = dt.date.today() if end_date is None else end_date
+        return {"request": "execute",
+                "parameters": ",".join(cls.power_variables),
+                "latitude": latitude,
+                "longitude": longitude,
+                "start": start_date.strftime("%Y%m%d"),
+                "end": end_date.strftime("%Y%m%d"),
+                "community": "AG",
+                "format": "JSON",
+                "user": "anonymous"
+                }
+
     def _find_cache_file(self, latitude, longitude):
         """Try to find a cache file for given latitude/longitude.
 
         Returns None if the cache file does not exist, else it returns the full path
-        to the cache file.
+        to the cache file. Falls back to the legacy pickled cache file.
         """
-        cache_filename = self._get_cache_filename(latitude, longitude)
-        if os.path.exists(cache_filename):
-            return cache_filename
-        else:
-            return None
+        for cache_filename in (self._get_cache_filename(latitude, longitude),
+                               self._get_legacy_cache_filename(latitude, longitude)):
+            if os.path.exists(cache_filename):
+                return cache_filename
+        return None
 
     def _get_cache_filename(self, latitude, longitude):
         """Constructs the filename used for cache files given latitude and longitude
 
         The latitude and longitude is coded into the filename by truncating on
         0.1 degree. So the cache filename for a point with lat/lon 52.56/-124.78 will be:
+        NASAPowerWeatherDataProvider_LAT00525_LON-1247.wcache
+        """
+        return self._get_legacy_cache_filename(latitude, longitude)[:-len(".cache")] + \
+            WeatherCacheFile.extension
+
+    def _get_legacy_cache_filename(self, latitude, longitude):
+        """Constructs the filename of the legacy pickled cache files, e.g.
         NASAPowerWeatherDataProvider_LAT00525_LON-1247.cache
         """
 
         PCSE_USER_HOME = os.path.join(os.getcwd(), ".pcse")
         METEO_CACHE_DIR = os.path.join(PCSE_USER_HOME, "meteo_cache")
 
-        fname = "%s_LAT%05i_LON%05i.cache" % (self.__class__.__name__,
-                                              int(latitude*10), int(longitude*10))
+        fname = "%s_%s.cache" % (self.__class__.__name__, get_grid_cell(latitude, longitude))
         cache_filename = os.path.join(METEO_CACHE_DIR, fname)
         return cache_filename
 
+    def _dump(self, cache_fname):
+        """Dumps the weather data and site metadata into cache_fname as a
+        WeatherCacheFile.
+        """
+        meta = {"description": self.description, "ETmodel": self.ETmodel,
+                "angstA": self.angstA, "angstB": self.angstB}
+        WeatherCacheFile.write(cache_fname, self.columnar_store(), meta)
+
+    def _load(self, cache_fname):
+        """Loads the weather data and site metadata from the WeatherCacheFile
+        cache_fname into the columnar store.
+        """
+        store, meta = WeatherCacheFile.read(cache_fname)
+        # Check if the reference ET from the cache file is calculated with the same model as
+        # specified by self.ETmodel
+        if meta["ETmodel"] != self.ETmodel:
+            msg = "Mismatch in reference ET from cache file."
+            raise exc.PCSEError(msg)
+
+        self.elevation = store.ELEV
+        self.description = meta["description"]
+        self.angstA, self.angstB = meta["angstA"], meta["angstB"]
+        self.store.clear()
+        self._columnar = store
+
     def _write_cache_file(self):
         """Writes the meteo data from NASA Power to a cache file.
         """
@@ -692,42 +1258,72 @@ class NASAPowerWeatherDataProvider(WeatherDataProvider):
 
     def _load_cache_file(self):
         """Loads the data from the cache file. Return True if successful.
+
+        Falls back to the legacy pickled cache file which is then migrated
+        to the binary format.
         """
         cache_filename = self._get_cache_filename(self.latitude, self.longitude)
+        legacy_filename = self._get_legacy_cache_filename(self.latitude, self.longitude)
+        if os.path.exists(cache_filename) or not os.path.exists(legacy_filename):
+            try:
+                self._load(cache_filename)
+                msg = "Cache file successfully loaded."
+                self.logger.debug(msg)
+                return True
+            except (IOError, EnvironmentError, EOFError, exc.WeatherDataProviderError) as e:
+                msg = "Failed to load cache from file '%s' due to: %s" % (cache_filename, e)
+                self.logger.warning(msg)
+                if not os.path.exists(legacy_filename):
+                    return False
+
         try:
-            self._load(cache_filename)
-            msg = "Cache file successfully loaded."
-            self.logger.debug(msg)
-            return True
-        except (IOError, EnvironmentError, EOFError) as e:
-            msg = "Failed to load cache from file '%s' due to: %s" % (cache_filename, e)
+            WeatherDataProvider._load(self, legacy_filename)
+        except (IOError, EnvironmentError, EOFError, pickle.UnpicklingError) as e:
+            msg = "Failed to load cache from file '%s' due to: %s" % (legacy_filename, e)
             self.logger.warning(msg)
             return False
+        msg = "Legacy cache file successfully loaded, converting to %s." % cache_filename
+        self.logger.debug(msg)
+        self._write_cache_file()
+        return True
 
-    def _make_WeatherDataContainers(self, recs):
-        """Create a WeatherDataContainers from recs, compute ET and store the WDC's.
+    def _make_WeatherDataContainers(self, df_pcse):
+        """Compute ET for all records in df_pcse, create and store the WDC's
+        and build the columnar store from the same arrays.
         """
+        # Reference evapotranspiration in mm/day
+        IDAY = pd.DatetimeIndex(df_pcse.DAY).dayofyear.values
+        E0, ES0, ET0 = reference_ET_array(IDAY, self.latitude, self.elevation, df_pcse.TMIN.values,
+                                          df_pcse.TMAX.values, df_pcse.IRRAD.values, df_pcse.VAP.values,
+                                          df_pcse.WIND.values, self.angstA, self.angstB, self.ETmodel)
+        invalid = ~(np.isfinite(E0) & np.isfinite(ES0) & np.isfinite(ET0))
+        if invalid.any():
+            rec = df_pcse[invalid].iloc[0].to_dict()
+            msg = (("Failed to calculate reference ET values on %s. " % rec["DAY"]) +
+                   ("With input values:\n %s.\n" % str(rec)))
+            raise exc.PCSEError(msg)
 
-        for rec in recs:
-            # Reference evapotranspiration in mm/day
-            try:
-                E0, ES0, ET0 = reference_ET(rec["DAY"], rec["LAT"], rec["ELEV"], rec["TMIN"], rec["TMAX"], rec["IRRAD"],
-                                            rec["VAP"], rec["WIND"], self.angstA, self.angstB, self.ETmodel)
-            except ValueError as e:
-                msg = (("Failed to calculate reference ET values on %s. " % rec["DAY"]) +
-                       ("With input values:\n %s.\n" % str(rec)) +
-                       ("Due to error: %s" % e))
-                raise exc.PCSEError(msg)
-
-            # update record with ET values value convert to cm/day
-            rec.update({"E0": E0/10., "ES0": ES0/10., "ET0": ET0/10.})
-
-            # Build weather data container from dict 't'
-            wdc = WeatherDataContainer(**rec)
+        # update records with ET values value convert to cm/day
+        df_pcse = df_pcse.assign(E0=E0/10., ES0=ES0/10., ET0=ET0/10.)
 
+        variables = {v: df_pcse[v].values for v in WeatherDataContainer.required + ["TEMP"]}
+        wdcs = WeatherDataContainer.from_arrays(df_pcse.DAY, self.latitude, self.longitude,
+                                                self.elevation, **variables)
+        for wdc in wdcs:
             # add wdc to dictionary for thisdate
             self._store_WeatherDataContainer(wdc, wdc.DAY)
 
+        # Columnar store directly from the arrays
+        offsets = np.array([day.toordinal() for day in df_pcse.DAY])
+        first = offsets.min()
+        offsets -= first
+        data = np.full((len(ColumnarWeatherStore.variables), offsets.max() + 1), np.nan)
+        data[:, offsets] = df_pcse[list(ColumnarWeatherStore.variables)].values.T
+        available = np.zeros(data.shape[1], dtype=bool)
+        available[offsets] = True
+        self._columnar = ColumnarWeatherStore(dt.date.fromordinal(int(first)), data, available,
+                                              (self.latitude, self.longitude, self.elevation))
+
     def _process_POWER_records(self, powerdata):
         """Process the meteorological records returned by NASA POWER
         """
@@ -757,13 +1353,359 @@ class NASAPowerWeatherDataProvider(WeatherDataProvider):
         df_pcse = pd.DataFrame({"TMAX": df_power.T2M_MAX,
                                 "TMIN": df_power.T2M_MIN,
                                 "TEMP": df_power.T2M,
-                                "IRRAD": df_power.ALLSKY_SFC_SW_DWN.apply(MJ_to_J),
-                                "RAIN": df_power.PRECTOTCORR.apply(mm_to_cm),
+                                "IRRAD": MJ_to_J(df_power.ALLSKY_SFC_SW_DWN),
+                                "RAIN": mm_to_cm(df_power.PRECTOTCORR),
                                 "WIND": df_power.WS2M,
-                                "VAP": df_power.T2MDEW.apply(tdew_to_hpa),
-                                "DAY": df_power.DAY.apply(to_date),
+                                "VAP": ea_from_tdew_array(df_power.T2MDEW.values) * 10.,
+                                "DAY": df_power.DAY.dt.date,
                                 "LAT": self.latitude,
                                 "LON": self.longitude,
                                 "ELEV": self.elevation})
 
         return df_pcse
+
+
+
+def get_archive_filename():
+    """Returns the filename of the weather archive in the meteo cache
+    directory.
+    """
+    PCSE_USER_HOME = os.path.join(os.getcwd(), ".pcse")
+    METEO_CACHE_DIR = os.path.join(PCSE_USER_HOME, "meteo_cache")
+    return os.path.join(METEO_CACHE_DIR, "NASAPowerWeatherDataProvider.archive")
+
+
+class WeatherArchive(object):
+    """Read-only archive with the weather data of many sites in one file.
+
+    :param fname: filename of the archive
+
+    The file starts with an 8 byte magic number and the length of a JSON
+    header as little endian uint64. The header holds the weather variables
+    and, for each site keyed by its 0.1 degree grid cell, the offset and
+    number of days of its data together with the site metadata. The data of
+    a site is a float64 array of shape (len(variables), ndays) followed by a
+    uint8 array flagging the days with data, starting at 64 byte aligned
+    offsets.
+
+    The file is opened with numpy.memmap so the weather data of all
+    processes that open the same archive share the pages in the page cache.
+    Archives are written with `write()` or from the NASA POWER cache files
+    with `convert_cache_files()`. Unlike the cache files, archives do not
+    expire.
+    """
+    MAGIC = b"PCSEWXA1"
+    ALIGN = 64
+
+    def __init__(self, fname):
+        self.fname = fname
+        with open(fname, "rb") as fp:
+            magic = fp.read(len(self.MAGIC))
+            if magic != self.MAGIC:
+                msg = "File '%s' is not a weather archive." % fname
+                raise exc.WeatherDataProviderError(msg)
+            header_length = int(np.frombuffer(fp.read(8), dtype="<u8")[0])
+            header = json.loads(fp.read(header_length).decode("utf-8"))
+
+        if tuple(header["variables"]) != ColumnarWeatherStore.variables:
+            msg = "Weather variables in archive '%s' do not match %s." % \
+                  (fname, ColumnarWeatherStore.variables)
+            raise exc.WeatherDataProviderError(msg)
+        self.sites = header["sites"]
+        self._mmap = np.memmap(fname, dtype=np.uint8, mode="r")
+        self._stores = {}
+
+    def __contains__(self, cell):
+        return cell in self.sites
+
+    def __len__(self):
+        return len(self.sites)
+
+    def columnar_store(self, cell):
+        """Returns a ColumnarWeatherStore on the memory mapped data of the
+        site in grid cell.
+        """
+        store = self._stores.get(cell)
+        if store is None:
+            site = self.sites[cell]
+            nvars, ndays = len(ColumnarWeatherStore.variables), site["ndays"]
+            offset = site["offset"]
+            data = np.frombuffer(self._mmap, dtype="<f8", count=nvars*ndays,
+                                 offset=offset).reshape(nvars, ndays)
+            available = np.frombuffer(self._mmap, dtype=np.uint8, count=ndays,
+                                      offset=offset + data.nbytes)
+            store = ColumnarWeatherStore(dt.date.fromordinal(site["first_date"]), data,
+                                         available, tuple(site["site"]))
+            self._stores[cell] = store
+        return store
+
+    @classmethod
+    def write(cls, fname, sites):
+        """Writes an archive with the given sites.
+
+        :param fname: filename of the archive, it is replaced atomically
+        :param sites: dict of grid cell: (ColumnarWeatherStore, metadata)
+            where metadata is a dict with the items description, ETmodel,
+            angstA and angstB of the site.
+        """
+        variables = ColumnarWeatherStore.variables
+        header = {"variables": list(variables), "sites": {}}
+        offsets = {}
+        offset = 0
+        for cell, (store, meta) in sites.items():
+            header["sites"][cell] = dict(meta, ndays=store.ndays,
+                                         first_date=store.first_date.toordinal(),
+                                         site=[store.LAT, store.LON, store.ELEV])
+            offsets[cell] = offset
+            offset += cls._aligned(store.data.nbytes + store.ndays)
+
+        # The data start after the header, whose length depends on the
+        # offsets of the data. Grow the space for the header until it fits.
+        start = 0
+        while True:
+            for cell, site in header["sites"].items():
+                site["offset"] = start + offsets[cell]
+            header_bytes = json.dumps(header).encode("utf-8")
+            header_end = len(cls.MAGIC) + 8 + len(header_bytes)
+            if header_end <= start:
+                break
+            start = cls._aligned(header_end)
+        header_bytes += b" " * (start - header_end)
+
+        tmp_fname = fname + ".tmp"
+        with open(tmp_fname, "wb") as fp:
+            fp.write(cls.MAGIC)
+            fp.write(np.array([len(header_bytes)], dtype="<u8").tobytes())
+            fp.write(header_bytes)
+            for cell, (store, meta) in sites.items():
+                fp.seek(header["sites"][cell]["offset"])
+                fp.write(store.data.astype("<f8").tobytes())
+                fp.write(store.available.astype(np.uint8).tobytes())
+        os.replace(tmp_fname, fname)
+
+    @classmethod
+    def _aligned(cls, nbytes):
+        return -(-nbytes // cls.ALIGN) * cls.ALIGN
+
+
+class ColumnarWeatherDataProvider(WeatherDataProvider):
+    """Frozen WeatherDataProvider serving the weather data of a
+    ColumnarWeatherStore.
+
+    :param store: the ColumnarWeatherStore
+    :param latitude: latitude of the provider
+    :param longitude: longitude of the provider
+    :param description: description of the weather data
+    :param ETmodel: model used for the reference ET in the store
+    :param angstA: Angstrom A parameter of the site
+    :param angstB: Angstrom B parameter of the site
+
+    The weather data are not converted into WeatherDataContainers, calling
+    the provider returns a WeatherDayView on the store.
+    """
+
+    def __init__(self, store, latitude, longitude, description=None, ETmodel="PM",
+                 angstA=None, angstB=None):
+        WeatherDataProvider.__init__(self)
+        self.latitude = float(latitude)
+        self.longitude = float(longitude)
+        self.elevation = store.ELEV
+        self.description = description if description is not None else []
+        self.ETmodel = ETmodel
+        self.angstA = angstA
+        self.angstB = angstB
+        self._columnar = store
+        self._frozen = True
+
+
+class WeatherArchiveProvider(ColumnarWeatherDataProvider):
+    """Frozen WeatherDataProvider for a site in a WeatherArchive.
+
+    :param archive: the WeatherArchive
+    :param cell: grid cell of the site in the archive
+    :param latitude: latitude of the provider
+    :param longitude: longitude of the provider
+
+    Calling the provider returns a WeatherDayView on the memory mapped
+    archive.
+    """
+
+    def __init__(self, archive, cell, latitude, longitude):
+        site = archive.sites[cell]
+        ColumnarWeatherDataProvider.__init__(self, archive.columnar_store(cell), latitude, longitude,
+                                             site["description"], site["ETmodel"],
+                                             site["angstA"], site["angstB"])
+
+
+def convert_cache_files(cache_dir=None, archive_fname=None):
+    """Converts the NASA POWER cache files in cache_dir into a single
+    WeatherArchive.
+
+    :param cache_dir: directory with the cache files, defaults to the
+        meteo cache directory
+    :param archive_fname: filename of the archive, defaults to the archive
+        in the meteo cache directory
+    :return: the filename of the archive
+
+    Sites that are already in an existing archive are kept unless they are
+    also present as a cache file.
+    """
+    if archive_fname is None:
+        archive_fname = get_archive_filename()
+    if cache_dir is None:
+        cache_dir = os.path.dirname(get_archive_filename())
+
+    sites = {}
+    if os.path.exists(archive_fname):
+        archive = WeatherArchive(archive_fname)
+        for cell, site in archive.sites.items():
+            meta = {k: site[k] for k in ("description", "ETmodel", "angstA", "angstB")}
+            sites[cell] = (archive.columnar_store(cell), meta)
+
+    # Binary cache files take precedence over legacy pickled cache files
+    prefix = NASAPowerWeatherDataProvider.__name__ + "_"
+    for fname in sorted(os.listdir(cache_dir)):
+        if not (fname.startswith(prefix) and fname.endswith(".cache")):
+            continue
+        cell = fname[len(prefix):-len(".cache")]
+        if os.path.exists(os.path.join(cache_dir, prefix + cell + WeatherCacheFile.extension)):
+            continue
+        with open(os.path.join(cache_dir, fname), "rb") as fp:
+            (store, elevation, longitude, latitude, description, ETmodel) = pickle.load(fp)
+        meta = {"description": description, "ETmodel": ETmodel,
+                "angstA": NASAPowerWeatherDataProvider.angstA,
+                "angstB": NASAPowerWeatherDataProvider.angstB}
+        sites[cell] = (ColumnarWeatherStore.from_store(store), meta)
+    for fname in sorted(os.listdir(cache_dir)):
+        if not (fname.startswith(prefix) and fname.endswith(WeatherCacheFile.extension)):
+            continue
+        cell = fname[len(prefix):-len(WeatherCacheFile.extension)]
+        sites[cell] = WeatherCacheFile.read(os.path.join(cache_dir, fname))
+
+    WeatherArchive.write(archive_fname, sites)
+    return archive_fname
+
+
+class WeatherDataRegistry(object):
+    """Process wide cache of frozen weather data providers by location.
+
+    :param max_bytes: memory budget of the registry in bytes
+    :param provider_class: WeatherDataProvider class that is created for
+        locations not in the registry, called as
+        provider_class(latitude, longitude, **kwargs)
+
+    Repeated requests for the same (latitude, longitude) return the same
+    frozen provider instance. When the estimated size of all providers
+    exceeds max_bytes the least recently used providers are evicted; the
+    most recent provider is always kept.
+    """
+    # Approximate memory use of one WeatherDataContainer in the store
+    # including its key in bytes
+    CONTAINER_NBYTES = 650
+
+    def __init__(self, max_bytes=256 * 1024**2, provider_class=NASAPowerWeatherDataProvider,
+                 archive_fname=None):
+        self._providers = OrderedDict()
+        self._nbytes = {}
+        self._lock = threading.RLock()
+        self._max_bytes = max_bytes
+        self.provider_class = provider_class
+        self.archive_fname = archive_fname
+        self._archive = None
+
+    @property
+    def logger(self):
+        loggername = "%s.%s" % (self.__class__.__module__,
+                                self.__class__.__name__)
+        return logging.getLogger(loggername)
+
+    @property
+    def max_bytes(self):
+        return self._max_bytes
+
+    @max_bytes.setter
+    def max_bytes(self, max_bytes):
+        with self._lock:
+            self._max_bytes = max_bytes
+            self._evict()
+
+    @property
+    def nbytes(self):
+        return sum(self._nbytes.values())
+
+    def __len__(self):
+        return len(self._providers)
+
+    def __contains__(self, location):
+        return self._make_key(*location) in self._providers
+
+    def _make_key(self, latitude, longitude, **kwargs):
+        return (float(latitude), float(longitude)) + tuple(sorted(kwargs.items()))
+
+    def get(self, latitude, longitude, **kwargs):
+        """Returns the frozen provider for latitude/longitude, loading it on
+        first request. Keyword arguments are passed to the provider class
+        and are part of the key.
+        """
+        key = self._make_key(latitude, longitude, **kwargs)
+        with self._lock:
+            provider = self._providers.get(key)
+            if provider is not None:
+                self._providers.move_to_end(key)
+                return provider
+
+            provider = self._load(latitude, longitude, **kwargs)
+            provider.freeze()
+            self._providers[key] = provider
+            self._nbytes[key] = len(provider.store) * self.CONTAINER_NBYTES + \
+                provider.columnar_store().nbytes
+            self._evict()
+            return provider
+
+    def _get_archive(self):
+        """Returns the WeatherArchive at archive_fname (by default the
+        archive in the meteo cache directory) or None if it does not exist.
+        """
+        fname = self.archive_fname or get_archive_filename()
+        if self._archive is None or self._archive.fname != fname:
+            self._archive = WeatherArchive(fname) if os.path.exists(fname) else None
+        return self._archive
+
+    def _load(self, latitude, longitude, **kwargs):
+        """Load the provider from the weather archive if it holds the grid
+        cell, otherwise create a new provider.
+        """
+        archive = self._get_archive() if self.provider_class is NASAPowerWeatherDataProvider \
+            and not kwargs.get("force_update", False) else None
+        if archive is not None:
+            cell = get_grid_cell(latitude, longitude)
+            if cell in archive and archive.sites[cell]["ETmodel"] == kwargs.get("ETmodel", "PM"):
+                return WeatherArchiveProvider(archive, cell, latitude, longitude)
+        return self.provider_class(latitude, longitude, **kwargs)
+
+    def _evict(self):
+        """Evict least recently used providers until the budget is met.
+        """
+        while len(self._providers) > 1 and self.nbytes > self._max_bytes:
+            key, _ = self._providers.popitem(last=False)
+            del self._nbytes[key]
+            msg = "Evicted weather data for %s from the registry." % (key[:2],)
+            self.logger.debug(msg)
+
+    def clear(self):
+        """Remove all providers from the registry.
+        """
+        with self._lock:
+            self._providers.clear()
+            self._nbytes.clear()
+
+
+# Registry shared by all simulations in this process
+weather_registry = WeatherDataRegistry()
+
+
+def get_weather_data_provider(latitude, longitude, **kwargs):
+    """Returns the shared NASA POWER weather data provider for
+    latitude/longitude from the process wide weather registry.
+    """
+    return weather_registry.get(latitude, longitude, **kwargs)
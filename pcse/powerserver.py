@@ -0,0 +1,164 @@
+"""Local stand-in for the NASA POWER daily point API
+
+Serves recorded POWER JSON responses from a directory with one file per
+0.1 degree grid cell, named <grid cell>.json (e.g. LAT00525_LON-1247.json)
+as written by `pcse.prefetch` with a record directory. Requests are
+answered with the recorded response restricted to the requested period
+and parameters, so the weather pipeline can be run and tested offline.
+
+Usage::
+
+    python -m pcse.powerserver recorded_responses/ --port 8765
+    python -m pcse.prefetch --lat 50 52 --lon 5 7 \\
+        --server http://127.0.0.1:8765/api/temporal/daily/point
+
+or in Python::
+
+    with PowerStandInServer("recorded_responses/") as server:
+        NASAPowerWeatherDataProvider.power_url = server.url
+        ...
+
+Written by: Will Solow, 2024
+"""
+import os
+import json
+import logging
+import argparse
+import threading
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .nasapower import get_grid_cell
+
+
+class PowerRequestHandler(BaseHTTPRequestHandler):
+    """Answers GET requests on the daily point API path of the server.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip("/") != self.server.api_path:
+            return self._send(404, {"messages": ["Unknown path %s" % url.path]})
+
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            latitude = float(query["latitude"])
+            longitude = float(query["longitude"])
+        except (KeyError, ValueError):
+            return self._send(400, {"messages": ["latitude and longitude are required"]})
+
+        powerdata = self.server.get_response(latitude, longitude)
+        if powerdata is None:
+            msg = "No recorded response for (%s, %s)" % (latitude, longitude)
+            return self._send(404, {"messages": [msg]})
+
+        parameters = powerdata["properties"]["parameter"]
+        if "parameters" in query:
+            names = query["parameters"].split(",")
+            missing = [name for name in names if name not in parameters]
+            if missing:
+                msg = "Parameters not in recorded response: %s" % ",".join(missing)
+                return self._send(400, {"messages": [msg]})
+            parameters = {name: parameters[name] for name in names}
+        start, end = query.get("start", "00000000"), query.get("end", "99999999")
+        parameters = {name: {day: value for day, value in values.items() if start <= day <= end}
+                      for name, values in parameters.items()}
+
+        response = dict(powerdata)
+        response["properties"] = dict(powerdata["properties"], parameter=parameters)
+        self._send(200, response)
+
+    def _send(self, status, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).debug(format % args)
+
+
+class PowerStandInServer(ThreadingHTTPServer):
+    """HTTP server serving recorded POWER responses.
+
+    :param response_dir: directory with the recorded responses
+    :param host: host to bind to
+    :param port: port to bind to, 0 selects a free port
+
+    Use `start()`/`stop()` or the server as a context manager to run it in
+    a background thread, `url` is the URL of the daily point API.
+    """
+    api_path = "/api/temporal/daily/point"
+    daemon_threads = True
+
+    def __init__(self, response_dir, host="127.0.0.1", port=0):
+        ThreadingHTTPServer.__init__(self, (host, port), PowerRequestHandler)
+        self.response_dir = response_dir
+        self._responses = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return "http://%s:%i%s" % (host, port, self.api_path)
+
+    def get_response(self, latitude, longitude):
+        """Returns the recorded response for the grid cell of
+        latitude/longitude or None if there is none.
+        """
+        cell = get_grid_cell(latitude, longitude)
+        with self._lock:
+            if cell not in self._responses:
+                fname = os.path.join(self.response_dir, cell + ".json")
+                if not os.path.exists(fname):
+                    return None
+                with open(fname) as fp:
+                    self._responses[cell] = json.load(fp)
+            return self._responses[cell]
+
+    def start(self):
+        """Serves requests in a background thread.
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stops the background thread and closes the server.
+        """
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve recorded NASA POWER responses.")
+    parser.add_argument("response_dir", help="directory with <grid cell>.json responses")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+
+    server = PowerStandInServer(args.response_dir, args.host, args.port)
+    print("Serving recorded POWER responses from %s on %s" % (args.response_dir, server.url))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,209 @@
+"""Concurrent prefetching of NASA POWER weather data into the weather cache
+
+Fetches the weather of all sites on a latitude/longitude grid that are not
+yet in the weather cache (or the weather archive) with a bounded number of
+concurrent requests, retrying failed requests with exponential backoff.
+Every site is processed and written to its cache file as soon as it has
+been retrieved, so later runs load the cache instead of querying the POWER
+server from within the simulation loop.
+
+Usage::
+
+    python -m pcse.prefetch --lat 50 52 --lon 5 7 --step 0.5 --years 1984 2000
+
+Written by: Will Solow, 2024
+"""
+import os
+import json
+import random
+import asyncio
+import logging
+import argparse
+import datetime as dt
+
+import numpy as np
+import requests
+
+from .nasapower import (NASAPowerWeatherDataProvider, WeatherArchive, get_archive_filename,
+                        get_grid_cell)
+from .utils import exceptions as exc
+
+
+def make_grid(lat_range, lon_range, step=0.5):
+    """Returns the list of (latitude, longitude) of a grid spanning lat_range
+    and lon_range (both inclusive) with the given step, in the same order
+    as the data generation scripts.
+    """
+    latitudes = np.arange(start=lat_range[0], stop=lat_range[1] + step, step=step)
+    longitudes = np.arange(start=lon_range[0], stop=lon_range[1] + step, step=step)
+    return [(float(lat), float(lon)) for lat in latitudes for lon in longitudes]
+
+
+class PowerPrefetcher(object):
+    """Fetches the NASA POWER weather of many sites concurrently.
+
+    :param max_concurrency: maximum number of concurrent requests
+    :param retries: number of retries of a failed request
+    :param backoff: delay in seconds before the first retry, doubled for
+        every following retry
+    :param timeout: timeout of a single request in seconds
+    :param server: URL of the POWER daily point API, defaults to
+        NASAPowerWeatherDataProvider.power_url
+    :param record_dir: optional directory in which the raw POWER responses
+        are saved as <grid cell>.json, as served by pcse.powerserver
+    :param ETmodel: "PM"|"P" model for the reference evapotranspiration
+    :param force: fetch sites that are already in the cache as well
+
+    Requests are made with `requests` in worker threads driven by asyncio.
+    Responses with HTTP status 429 or 5xx and connection errors are retried,
+    other HTTP errors fail the site immediately.
+    """
+    provider_class = NASAPowerWeatherDataProvider
+    RETRY_STATUS = (429, 500, 502, 503, 504)
+
+    def __init__(self, max_concurrency=8, retries=5, backoff=1., timeout=120., server=None,
+                 record_dir=None, ETmodel="PM", force=False):
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.server = self.provider_class.power_url if server is None else server
+        self.record_dir = record_dir
+        self.ETmodel = ETmodel
+        self.force = force
+
+    @property
+    def logger(self):
+        loggername = "%s.%s" % (self.__class__.__module__,
+                                self.__class__.__name__)
+        return logging.getLogger(loggername)
+
+    def is_cached(self, latitude, longitude):
+        """Returns True if the weather of the site is in the cache files or
+        the weather archive.
+        """
+        provider = self.provider_class.__new__(self.provider_class)
+        if provider._find_cache_file(latitude, longitude) is not None:
+            return True
+        archive_fname = get_archive_filename()
+        if os.path.exists(archive_fname):
+            return get_grid_cell(latitude, longitude) in WeatherArchive(archive_fname)
+        return False
+
+    async def _fetch(self, latitude, longitude, start_date, end_date):
+        """Returns the POWER response for the site, retrying failed requests.
+        """
+        payload = self.provider_class.power_payload(latitude, longitude, start_date, end_date)
+        for attempt in range(self.retries + 1):
+            try:
+                req = await asyncio.to_thread(requests.get, self.server, params=payload,
+                                              timeout=self.timeout)
+                if req.status_code == self.provider_class.HTTP_OK:
+                    return req.json()
+                if req.status_code not in self.RETRY_STATUS:
+                    msg = ("Failed retrieving POWER data, server returned HTTP " +
+                           "code: %i on following URL %s") % (req.status_code, req.url)
+                    raise exc.WeatherDataProviderError(msg)
+                error = "HTTP code %i" % req.status_code
+            except requests.RequestException as e:
+                error = str(e)
+
+            if attempt < self.retries:
+                delay = self.backoff * 2**attempt * (1. + random.random())
+                msg = "Retrieving POWER data for (%f, %f) failed (%s), retrying in %.1fs."
+                self.logger.debug(msg % (latitude, longitude, error, delay))
+                await asyncio.sleep(delay)
+
+        msg = "Retrieving POWER data for (%f, %f) failed after %i attempts: %s"
+        raise exc.WeatherDataProviderError(msg % (latitude, longitude, self.retries + 1, error))
+
+    def _store(self, latitude, longitude, powerdata):
+        """Records the raw response and writes the site to the weather cache.
+        """
+        if self.record_dir is not None:
+            fname = os.path.join(self.record_dir, get_grid_cell(latitude, longitude) + ".json")
+            with open(fname, "w") as fp:
+                json.dump(powerdata, fp)
+        self.provider_class.from_POWER_data(latitude, longitude, powerdata, self.ETmodel)
+
+    async def _prefetch_site(self, semaphore, latitude, longitude, start_date, end_date):
+        """Fetches and stores a single site, returns its status.
+        """
+        if not self.force and self.is_cached(latitude, longitude):
+            return "cached"
+        try:
+            async with semaphore:
+                powerdata = await self._fetch(latitude, longitude, start_date, end_date)
+            await asyncio.to_thread(self._store, latitude, longitude, powerdata)
+        except (exc.PCSEError, RuntimeError, KeyError, ValueError) as e:
+            self.logger.warning(str(e))
+            return "failed: %s" % e
+        return "fetched"
+
+    async def prefetch_async(self, sites, start_date=None, end_date=None):
+        """Coroutine version of `prefetch()`.
+        """
+        if self.record_dir is not None:
+            os.makedirs(self.record_dir, exist_ok=True)
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        # Sites in the same grid cell share their cache file
+        cells = {}
+        for latitude, longitude in sites:
+            cells.setdefault(get_grid_cell(latitude, longitude), (latitude, longitude))
+        tasks = [self._prefetch_site(semaphore, lat, lon, start_date, end_date)
+                 for lat, lon in cells.values()]
+        status = await asyncio.gather(*tasks)
+        status = dict(zip(cells, status))
+        return {(lat, lon): status[get_grid_cell(lat, lon)] for lat, lon in sites}
+
+    def prefetch(self, sites, start_date=None, end_date=None):
+        """Fetches the weather from start_date up to end_date (by default the
+        full POWER record) of all sites that are not yet in the cache.
+
+        :param sites: list of (latitude, longitude)
+        :return: dict mapping every site to "cached", "fetched" or
+            "failed: <reason>"
+        """
+        return asyncio.run(self.prefetch_async(sites, start_date, end_date))
+
+
+def prefetch_grid(lat_range, lon_range, step=0.5, years=None, **kwargs):
+    """Prefetches the weather of all sites on a grid, see `make_grid()`.
+
+    :param years: optional (first, last) year, defaults to the full record
+    :param kwargs: keyword arguments for the PowerPrefetcher
+    :return: the status of every site as returned by `PowerPrefetcher.prefetch()`
+    """
+    start_date = end_date = None
+    if years is not None:
+        start_date = max(dt.date(years[0], 1, 1), PowerPrefetcher.provider_class.power_start_date)
+        end_date = min(dt.date(years[1], 12, 31), dt.date.today())
+    prefetcher = PowerPrefetcher(**kwargs)
+    return prefetcher.prefetch(make_grid(lat_range, lon_range, step), start_date, end_date)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prefetch NASA POWER weather data for a grid of sites.")
+    parser.add_argument("--lat", nargs=2, type=float, required=True, help="latitude range")
+    parser.add_argument("--lon", nargs=2, type=float, required=True, help="longitude range")
+    parser.add_argument("--step", type=float, default=0.5, help="grid step in degrees")
+    parser.add_argument("--years", nargs=2, type=int, default=None,
+                        help="first and last year, defaults to the full record")
+    parser.add_argument("--workers", type=int, default=8, help="maximum concurrent requests")
+    parser.add_argument("--retries", type=int, default=5, help="retries per request")
+    parser.add_argument("--backoff", type=float, default=1., help="initial retry delay in seconds")
+    parser.add_argument("--server", default=None, help="URL of the POWER API or a stand-in server")
+    parser.add_argument("--record", default=None, help="directory to save the raw POWER responses")
+    parser.add_argument("--force", action="store_true", help="also fetch sites already in the cache")
+    args = parser.parse_args(argv)
+
+    status = prefetch_grid(args.lat, args.lon, args.step, args.years, max_concurrency=args.workers,
+                           retries=args.retries, backoff=args.backoff, server=args.server,
+                           record_dir=args.record, force=args.force)
+    for (lat, lon), s in status.items():
+        print("%8.3f %8.3f %s" % (lat, lon, s))
+    return 0 if not any(s.startswith("failed") for s in status.values()) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
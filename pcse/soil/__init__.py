@@ -15,3 +15,4 @@ from .soil_wrappers import SoilModuleWrapper_LNPK
 from .soil_wrappers import SoilModuleWrapper_PP
 from .soil_wrappers import SoilModuleWrapper_LW
 from .soil_wrappers import SoilModuleWrapper_LNW
+from .batch_soil import BatchSoil
@@ -0,0 +1,400 @@
+"""Batched soil water and N/P/K balance simulating the soils of many fields
+at once
+
+`BatchSoil` holds the states and rates of the soils of N fields in NumPy
+arrays of shape (N,) and implements the classic water balance for free
+drainage (`WaterbalanceFD`) or potential production (`WaterbalancePP`)
+together with the matching N/P/K soil dynamics, as combined by the soil
+module wrappers. The expressions follow the scalar modules term by term so
+that a field in a batch gives the same results as the wrapped modules for the
+same inputs.
+
+Written by: Will Solow, 2024
+"""
+import numpy as np
+
+from ..base import BatchParameters, BatchVariables
+from ..base.batch import values_changed
+from ..util import Afgen, BatchAfgen, limit_array
+from .. import exceptions as exc
+from .classic_waterbalance import WaterbalanceFD, WaterbalancePP
+from .npk_soil_dynamics import NPK_Soil_Dynamics, NPK_Soil_Dynamics_PP, NPK_Soil_Dynamics_LN
+from .soil_wrappers import SoilModuleWrapper_LNPKW, SoilModuleWrapper_PP, \
+    SoilModuleWrapper_LW, SoilModuleWrapper_LNW, SoilModuleWrapper_LNPK, SoilModuleWrapper_LN
+
+# Water balance and N/P/K soil dynamics combined by each soil module wrapper
+SOIL_MODULES = {
+    SoilModuleWrapper_LNPKW: (WaterbalanceFD, NPK_Soil_Dynamics),
+    SoilModuleWrapper_PP: (WaterbalancePP, NPK_Soil_Dynamics_PP),
+    SoilModuleWrapper_LW: (WaterbalanceFD, NPK_Soil_Dynamics_PP),
+    SoilModuleWrapper_LNW: (WaterbalanceFD, NPK_Soil_Dynamics_LN),
+    SoilModuleWrapper_LNPK: (WaterbalancePP, NPK_Soil_Dynamics),
+    SoilModuleWrapper_LN: (WaterbalancePP, NPK_Soil_Dynamics_LN),
+}
+
+_NPK = ("N", "P", "K")
+
+
+class BatchSoil(object):
+    """Array version of the soil module wrappers for a batch of fields.
+
+    :param n: number of fields
+    :param wrapper: the soil module wrapper class to simulate, one of the
+        keys of `SOIL_MODULES`
+    """
+
+    state_names = ("SM", "SS", "SSI", "WC", "WI", "WLOW", "WLOWI", "WWLOW",
+                   "WTRAT", "EVST", "EVWT", "TSR", "RAINT", "WART", "TOTINF",
+                   "TOTIRR", "TOTIRRIG", "PERCT", "LOSST", "WBALRT", "WBALTT", "DSOS",
+                   "SURFACE_N", "SURFACE_P", "SURFACE_K",
+                   "TOTN_RUNOFF", "TOTP_RUNOFF", "TOTK_RUNOFF",
+                   "NSOIL", "PSOIL", "KSOIL", "NAVAIL", "PAVAIL", "KAVAIL",
+                   "TOTN", "TOTP", "TOTK")
+
+    rate_names = ("EVS", "EVW", "WTRA", "RIN", "RIRR", "PERC", "LOSS", "DW",
+                  "DWLOW", "DTSR", "DSS", "DRAINT",
+                  "RNSOIL", "RPSOIL", "RKSOIL", "RNAVAIL", "RPAVAIL", "RKAVAIL",
+                  "FERT_N_SUPPLY", "FERT_P_SUPPLY", "FERT_K_SUPPLY",
+                  "RRUNOFF_N", "RRUNOFF_P", "RRUNOFF_K",
+                  "RNSUBSOIL", "RPSUBSOIL", "RKSUBSOIL")
+
+    # States that are not assigned at every state integration, see published()
+    held_states = ("SSI", "WI", "WLOWI", "WART", "TOTIRRIG", "WBALRT", "WBALTT",
+                   "TOTN", "TOTP", "TOTK")
+
+    DEFAULT_RD = 10.
+
+    def __init__(self, n:int, wrapper):
+        if wrapper not in SOIL_MODULES:
+            msg = "Soil module %s cannot be simulated as a batch." % wrapper.__name__
+            raise exc.PCSEError(msg)
+        self.n = n
+        self.waterbalance, self.npk = SOIL_MODULES[wrapper]
+        self.params = BatchParameters(n)
+        self.states = BatchVariables(n, self.state_names)
+        self.rates = BatchVariables(n, self.rate_names)
+
+        self.SMLIM = np.zeros(n)
+        self.RDold = np.zeros(n)
+        self.RDM = np.zeros(n)
+        self.DSLR = np.zeros(n)
+        self.RINold = np.zeros(n)
+        self.in_crop_cycle = np.zeros(n, dtype=bool)
+        self.NINFTB = BatchAfgen(n)
+        self._RIRR = np.zeros(n)
+        self.SOILI = BatchVariables(n, [x + "SOILI" for x in _NPK])
+        self._FERT = BatchVariables(n, [x for x in _NPK])
+
+        # Only NPK_Soil_Dynamics integrates the runoff of N/P/K
+        if self.npk is not NPK_Soil_Dynamics:
+            self.held_states = self.held_states + ("TOTN_RUNOFF", "TOTP_RUNOFF", "TOTK_RUNOFF")
+        # Held states at the last flush of the VariableKiosk
+        self._flushed = {name: getattr(self.states, name).copy() for name in self.held_states}
+
+    def start(self, idx, parvalues:list):
+        """Start the soils of the fields idx.
+
+        :param idx: array with the indices of the fields
+        :param parvalues: list with the ParameterProvider of each field
+        """
+        p = self.params
+        s = self.states
+        p.set(self.waterbalance.Parameters, idx, parvalues)
+        p.set(self.npk.Parameters, idx, parvalues)
+        self.states.zerofy(idx)
+        self.rates.zerofy(idx)
+
+        # Water balance
+        SMW = p.SMW[idx]
+        SMLIM = self.SMLIM[idx] = limit_array(SMW, p.SM0[idx], p.SMLIM[idx])
+        RD = self.DEFAULT_RD
+        RDM = self.RDM[idx] = np.maximum(RD, p.RDMSOL[idx])
+        self.RDold[idx] = RD
+
+        s.SS[idx] = s.SSI[idx] = p.SSI[idx]
+        SM = s.SM[idx] = limit_array(SMW, SMLIM, (SMW + p.WAV[idx]/RD))
+        WC = s.WC[idx] = SM * RD
+        s.WI[idx] = WC
+        WLOW = s.WLOW[idx] = limit_array(0., p.SM0[idx]*(RDM - RD), (p.WAV[idx] + RDM*SMW - WC))
+        s.WLOWI[idx] = WLOW
+        s.WWLOW[idx] = WC + WLOW
+        s.WBALRT[idx] = -999.
+        s.WBALTT[idx] = -999.
+
+        self.DSLR[idx] = np.where(SM >= (SMW + 0.5*(p.SMFCF[idx] - SMW)), 1., 5.)
+        self.RINold[idx] = 0.
+        self.in_crop_cycle[idx] = False
+        self.NINFTB.set(idx, [Afgen([0.0,0.0, 0.5,0.0, 1.5,1.0])] * len(idx))
+        self._RIRR[idx] = 0.
+
+        # N/P/K soil dynamics
+        for x in _NPK:
+            SOILBASE = getattr(p, x + "SOILBASE")[idx]
+            getattr(self.SOILI, x + "SOILI")[idx] = SOILBASE
+            getattr(s, x + "SOIL")[idx] = SOILBASE
+            getattr(s, x + "AVAIL")[idx] = getattr(p, x + "AVAILI")[idx]
+            getattr(self._FERT, x)[idx] = 0.
+
+    def calc_rates(self, idx, drv, crop, active, present):
+        """Calculate the rates of the soils of the fields idx.
+
+        :param drv: a WeatherBatchView with the weather of all fields
+        :param crop: the BatchWofost80 of the fields
+        :param active: boolean array for idx, True where a crop is running
+            its rates, i.e. its transpiration and uptake are in the kiosk
+        :param present: boolean array for idx, True where a crop is present
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+
+        # Rate of irrigation (RIRR)
+        RIRR = r.RIRR[idx] = self._RIRR[idx]
+        self._RIRR[idx] = 0.
+
+        # Transpiration and maximum soil and surface water evaporation rates
+        # are taken from the crop when it is active
+        WTRA = np.where(active, crop.rates.TRA[idx], 0.)
+        EVWMX = np.where(active, crop.rates.EVWMX[idx], drv.E0[idx])
+        EVSMX = np.where(active, crop.rates.EVSMX[idx], drv.ES0[idx])
+
+        # Actual evaporation rates
+        SS = s.SS[idx]
+        DSLR = self.DSLR[idx]
+        RINold = self.RINold[idx]
+        water = SS > 1.
+        wet = ~water & (RINold >= 1)
+        dry = ~water & ~wet
+        EVW = np.where(water, EVWMX, 0.)
+        EVSMXT = EVSMX * (np.sqrt(DSLR + 1) - np.sqrt(DSLR))
+        EVS = np.where(wet, EVSMX, np.where(dry, np.minimum(EVSMX, EVSMXT + RINold), 0.))
+        self.DSLR[idx] = np.where(wet, 1., np.where(dry, DSLR + 1, DSLR))
+
+        # Potentially infiltrating rainfall
+        RAIN = drv.RAIN[idx]
+        NOTINF = p.NOTINF[idx]
+        RINPRE = np.where(p.IFUNRN[idx] == 0,
+                          (1. - NOTINF) * RAIN,
+                          (1. - NOTINF * self.NINFTB(RAIN, idx)) * RAIN)
+        # Second stage preliminary infiltration rate (RINPRE)
+        # including surface storage and irrigation
+        RINPRE = RINPRE + RIRR + SS
+        RINPRE = np.where(SS > 0.1, np.minimum(p.SOPE[idx], RINPRE + RIRR - EVW), RINPRE)
+
+        RD = np.where(present, crop.states.RD[idx], self.DEFAULT_RD)
+        RDM = self.RDM[idx]
+        SMFCF = p.SMFCF[idx]
+        SM0 = p.SM0[idx]
+        WC = s.WC[idx]
+        WLOW = s.WLOW[idx]
+
+        # percolation from rooted zone to subsoil
+        WE = SMFCF * RD
+        PERC1 = limit_array(0., p.SOPE[idx], (WC - WE) - WTRA - EVS)
+
+        # loss of water at the lower end of the maximum root zone
+        WELOW = SMFCF * (RDM - RD)
+        LOSS = limit_array(0., p.KSUB[idx], (WLOW - WELOW + PERC1))
+
+        # percolation not to exceed uptake capacity of subsoil
+        PERC2 = ((RDM - RD) * SM0 - WLOW) + LOSS
+        PERC = np.minimum(PERC1, PERC2)
+
+        # adjustment of infiltration rate
+        RIN = np.minimum(RINPRE, (SM0 - s.SM[idx])*RD + WTRA + EVS + PERC)
+        self.RINold[idx] = RIN
+
+        # rates of change in amounts of moisture WC and WLOW
+        DW = RIN - WTRA - EVS - PERC
+        DWLOW = PERC - LOSS
+
+        # reduce EVS where DW creates a negative value of W
+        Wtmp = WC + DW
+        negative = Wtmp < 0.0
+        EVS = np.where(negative, EVS + Wtmp, EVS)
+        DW = np.where(negative, -WC, DW)
+
+        # surface storage and surface runoff
+        SStmp = RAIN + RIRR - EVW - RIN
+        DSS = np.minimum(SStmp, (p.SSMAX[idx] - SS))
+        DTSR = SStmp - DSS
+
+        r.WTRA[idx] = WTRA
+        r.EVW[idx] = EVW
+        r.EVS[idx] = EVS
+        r.LOSS[idx] = LOSS
+        r.PERC[idx] = PERC
+        r.RIN[idx] = RIN
+        r.DW[idx] = DW
+        r.DWLOW[idx] = DWLOW
+        r.DSS[idx] = DSS
+        r.DTSR[idx] = DTSR
+        r.DRAINT[idx] = RAIN
+
+        # N/P/K soil dynamics
+        RNPKRUNOFF = p.RNPKRUNOFF(DTSR, idx)
+        for x in _NPK:
+            FERT = getattr(self._FERT, x)
+            getattr(r, "FERT_%s_SUPPLY" % x)[idx] = FERT[idx]
+            FERT[idx] = 0.
+
+            SURFACE = getattr(s, "SURFACE_" + x)[idx]
+            getattr(r, "RRUNOFF_" + x)[idx] = SURFACE * RNPKRUNOFF
+            SUBSOIL = np.minimum(getattr(p, "R%sSOILMAX" % x)[idx],
+                                 SURFACE * getattr(p, "R%sABSORPTION" % x)[idx])
+            getattr(r, "R%sSUBSOIL" % x)[idx] = SUBSOIL
+            SOIL = -np.maximum(0., np.minimum(getattr(p, x + "SOILBASE_FR")[idx] *
+                                              getattr(self.SOILI, x + "SOILI")[idx],
+                                              getattr(s, x + "SOIL")[idx]))
+            getattr(r, "R%sSOIL" % x)[idx] = SOIL
+            # Uptake by the crop, if a crop is actually growing
+            uptake = np.where(active, getattr(crop.rates, "R%suptake" % x)[idx], 0.)
+            getattr(r, "R%sAVAIL" % x)[idx] = SUBSOIL + getattr(p, "BG_%s_SUPPLY" % x)[idx] - \
+                uptake - SOIL
+
+    def integrate(self, idx, crop, present):
+        """Integrate the states of the soils of the fields idx.
+
+        :param crop: the BatchWofost80 of the fields
+        :param present: boolean array for idx, True where a crop is present
+        """
+        p = self.params
+        r = self.rates
+        s = self.states
+
+        s.WTRAT[idx] += r.WTRA[idx]
+        s.EVWT[idx] += r.EVW[idx]
+        s.EVST[idx] += r.EVS[idx]
+        s.RAINT[idx] += r.DRAINT[idx]
+        s.TOTINF[idx] += r.RIN[idx]
+        s.TOTIRR[idx] += r.RIRR[idx]
+        s.SS[idx] += r.DSS[idx]
+        s.TSR[idx] += r.DTSR[idx]
+        s.WC[idx] += r.DW[idx]
+        s.PERCT[idx] += r.PERC[idx]
+        s.LOSST[idx] += r.LOSS[idx]
+        s.WLOW[idx] += r.DWLOW[idx]
+        s.WWLOW[idx] = s.WC[idx] + s.WLOW[idx] * 1.0
+
+        # Change of the root zone subsystem boundary
+        RD = np.where(present, crop.states.RD[idx], self.DEFAULT_RD)
+        RDold = self.RDold[idx]
+        RDchange = RD - RDold
+        WLOW = s.WLOW[idx]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            WDR = np.where(RDchange > 0.001,
+                           np.minimum(WLOW, WLOW * RDchange/(p.RDMSOL[idx] - RDold)),
+                           s.WC[idx] * RDchange/RDold)
+        s.WLOW[idx] -= WDR
+        s.WC[idx] += WDR
+        s.WART[idx] += WDR
+
+        # mean soil moisture content in rooted zone and days since oxygen
+        # stress, for the free drainage water balance only while a crop is present
+        if self.waterbalance is WaterbalanceFD:
+            s.SM[idx] = s.WC[idx]/RD
+            saturated = (s.SM[idx] >= (p.SM0[idx] - p.CRAIRC[idx])) & self.in_crop_cycle[idx]
+        else:
+            s.SM[idx] = p.SMFCF[idx]
+            saturated = s.SM[idx] >= (p.SM0[idx] - p.CRAIRC[idx])
+        s.DSOS[idx] = np.where(saturated, s.DSOS[idx] + 1, 0)
+        self.RDold[idx] = RD
+
+        # N/P/K soil dynamics
+        for x in _NPK:
+            SURFACE = getattr(s, "SURFACE_" + x)
+            FERT = getattr(r, "FERT_%s_SUPPLY" % x)[idx]
+            SUBSOIL = getattr(r, "R%sSUBSOIL" % x)[idx]
+            AVAIL = getattr(s, x + "AVAIL")
+            MAX = getattr(p, x + "MAX")[idx]
+            if self.npk is NPK_Soil_Dynamics:
+                RUNOFF = getattr(r, "RRUNOFF_" + x)[idx]
+                SURFACE[idx] += (FERT - SUBSOIL - RUNOFF)
+                getattr(s, "TOT%s_RUNOFF" % x)[idx] += RUNOFF
+            else:
+                SURFACE[idx] += (FERT - SUBSOIL)
+            getattr(s, x + "SOIL")[idx] += getattr(r, "R%sSOIL" % x)[idx]
+            if self.npk is NPK_Soil_Dynamics or (self.npk is NPK_Soil_Dynamics_LN and x == "N"):
+                AVAIL[idx] += getattr(r, "R%sAVAIL" % x)[idx]
+                AVAIL[idx] = np.minimum(AVAIL[idx], MAX)
+            else:
+                AVAIL[idx] = MAX
+
+    def finalize(self, idx):
+        """Check the water balance of the soils of the fields idx.
+        """
+        s = self.states
+        WBALRT = s.WBALRT[idx] = s.TOTINF[idx] + s.WI[idx] + s.WART[idx] - s.EVST[idx] - \
+            s.WTRAT[idx] - s.PERCT[idx] - s.WC[idx]
+        WBALTT = s.WBALTT[idx] = (s.SSI[idx] + s.RAINT[idx] + s.TOTIRR[idx] + s.WI[idx] - s.WC[idx] +
+                                  s.WLOWI[idx] - s.WLOW[idx] - s.WTRAT[idx] - s.EVWT[idx] -
+                                  s.EVST[idx] - s.TSR[idx] - s.LOSST[idx] - s.SS[idx])
+        if (np.abs(WBALRT) > 0.0001).any():
+            msg = "Water balance for root zone does not close."
+            raise exc.WaterBalanceError(msg)
+        failed = np.flatnonzero(np.abs(WBALTT) > 0.0001)
+        if len(failed) > 0:
+            i = idx[failed[0]]
+            msg = "Water balance for complete soil profile does not close.\n"
+            msg += ("Total INIT + IN:   %f\n" % (s.WI[i] + s.WLOWI[i] + s.SSI[i] + s.TOTIRR[i] +
+                                                 s.RAINT[i]))
+            msg += ("Total FINAL + OUT: %f\n" % (s.WC[i] + s.WLOW[i] + s.SS[i] + s.EVWT[i] + s.EVST[i] +
+                                                 s.WTRAT[i] + s.TSR[i] + s.LOSST[i]))
+            raise exc.WaterBalanceError(msg)
+
+    def crop_start(self, idx):
+        """Register the start of the crops of the fields idx.
+        """
+        self.in_crop_cycle[idx] = True
+
+    def crop_finish(self, idx):
+        """Register the finish of the crops of the fields idx.
+        """
+        self.in_crop_cycle[idx] = False
+
+    def irrigate(self, idx, amount, efficiency):
+        """Irrigate the fields idx, see `WaterbalanceFD._on_IRRIGATE()`.
+        """
+        self.states.TOTIRRIG[idx] += amount
+        self._RIRR[idx] = amount * efficiency
+
+    def apply_npk(self, idx, N_amount=None, P_amount=None, K_amount=None,
+                  N_recovery=None, P_recovery=None, K_recovery=None):
+        """Apply N/P/K to the fields idx, see `NPK_Soil_Dynamics._on_APPLY_NPK()`.
+        """
+        amounts = {"N": (N_amount, N_recovery), "P": (P_amount, P_recovery),
+                   "K": (K_amount, K_recovery)}
+        for x, (amount, recovery) in amounts.items():
+            if amount is not None:
+                getattr(self._FERT, x)[idx] = amount * recovery
+                getattr(self.states, "TOT" + x)[idx] += amount
+
+    def get_variable(self, varname:str):
+        """Returns an array with the value of varname for all fields, or None
+        if the soil has no variable varname.
+        """
+        if varname in self.states:
+            return getattr(self.states, varname)
+        if varname in self.rates:
+            return getattr(self.rates, varname)
+        return None
+
+    def flush(self, idx):
+        """Keep the values of the held states of the fields idx at a flush of
+        the VariableKiosk before the state integration.
+        """
+        for name in self.held_states:
+            self._flushed[name][idx] = getattr(self.states, name)[idx]
+
+    def published(self, varname:str):
+        """Returns a boolean array that is True for the fields where varname
+        was assigned since the last flush of the VariableKiosk.
+
+        `Engine` finds the variables of a removed soil in the VariableKiosk
+        until the next flush. States are assigned at every integration except
+        the held states, which are published when they change. Rates are
+        assigned at every rate calculation.
+        """
+        if varname in self.held_states:
+            return values_changed(getattr(self.states, varname), self._flushed[varname])
+        return np.ones(self.n, dtype=bool)
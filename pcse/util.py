@@ -4,10 +4,11 @@ Written by: Allard de Wit (allard.dewit@wur.nl), April 2014
 Modified by Will Solow, 2024
 """
 import os
+import hashlib
 from pathlib import Path
 import datetime
 from math import cos, sin, asin, sqrt, exp, pi, radians
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 from bisect import bisect_left
 import textwrap
 from collections.abc import Iterable
@@ -26,33 +27,50 @@ class ConfigurationLoader(object):
     """Class for loading the model configuration from a PCSE configuration files
 
         :param config: string given file name containing model configuration
+
+    The configuration is read-only once loaded. Use `get_model_config()` to
+    share one ConfigurationLoader between all engines using the same
+    configuration.
         """
     _required_attr = ("CROP", "SOIL", "AGROMANAGEMENT", "OUTPUT_VARS", "OUTPUT_INTERVAL",
                       "OUTPUT_INTERVAL_DAYS", "SUMMARY_OUTPUT_VARS")
-    defined_attr = []
+    defined_attr = ()
     model_config_file = None
     description = None
+    _frozen = False
+
+    # Defaults for optional configuration items
+    KIOSK_MODE = "dict"
+    STATES_RATES_BACKEND = None
+
+    @staticmethod
+    def get_config_file(config):
+        """Returns the absolute path of model configuration file config.
+
+        If config is not an absolute or relative path (with a leading '.') the
+        file is assumed to be located in the 'conf/' folder in the PCSE
+        distribution.
+        """
+        config = str(config)
+        if os.path.isabs(config):
+            mconf = config
+        elif config.startswith("."):
+            mconf = os.path.normpath(config)
+        else:
+            pcse_dir = os.path.dirname(__file__)
+            mconf = os.path.join(pcse_dir, "conf", config)
+        model_config_file = os.path.abspath(mconf)
+
+        # check that configuration file exists
+        if not os.path.exists(model_config_file):
+            msg = "PCSE model configuration file does not exist: %s" % model_config_file
+            raise exc.PCSEError(msg)
+        return model_config_file
 
     def __init__(self, config):
 
         if isinstance(config, (str, Path)):
-            # check if model configuration file is an absolute or relative path. If
-            # not assume that it is located in the 'conf/' folder in the PCSE
-            # distribution
-            config = str(config)
-            if os.path.isabs(config):
-                mconf = config
-            elif config.startswith("."):
-                mconf = os.path.normpath(config)
-            else:
-                pcse_dir = os.path.dirname(__file__)
-                mconf = os.path.join(pcse_dir, "conf", config)
-            model_config_file = os.path.abspath(mconf)
-
-            # check that configuration file exists
-            if not os.path.exists(model_config_file):
-                msg = "PCSE model configuration file does not exist: %s" % model_config_file
-                raise exc.PCSEError(msg)
+            model_config_file = self.get_config_file(config)
             # store for later use
             self.model_config_file = model_config_file
 
@@ -84,12 +102,14 @@ class ConfigurationLoader(object):
                    "Or, should be a dictionary storing the configuration of the model PCSE should run.")
             raise exc.PCSEError(msg)
 
-        # Loop through the attributes in the configuration file
-        #print(loc.items())
+        # Loop through the attributes in the configuration file, lists are
+        # copied as the configuration may be shared
+        defined_attr = []
         for key, value in list(loc.items()):
             if key.isupper():
-                self.defined_attr.append(key)
-                setattr(self, key, value)
+                defined_attr.append(key)
+                setattr(self, key, list(value) if type(value) is list else value)
+        self.defined_attr = tuple(defined_attr)
 
         # Check for any missing compulsary attributes
         req = set(self._required_attr)
@@ -97,6 +117,13 @@ class ConfigurationLoader(object):
         if diff:
             msg = "One or more compulsary configuration items missing: %s" % list(diff)
             raise exc.PCSEError(msg)
+        self._frozen = True
+
+    def __setattr__(self, attr, value):
+        if self._frozen:
+            msg = "Configuration item '%s' is read-only, the configuration may be shared." % attr
+            raise AttributeError(msg)
+        object.__setattr__(self, attr, value)
 
     def __str__(self):
         msg = "PCSE ConfigurationLoader from file:\n"
@@ -112,6 +139,54 @@ class ConfigurationLoader(object):
              msg += (textwrap.fill(r, subsequent_indent="  ") + "\n")
         return msg
 
+def _config_key(config):
+    """Returns the key of model configuration config for the configuration
+    cache, or None if config cannot be hashed.
+    """
+    if isinstance(config, (str, Path)):
+        model_config_file = ConfigurationLoader.get_config_file(config)
+        with open(model_config_file, "rb") as fp:
+            digest = hashlib.sha1(fp.read()).hexdigest()
+        return ("file", model_config_file, digest)
+    if isinstance(config, dict):
+        items = []
+        for key, value in sorted(config.items()):
+            if key.isupper():
+                items.append((key, tuple(value) if type(value) is list else value))
+        key = ("dict", tuple(items))
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+    return None
+
+_model_configs = OrderedDict()
+# Maximum number of model configurations that are kept
+MAX_MODEL_CONFIGS = 64
+
+def get_model_config(config):
+    """Returns the ConfigurationLoader for config, a model configuration file
+    name or dictionary, see `ConfigurationLoader`.
+
+    Configurations are loaded once and cached by the contents of the file or
+    of the upper case items of the dictionary, so engines using the same
+    configuration share one ConfigurationLoader. At most MAX_MODEL_CONFIGS
+    configurations are kept, the least recently used are discarded.
+    """
+    key = _config_key(config)
+    if key is None:
+        return ConfigurationLoader(config)
+    mconf = _model_configs.get(key)
+    if mconf is None:
+        mconf = ConfigurationLoader(config)
+        _model_configs[key] = mconf
+        while len(_model_configs) > MAX_MODEL_CONFIGS:
+            _model_configs.popitem(last=False)
+    else:
+        _model_configs.move_to_end(key)
+    return mconf
+
 class Afgen(object):
     """Emulates the AFGEN function in WOFOST.
     
@@ -135,6 +210,9 @@ class Afgen(object):
         10.0
         >>> f(-1)
         0.0
+
+    Afgen objects are not modified after construction, use `get_afgen()` to
+    share a single Afgen between all users of the same table.
     """
     
     def _check_x_ascending(self, tbl_xy):
@@ -174,10 +252,10 @@ class Afgen(object):
     def __init__(self, tbl_xy):
         
         x_list, y_list = self._check_x_ascending(tbl_xy)
-        x_list = self.x_list = list(map(float, x_list))
-        y_list = self.y_list = list(map(float, y_list))
+        x_list = self.x_list = tuple(map(float, x_list))
+        y_list = self.y_list = tuple(map(float, y_list))
         intervals = list(zip(x_list, x_list[1:], y_list, y_list[1:]))
-        self.slopes = [(y2 - y1)/(x2 - x1) for x1, x2, y1, y2 in intervals]
+        self.slopes = tuple((y2 - y1)/(x2 - x1) for x1, x2, y1, y2 in intervals)
 
     def __call__(self, x):
 
@@ -191,6 +269,118 @@ class Afgen(object):
 
         return v
     
+_afgen_tables = OrderedDict()
+# Maximum number of distinct tables for which Afgen objects are kept
+MAX_AFGEN_TABLES = 4096
+
+def get_afgen(tbl_xy):
+    """Returns the Afgen for the list of XY value pairs tbl_xy.
+
+    Afgen objects are interned by the contents of the table so that equal
+    tables, e.g. of the same crop parameters in different engines, share
+    one Afgen. At most MAX_AFGEN_TABLES tables are kept, the least
+    recently used are discarded.
+    """
+    if isinstance(tbl_xy, Afgen):
+        return tbl_xy
+    try:
+        key = tuple(map(float, tbl_xy))
+    except (TypeError, ValueError):
+        return Afgen(tbl_xy)
+    afgen = _afgen_tables.get(key)
+    if afgen is None:
+        afgen = Afgen(tbl_xy)
+        _afgen_tables[key] = afgen
+        while len(_afgen_tables) > MAX_AFGEN_TABLES:
+            _afgen_tables.popitem(last=False)
+    else:
+        _afgen_tables.move_to_end(key)
+    return afgen
+
+class BatchAfgen(object):
+    """Array version of `Afgen` holding one AFGEN table per field of a batch.
+
+    :param n: number of fields
+
+    The table of each field is set with `set()`. Fields without a table
+    return NaN. Calling the BatchAfgen with an array of x values and the
+    indices of the fields they belong to returns the interpolated values with
+    the same arithmetic as `Afgen.__call__()`, so that the results are
+    identical to evaluating the Afgen of each field separately.
+
+    Tables are stored once per distinct table, padded to the length of the
+    longest table, fields refer to their table by index.
+
+    example::
+
+        >>> f = BatchAfgen(3)
+        >>> f.set([0, 1, 2], [Afgen([0,0,1,1,5,10]), Afgen([0,1]), None])
+        >>> f(np.array([1.5, 3., 1.]), np.array([0, 1, 2]))
+        array([2.125, 1.   ,   nan])
+    """
+
+    def __init__(self, n:int):
+        self._keys = {(): 0}
+        # Table 0 is the empty table returning NaN
+        self._x = np.full((1, 2), np.inf)
+        self._y = np.full((1, 2), np.nan)
+        self._slopes = np.zeros((1, 1))
+        self._x_first = np.full(1, np.nan)
+        self._x_last = np.full(1, np.nan)
+        self.table = np.zeros(n, dtype=np.intp)
+
+    def _add_table(self, afgen:Afgen):
+        """Store the table of afgen and return its index.
+        """
+        x, y, slopes = afgen.x_list, afgen.y_list, afgen.slopes
+        width = max(self._x.shape[1], len(x), 2)
+        if width > self._x.shape[1]:
+            pad = width - self._x.shape[1]
+            self._x = np.pad(self._x, ((0, 0), (0, pad)), constant_values=np.inf)
+            self._y = np.pad(self._y, ((0, 0), (0, pad)), mode="edge")
+            self._slopes = np.pad(self._slopes, ((0, 0), (0, pad)))
+        row_x = np.full(width, np.inf)
+        row_x[:len(x)] = x
+        row_y = np.full(width, y[-1])
+        row_y[:len(y)] = y
+        row_slopes = np.zeros(width - 1)
+        row_slopes[:len(slopes)] = slopes
+        self._x = np.vstack([self._x, row_x])
+        self._y = np.vstack([self._y, row_y])
+        self._slopes = np.vstack([self._slopes, row_slopes])
+        self._x_first = np.append(self._x_first, x[0])
+        self._x_last = np.append(self._x_last, x[-1])
+        return len(self._x_first) - 1
+
+    def set(self, idx, afgens):
+        """Set the tables of the fields idx to those of the list of Afgen
+        objects afgens, None removes the table of a field.
+        """
+        for i, afgen in zip(idx, afgens):
+            key = () if afgen is None else (afgen.x_list, afgen.y_list)
+            table = self._keys.get(key)
+            if table is None:
+                table = self._keys[key] = self._add_table(afgen)
+            self.table[i] = table
+
+    def __call__(self, x, idx):
+        """Returns the interpolated values at x for the fields idx.
+        """
+        x = np.broadcast_to(np.asarray(x, dtype=np.float64), np.shape(idx))
+        table = self.table[idx]
+        rows = np.arange(len(table))
+        if len(table) and (table == table[0]).all():
+            # All fields use the same table, broadcast it
+            table = table[:1]
+            rows = 0
+        xs = self._x[table]
+        i = (xs[:, 1:-1] < x[:, None]).sum(axis=1)
+        with np.errstate(invalid="ignore"):
+            v = self._y[table][rows, i] + self._slopes[table][rows, i] * (x - xs[rows, i])
+        v = np.where(x <= self._x_first[table], self._y[table, 0], v)
+        v = np.where(x >= self._x_last[table], self._y[table, -1], v)
+        return v
+
 class MultiAfgen(object):
     """Emulates the AFGEN function in WOFOST for multi dimensional trait tables
     """
@@ -270,7 +460,7 @@ class AfgenTrait(TraitType):
         if isinstance(value, Afgen):
            return value
         elif isinstance(value, Iterable):
-           return Afgen(value)
+           return get_afgen(value)
         self.error(obj, value)
 
 class MultiAfgenTrait(TraitType):
@@ -299,6 +489,22 @@ def limit(vmin:float, vmax:float, v:float):
     else:             # v above range: return max
         return vmax
 
+def limit_array(vmin, vmax, v):
+    """Array version of `limit()`, vmin and vmax can be scalars or arrays.
+    """
+    return np.where(v < vmin, vmin, np.where(v < vmax, v, vmax))
+
+def ordinals_to_datetime64(ordinals):
+    """Returns an array of datetime64[D] for an array of day ordinals as
+    given by `date.toordinal()`, NaN becomes NaT.
+    """
+    ordinals = np.asarray(ordinals, dtype=np.float64)
+    days = np.full(ordinals.shape, np.datetime64("NaT"), dtype="datetime64[D]")
+    known = ~np.isnan(ordinals)
+    offset = ordinals[known] - dt.date(1970, 1, 1).toordinal()
+    days[known] = offset.astype(np.int64).astype("datetime64[D]")
+    return days
+
 def check_date(indate):
         """Check representations of date and try to force into a datetime.date
 
@@ -367,7 +573,157 @@ def doy(day):
             msg = "Parameter day is not a date or datetime object."
             raise RuntimeError(msg)
         
-def astro(day, latitude, radiation, _cache={}):
+class AstroTable(object):
+    """Radiation independent results of the ASTRO routine for every
+    day-of-year at one latitude.
+
+    :param latitude: latitude of location
+
+    The arrays DAYL, DAYLP, SINLD, COSLD, DSINB, DSINBE, SC and ANGOT are
+    indexed by day-of-year (1-366). The radiation dependent terms ATMTR and
+    DIFPP are computed by `astro()` for a single day or by
+    `radiation_terms()` for arrays of days.
+
+    The table is computed with the scalar math functions, which are not
+    always bit-identical to their numpy counterparts, so results are
+    exactly the same as those of the original ASTRO routine.
+    """
+    RAD = radians(1.)
+    ANGLE = -4.
+
+    def __init__(self, latitude):
+        if abs(latitude) > 90.:
+            msg = "Latitude not between -90 and 90"
+            raise RuntimeError(msg)
+        self.latitude = latitude
+        rows = [self._compute(IDAY) for IDAY in range(1, 367)]
+        # Row 0 is a dummy so that the arrays are indexed by day-of-year
+        rows.insert(0, rows[0])
+        (self.DAYL, self.DAYLP, self.SINLD, self.COSLD, self.DSINB, self.DSINBE,
+         self.SC, self.ANGOT) = np.array(rows).T.copy()
+        self._rows = rows
+
+    def _compute(self, IDAY):
+        """Radiation independent part of ASTRO for day-of-year IDAY.
+        """
+        RAD = self.RAD
+        ANGLE = self.ANGLE
+        LAT = self.latitude
+
+        # Declination and solar constant for this day
+        DEC = -asin(sin(23.45*RAD)*cos(2.*pi*(float(IDAY)+10.)/365.))
+        SC  = 1370.*(1.+0.033*cos(2.*pi*float(IDAY)/365.))
+
+        # calculation of daylength from intermediate variables
+        # SINLD, COSLD and AOB
+        SINLD = sin(RAD*LAT)*sin(DEC)
+        COSLD = cos(RAD*LAT)*cos(DEC)
+        AOB = SINLD/COSLD
+
+        # For very high latitudes and days in summer and winter a limit is
+        # inserted to avoid math errors when daylength reaches 24 hours in 
+        # summer or 0 hours in winter.
+
+        # Calculate solution for base=0 degrees
+        if abs(AOB) <= 1.0:
+            DAYL  = 12.0*(1.+2.*asin(AOB)/pi)
+            # integrals of sine of solar height
+            DSINB  = 3600.*(DAYL*SINLD+24.*COSLD*sqrt(1.-AOB**2)/pi)
+            DSINBE = 3600.*(DAYL*(SINLD+0.4*(SINLD**2+COSLD**2*0.5))+
+                     12.*COSLD*(2.+3.*0.4*SINLD)*sqrt(1.-AOB**2)/pi)
+        else:
+            if AOB >  1.0: DAYL = 24.0
+            if AOB < -1.0: DAYL = 0.0
+            # integrals of sine of solar height	
+            DSINB = 3600.*(DAYL*SINLD)
+            DSINBE = 3600.*(DAYL*(SINLD+0.4*(SINLD**2+COSLD**2*0.5)))
+
+        # Calculate solution for base=-4 (ANGLE) degrees
+        AOB_CORR = (-sin(ANGLE*RAD)+SINLD)/COSLD
+        if abs(AOB_CORR) <= 1.0:
+            DAYLP = 12.0*(1.+2.*asin(AOB_CORR)/pi)
+        elif AOB_CORR > 1.0:
+            DAYLP = 24.0
+        elif AOB_CORR < -1.0:
+            DAYLP = 0.0
+
+        # extraterrestrial radiation
+        ANGOT = SC*DSINB
+
+        return DAYL, DAYLP, SINLD, COSLD, DSINB, DSINBE, SC, ANGOT
+
+    def astro(self, IDAY, AVRAD):
+        """Returns the results of `astro()` for day-of-year IDAY and daily
+        global incoming radiation AVRAD (J/m2/day).
+        """
+        DAYL, DAYLP, SINLD, COSLD, DSINB, DSINBE, SC, ANGOT = self._rows[IDAY]
+
+        # atmospheric transmission
+        # Check for DAYL=0 as in that case the angot radiation is 0 as well
+        if DAYL > 0.0:
+            ATMTR = AVRAD/ANGOT
+        else:
+            ATMTR = 0.
+
+        # estimate fraction diffuse irradiation
+        if ATMTR > 0.75:
+            FRDIF = 0.23
+        elif (ATMTR <= 0.75) and (ATMTR > 0.35):
+            FRDIF = 1.33-1.46*ATMTR
+        elif (ATMTR <= 0.35) and (ATMTR > 0.07):
+            FRDIF = 1.-2.3*(ATMTR-0.07)**2
+        else:  # ATMTR <= 0.07
+            FRDIF = 1.
+
+        DIFPP = FRDIF*ATMTR*0.5*SC
+
+        return astro_nt(DAYL, DAYLP, SINLD, COSLD, DIFPP, ATMTR, DSINBE, ANGOT)
+
+    def radiation_terms(self, IDAY, AVRAD):
+        """Returns arrays (ATMTR, DIFPP) for arrays of day-of-year IDAY and
+        daily global incoming radiation AVRAD (J/m2/day).
+        """
+        IDAY = np.asarray(IDAY)
+        AVRAD = np.asarray(AVRAD, dtype=np.float64)
+        DAYL = self.DAYL[IDAY]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ATMTR = np.where(DAYL > 0.0, AVRAD/self.ANGOT[IDAY], 0.)
+
+        FRDIF = np.select([ATMTR > 0.75, ATMTR > 0.35, ATMTR > 0.07],
+                          [0.23, 1.33-1.46*ATMTR, 1.-2.3*(ATMTR-0.07)**2], 1.)
+        DIFPP = FRDIF*ATMTR*0.5*self.SC[IDAY]
+        return ATMTR, DIFPP
+
+    def astro_columns(self, IDAY, AVRAD):
+        """Returns the results of `astro()` as an `astro_nt` of arrays for
+        arrays of day-of-year IDAY and radiation AVRAD.
+        """
+        IDAY = np.asarray(IDAY)
+        ATMTR, DIFPP = self.radiation_terms(IDAY, AVRAD)
+        return astro_nt(self.DAYL[IDAY], self.DAYLP[IDAY], self.SINLD[IDAY], self.COSLD[IDAY],
+                        DIFPP, ATMTR, self.DSINBE[IDAY], self.ANGOT[IDAY])
+
+
+# Astro tables by latitude, least recently used first
+_astro_tables = OrderedDict()
+# Maximum number of latitudes for which astro tables are kept
+MAX_ASTRO_TABLES = 256
+
+def get_astro_table(latitude):
+    """Returns the AstroTable for latitude. Tables are kept for at most
+    MAX_ASTRO_TABLES latitudes, the least recently used are discarded.
+    """
+    table = _astro_tables.get(latitude)
+    if table is None:
+        table = AstroTable(latitude)
+        _astro_tables[latitude] = table
+        while len(_astro_tables) > MAX_ASTRO_TABLES:
+            _astro_tables.popitem(last=False)
+    else:
+        _astro_tables.move_to_end(latitude)
+    return table
+
+def astro(day, latitude, radiation):
     """python version of ASTRO routine by Daniel van Kraalingen.
     
     This subroutine calculates astronomic daylength, diurnal radiation
@@ -388,6 +744,9 @@ def astro(day, latitude, radiation, _cache={}):
         ATMTR     Daily atmospheric transmission                -      
         DSINBE    Daily total of effective solar height         s
         ANGOT     Angot radiation at top of atmosphere       J m-2 d-1
+
+    The radiation independent variables are looked up in the AstroTable of
+    the latitude, see `get_astro_table()`.
  
     Authors: Daniel van Kraalingen
     Date   : April 1991
@@ -396,94 +755,86 @@ def astro(day, latitude, radiation, _cache={}):
     Author      : Allard de Wit
     Date        : January 2011
     """
+    return get_astro_table(latitude).astro(doy(day), radiation)
 
-    # Check for range of latitude
+def astro_array(IDAY, latitude, radiation):
+    """Array version of `astro()`.
+
+    :param IDAY:        array of day-of-year values
+    :param latitude:    latitude of location
+    :param radiation:   array of daily global incoming radiation (J/m2/day)
+
+    Returns an `astro_nt` namedtuple with an array for each of the outputs
+    of `astro()`. The results are not cached.
+    """
     if abs(latitude) > 90.:
         msg = "Latitude not between -90 and 90"
         raise RuntimeError(msg)
     LAT = latitude
-        
-    # Determine day-of-year (IDAY) from day
-    IDAY = doy(day)
-    
-    # reassign radiation
-    AVRAD = radiation
-
-    # Test if variables for given (day, latitude, radiation) were already calculated
-    # in a previous run. If not (e.g. KeyError) calculate the variables, store
-    # in cache and return the value.
-    try:
-        return _cache[(IDAY, LAT, AVRAD)]
-    except KeyError:
-        pass
+    IDAY = np.asarray(IDAY, dtype=np.float64)
+    AVRAD = np.asarray(radiation, dtype=np.float64)
 
     # constants
     RAD = radians(1.)
     ANGLE = -4.
 
-    # Declination and solar constant for this day
-    DEC = -asin(sin(23.45*RAD)*cos(2.*pi*(float(IDAY)+10.)/365.))
-    SC  = 1370.*(1.+0.033*cos(2.*pi*float(IDAY)/365.))
+    # Declination and solar constant for each day
+    DEC = -np.arcsin(sin(23.45*RAD)*np.cos(2.*pi*(IDAY+10.)/365.))
+    SC = 1370.*(1.+0.033*np.cos(2.*pi*IDAY/365.))
 
-    # calculation of daylength from intermediate variables
-    # SINLD, COSLD and AOB
-    SINLD = sin(RAD*LAT)*sin(DEC)
-    COSLD = cos(RAD*LAT)*cos(DEC)
+    SINLD = sin(RAD*LAT)*np.sin(DEC)
+    COSLD = cos(RAD*LAT)*np.cos(DEC)
     AOB = SINLD/COSLD
 
-    # For very high latitudes and days in summer and winter a limit is
-    # inserted to avoid math errors when daylength reaches 24 hours in 
-    # summer or 0 hours in winter.
-
-    # Calculate solution for base=0 degrees
-    if abs(AOB) <= 1.0:
-        DAYL  = 12.0*(1.+2.*asin(AOB)/pi)
-        # integrals of sine of solar height
-        DSINB  = 3600.*(DAYL*SINLD+24.*COSLD*sqrt(1.-AOB**2)/pi)
-        DSINBE = 3600.*(DAYL*(SINLD+0.4*(SINLD**2+COSLD**2*0.5))+
-                 12.*COSLD*(2.+3.*0.4*SINLD)*sqrt(1.-AOB**2)/pi)
-    else:
-        if AOB >  1.0: DAYL = 24.0
-        if AOB < -1.0: DAYL = 0.0
-        # integrals of sine of solar height	
-        DSINB = 3600.*(DAYL*SINLD)
-        DSINBE = 3600.*(DAYL*(SINLD+0.4*(SINLD**2+COSLD**2*0.5)))
-
-    # Calculate solution for base=-4 (ANGLE) degrees
+    # Solution for base=0 degrees, with the limits for very high latitudes
+    inside = np.abs(AOB) <= 1.0
+    SQRT_AOB = np.sqrt(1.-np.clip(AOB, -1., 1.)**2)
+    DAYL = np.where(inside, 12.0*(1.+2.*np.arcsin(np.clip(AOB, -1., 1.))/pi),
+                    np.where(AOB > 1.0, 24.0, 0.0))
+    DSINB = np.where(inside, 3600.*(DAYL*SINLD+24.*COSLD*SQRT_AOB/pi),
+                     3600.*(DAYL*SINLD))
+    DSINBE = np.where(inside, 3600.*(DAYL*(SINLD+0.4*(SINLD**2+COSLD**2*0.5)) +
+                                     12.*COSLD*(2.+3.*0.4*SINLD)*SQRT_AOB/pi),
+                      3600.*(DAYL*(SINLD+0.4*(SINLD**2+COSLD**2*0.5))))
+
+    # Solution for base=-4 (ANGLE) degrees
     AOB_CORR = (-sin(ANGLE*RAD)+SINLD)/COSLD
-    if abs(AOB_CORR) <= 1.0:
-        DAYLP = 12.0*(1.+2.*asin(AOB_CORR)/pi)
-    elif AOB_CORR > 1.0:
-        DAYLP = 24.0
-    elif AOB_CORR < -1.0:
-        DAYLP = 0.0
+    DAYLP = np.where(np.abs(AOB_CORR) <= 1.0,
+                     12.0*(1.+2.*np.arcsin(np.clip(AOB_CORR, -1., 1.))/pi),
+                     np.where(AOB_CORR > 1.0, 24.0, 0.0))
 
     # extraterrestrial radiation and atmospheric transmission
     ANGOT = SC*DSINB
-    # Check for DAYL=0 as in that case the angot radiation is 0 as well
-    if DAYL > 0.0:
-        ATMTR = AVRAD/ANGOT
-    else:
-        ATMTR = 0.
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ATMTR = np.where(DAYL > 0.0, AVRAD/ANGOT, 0.)
 
     # estimate fraction diffuse irradiation
-    if ATMTR > 0.75:
-        FRDIF = 0.23
-    elif (ATMTR <= 0.75) and (ATMTR > 0.35):
-        FRDIF = 1.33-1.46*ATMTR
-    elif (ATMTR <= 0.35) and (ATMTR > 0.07):
-        FRDIF = 1.-2.3*(ATMTR-0.07)**2
-    else:  # ATMTR <= 0.07
-        FRDIF = 1.
-
+    FRDIF = np.select([ATMTR > 0.75, ATMTR > 0.35, ATMTR > 0.07],
+                      [0.23, 1.33-1.46*ATMTR, 1.-2.3*(ATMTR-0.07)**2], 1.)
     DIFPP = FRDIF*ATMTR*0.5*SC
 
-    retvalue = astro_nt(DAYL, DAYLP, SINLD, COSLD, DIFPP, ATMTR, DSINBE, ANGOT)
-    _cache[(IDAY, LAT, AVRAD)] = retvalue
+    return astro_nt(DAYL, DAYLP, SINLD, COSLD, DIFPP, ATMTR, DSINBE, ANGOT)
 
-    return retvalue
+def drv_astro(day, drv):
+    """Returns `astro()` for day with the latitude and radiation of the
+    driving variables drv. Uses the values precomputed by the columnar
+    weather store when drv is a WeatherDayView.
+    """
+    ASTRO = getattr(drv, "ASTRO", None)
+    if ASTRO is None:
+        return astro(day, drv.LAT, drv.IRRAD)
+    return ASTRO
+
+def drv_daylength(day, drv):
+    """Returns the photoperiodic daylength for day at the latitude of the
+    driving variables drv, see `drv_astro()`.
+    """
+    ASTRO = getattr(drv, "ASTRO", None)
+    if ASTRO is None:
+        return daylength(day, drv.LAT)
+    return ASTRO.DAYLP
 
-def daylength(day, latitude, angle=-4, _cache={}):
+def daylength(day, latitude, angle=-4):
     """Calculates the daylength for a given day, altitude and base.
 
     :param day:         date/datetime object
@@ -492,10 +843,9 @@ def daylength(day, latitude, angle=-4, _cache={}):
         is `angle` degrees under the horizon. Default is -4 degrees.
     
     Derived from the WOFOST routine ASTRO.FOR and simplified to include only
-    daylength calculation. Results are being cached for performance
+    daylength calculation. For the default angle the daylength is looked up
+    in the AstroTable of the latitude.
     """
-    #from unum.units import h
-
     # Check for range of latitude
     if abs(latitude) > 90.:
         msg = "Latitude not between -90 and 90"
@@ -503,14 +853,8 @@ def daylength(day, latitude, angle=-4, _cache={}):
     
     # Calculate day-of-year from date object day
     IDAY = doy(day)
-    
-    # Test if daylength for given (day, latitude, angle) was already calculated
-    # in a previous run. If not (e.g. KeyError) calculate the daylength, store
-    # in cache and return the value.
-    try:
-        return _cache[(IDAY, latitude, angle)]
-    except KeyError:
-        pass
+    if angle == AstroTable.ANGLE:
+        return get_astro_table(latitude).DAYLP[IDAY].item()
     
     # constants
     RAD = radians(1.)
@@ -530,9 +874,6 @@ def daylength(day, latitude, angle=-4, _cache={}):
         DAYLP = 24.0
     else:
         DAYLP =  0.0
-
-    # store results in cache
-    _cache[(IDAY, latitude, angle)] = DAYLP
     
     return DAYLP
 
@@ -627,6 +968,25 @@ def reference_ET(DAY, LAT, ELEV, TMIN, TMAX, IRRAD, VAP, WIND,
 
     return E0, ES0, ET0
 
+def reference_ET_array(IDAY, LAT, ELEV, TMIN, TMAX, IRRAD, VAP, WIND,
+                       ANGSTA, ANGSTB, ETMODEL="PM"):
+    """Array version of `reference_ET()`.
+
+    Takes an array of day-of-year values (IDAY) instead of a date and arrays
+    for the weather variables, LAT and ELEV are scalars. Returns a tuple
+    (E0, ES0, ET0) of arrays in mm/d.
+    """
+    if ETMODEL not in ["PM", "P"]:
+        msg = "Variable ETMODEL can have values 'PM'|'P' only."
+        raise RuntimeError(msg)
+
+    E0, ES0, ET0 = penman_array(IDAY, LAT, ELEV, TMIN, TMAX, IRRAD, VAP, WIND,
+                                ANGSTA, ANGSTB)
+    if ETMODEL == "PM":
+        ET0 = penman_monteith_array(IDAY, LAT, ELEV, TMIN, TMAX, IRRAD, VAP, WIND)
+
+    return E0, ES0, ET0
+
 def penman(DAY, LAT, ELEV, TMIN, TMAX, AVRAD, VAP, WIND2, ANGSTA, ANGSTB):
     """Calculates E0, ES0, ET0 based on the Penman model.
     
@@ -718,6 +1078,46 @@ def penman(DAY, LAT, ELEV, TMIN, TMAX, AVRAD, VAP, WIND2, ANGSTA, ANGSTB):
     
     return E0, ES0, ET0
 
+def penman_array(IDAY, LAT, ELEV, TMIN, TMAX, AVRAD, VAP, WIND2, ANGSTA, ANGSTB):
+    """Array version of `penman()`, see `reference_ET_array()`.
+    """
+    PSYCON = 0.67; REFCFW = 0.05; REFCFS = 0.15; REFCFC = 0.25
+    LHVAP = 2.45E6; STBC =  5.670373E-8 * 24*60*60 # (=4.9E-3)
+
+    TMIN = np.asarray(TMIN, dtype=np.float64)
+    TMAX = np.asarray(TMAX, dtype=np.float64)
+    AVRAD = np.asarray(AVRAD, dtype=np.float64)
+    WIND2 = np.asarray(WIND2, dtype=np.float64)
+
+    TMPA = (TMIN+TMAX)/2.
+    TDIF = TMAX - TMIN
+    BU = 0.54 + 0.35 * np.clip((TDIF-12.)/4., 0., 1.)
+
+    PBAR = 1013.*np.exp(-0.034*ELEV/(TMPA+273.))
+    GAMMA = PSYCON*PBAR/1013.
+
+    SVAP = 6.10588 * np.exp(17.32491*TMPA/(TMPA+238.102))
+    DELTA = 238.102*17.32491*SVAP/(TMPA+238.102)**2
+    VAP = np.minimum(VAP, SVAP)
+
+    r = astro_array(IDAY, LAT, AVRAD)
+    RELSSD = np.clip((r.ATMTR-abs(ANGSTA))/abs(ANGSTB), 0., 1.)
+
+    RB = STBC*(TMPA+273.)**4*(0.56-0.079*np.sqrt(VAP))*(0.1+0.9*RELSSD)
+
+    RNW = (AVRAD*(1.-REFCFW)-RB)/LHVAP
+    RNS = (AVRAD*(1.-REFCFS)-RB)/LHVAP
+    RNC = (AVRAD*(1.-REFCFC)-RB)/LHVAP
+
+    EA  = 0.26 * np.maximum(0.,(SVAP-VAP)) * (0.5+BU*WIND2)
+    EAC = 0.26 * np.maximum(0.,(SVAP-VAP)) * (1.0+BU*WIND2)
+
+    E0  = (DELTA*RNW+GAMMA*EA)/(DELTA+GAMMA)
+    ES0 = (DELTA*RNS+GAMMA*EA)/(DELTA+GAMMA)
+    ET0 = (DELTA*RNC+GAMMA*EAC)/(DELTA+GAMMA)
+
+    return np.maximum(0., E0), np.maximum(0., ES0), np.maximum(0., ET0)
+
 def penman_monteith(DAY, LAT, ELEV, TMIN, TMAX, AVRAD, VAP, WIND2):
     """Calculates reference ET0 based on the Penman-Monteith model.
 
@@ -814,6 +1214,52 @@ def penman_monteith(DAY, LAT, ELEV, TMIN, TMAX, AVRAD, VAP, WIND2):
 
     return ET0
 
+def penman_monteith_array(IDAY, LAT, ELEV, TMIN, TMAX, AVRAD, VAP, WIND2):
+    """Array version of `penman_monteith()`, see `reference_ET_array()`.
+    """
+    PSYCON = 0.665
+    REFCFC = 0.23; CRES = 70.
+    LHVAP = 2.45E6
+    STBC = 4.903E-3
+    G = 0.
+
+    TMIN = np.asarray(TMIN, dtype=np.float64)
+    TMAX = np.asarray(TMAX, dtype=np.float64)
+    AVRAD = np.asarray(AVRAD, dtype=np.float64)
+    WIND2 = np.asarray(WIND2, dtype=np.float64)
+
+    TMPA = (TMIN+TMAX)/2.
+    VAP = hPa2kPa(np.asarray(VAP, dtype=np.float64))
+
+    T = 293.0
+    PATM = 101.3 * pow((T - (0.0065*ELEV))/T, 5.26)
+    GAMMA = PSYCON * PATM * 1.0E-3
+
+    SVAP_TMPA = 0.6108 * np.exp((17.27 * TMPA) / (237.3 + TMPA))
+    DELTA = (4098. * SVAP_TMPA)/(TMPA + 237.3)**2
+
+    SVAP_TMAX = 0.6108 * np.exp((17.27 * TMAX) / (237.3 + TMAX))
+    SVAP_TMIN = 0.6108 * np.exp((17.27 * TMIN) / (237.3 + TMIN))
+    SVAP = (SVAP_TMAX + SVAP_TMIN) / 2.
+
+    VAP = np.minimum(VAP, SVAP)
+
+    STB_TMAX = STBC * Celsius2Kelvin(TMAX)**4
+    STB_TMIN = STBC * Celsius2Kelvin(TMIN)**4
+    RNL_TMP = ((STB_TMAX + STB_TMIN) / 2.) * (0.34 - 0.14 * np.sqrt(VAP))
+
+    r = astro_array(IDAY, LAT, AVRAD)
+    CSKYRAD = (0.75 + (2e-05 * ELEV)) * r.ANGOT
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        RNL = RNL_TMP * (1.35 * (AVRAD/CSKYRAD) - 0.35)
+    RN = ((1-REFCFC) * AVRAD - RNL)/LHVAP
+    EA = ((900./(TMPA + 273)) * WIND2 * (SVAP - VAP))
+    MGAMMA = GAMMA * (1. + (CRES/208.*WIND2))
+    ET0 = (DELTA * (RN-G))/(DELTA + MGAMMA) + (GAMMA * EA)/(DELTA + MGAMMA)
+
+    return np.where(CSKYRAD > 0, np.maximum(0., ET0), 0.)
+
 def check_angstromAB(xA, xB):
     """Routine checks validity of Angstrom coefficients.
     
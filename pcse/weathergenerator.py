@@ -0,0 +1,313 @@
+"""Stochastic weather generator and ensemble weather data provider
+
+The WeatherGenerator is a Richardson type generator fitted on the observed
+weather of a site: rainfall occurrence follows a first order Markov chain
+and wet day amounts a gamma distribution, both per calendar month. The
+residuals of TMIN, TMAX, IRRAD, VAP and WIND from their seasonal means,
+conditional on rainfall occurrence, follow a multivariate AR(1) process.
+
+The EnsembleWeatherDataProvider samples any number of synthetic weather
+records from the generator at once, each member is served from its own
+ColumnarWeatherStore.
+
+Written by: Will Solow, 2024
+"""
+import datetime as dt
+
+import numpy as np
+
+from .nasapower import WeatherDataProvider, ColumnarWeatherStore, ColumnarWeatherDataProvider
+from .util import reference_ET_array
+from .utils import exceptions as exc
+
+
+def _day_of_year(start, ndays):
+    """Returns the day-of-year and month (0-11) of ndays consecutive days
+    starting at the ordinal start.
+    """
+    days = (np.arange(start, start + ndays) - dt.date(1970, 1, 1).toordinal()).astype("datetime64[D]")
+    doy = (days - days.astype("datetime64[Y]").astype("datetime64[D]")).astype(int) + 1
+    month = days.astype("datetime64[M]").astype(int) % 12
+    return doy, month
+
+
+def _harmonics(doy, nharmonics):
+    """Returns the design matrix of a Fourier series of doy with nharmonics
+    harmonics, shape (len(doy), 1 + 2*nharmonics).
+    """
+    omega = 2*np.pi*doy/365.25
+    columns = [np.ones_like(omega)]
+    for k in range(1, nharmonics + 1):
+        columns += [np.cos(k*omega), np.sin(k*omega)]
+    return np.stack(columns, axis=1)
+
+
+class WeatherGenerator(object):
+    """Stochastic weather generator fitted on the weather in a
+    ColumnarWeatherStore.
+
+    :param store: ColumnarWeatherStore with the observed weather of the site
+    :param wet_threshold: minimum rainfall (cm/day) of a wet day
+    :param nharmonics: number of harmonics of the seasonal means and
+        standard deviations of the residual variables
+
+    Days with missing values are skipped in the fit.
+    """
+    residual_variables = ("TMIN", "TMAX", "IRRAD", "VAP", "WIND")
+
+    def __init__(self, store, wet_threshold=0.01, nharmonics=2):
+        self.LAT, self.LON, self.ELEV = store.LAT, store.LON, store.ELEV
+        self.wet_threshold = wet_threshold
+        self.nharmonics = nharmonics
+
+        doy, month = _day_of_year(store.start, store.ndays)
+        rain = store.columns["RAIN"]
+        X = np.stack([store.columns[v] for v in self.residual_variables], axis=1)
+        valid = store.available & ~np.isnan(rain) & ~np.isnan(X).any(axis=1)
+        if valid.sum() < 365:
+            msg = "At least one year of weather data is needed to fit a WeatherGenerator."
+            raise exc.WeatherDataProviderError(msg)
+        wet = rain > wet_threshold
+
+        self._fit_rainfall(rain, wet, valid, month)
+        Z = self._fit_seasonal(X, wet, valid, doy)
+        self._fit_residuals(Z, valid)
+        self.lower = X[valid].min(axis=0)
+        self.upper = X[valid].max(axis=0)
+
+    def _fit_rainfall(self, rain, wet, valid, month):
+        """Fits the Markov chain of rainfall occurrence and the gamma
+        distribution of wet day amounts per calendar month.
+        """
+        pairs = valid[1:] & valid[:-1]
+        prev_wet, next_wet, pair_month = wet[:-1][pairs], wet[1:][pairs], month[1:][pairs]
+        self.p_wet_dry = np.zeros(12)
+        self.p_wet_wet = np.zeros(12)
+        self.gamma_shape = np.ones(12)
+        self.gamma_scale = np.full(12, self.wet_threshold)
+        for m in range(12):
+            dry = ~prev_wet & (pair_month == m)
+            if dry.any():
+                self.p_wet_dry[m] = next_wet[dry].mean()
+            wet_days = prev_wet & (pair_month == m)
+            if wet_days.any():
+                self.p_wet_wet[m] = next_wet[wet_days].mean()
+
+            amounts = rain[valid & wet & (month == m)]
+            if len(amounts) > 1 and amounts.var() > 0:
+                self.gamma_shape[m] = amounts.mean()**2/amounts.var()
+                self.gamma_scale[m] = amounts.var()/amounts.mean()
+            elif len(amounts) > 0:
+                self.gamma_scale[m] = amounts.mean()
+
+    def _fit_seasonal(self, X, wet, valid, doy):
+        """Fits the seasonal means and standard deviations of the residual
+        variables on dry and wet days and returns the standardized residuals.
+        """
+        H = _harmonics(doy, self.nharmonics)
+        self.mean_coef = np.zeros((2, H.shape[1], X.shape[1]))
+        self.std_coef = np.zeros((2, H.shape[1], X.shape[1]))
+        Z = np.zeros_like(X)
+        for state in (0, 1):
+            sel = valid & (wet == state)
+            if sel.sum() < H.shape[1] + 1:
+                # Too few days in this state, use the fit of all days
+                sel = valid
+            mean_coef = np.linalg.lstsq(H[sel], X[sel], rcond=None)[0]
+            sqres = (X[sel] - H[sel] @ mean_coef)**2
+            std_coef = np.linalg.lstsq(H[sel], sqres, rcond=None)[0]
+            self.mean_coef[state] = mean_coef
+            self.std_coef[state] = std_coef
+
+            rows = valid & (wet == state)
+            mean, std = self._seasonal(H[rows], state)
+            Z[rows] = (X[rows] - mean)/std
+        return Z
+
+    def _seasonal(self, H, state):
+        """Returns the seasonal means and standard deviations for the design
+        matrix H of the harmonics and the rainfall state.
+        """
+        mean = H @ self.mean_coef[state]
+        std = np.sqrt(np.maximum(H @ self.std_coef[state], 1e-12))
+        return mean, std
+
+    def _fit_residuals(self, Z, valid):
+        """Fits the multivariate AR(1) model z(t) = A z(t-1) + B e(t) on the
+        standardized residuals.
+        """
+        pairs = valid[1:] & valid[:-1]
+        Z0, Z1 = Z[1:][pairs], Z[:-1][pairs]
+        M0 = (Z[valid].T @ Z[valid])/valid.sum()
+        M1 = (Z0.T @ Z1)/pairs.sum()
+        self.A = M1 @ np.linalg.pinv(M0)
+        # B B^T = M0 - A M1^T, negative eigenvalues due to sampling are dropped
+        eigval, eigvec = np.linalg.eigh(M0 - self.A @ M1.T)
+        self.B = eigvec * np.sqrt(np.maximum(eigval, 0.))
+
+    def sample(self, n_members, first_date, last_date, seed=None):
+        """Samples n_members weather records from first_date up to and
+        including last_date.
+
+        :return: array of shape (n_members, len(ColumnarWeatherStore.variables),
+            ndays) with the weather variables in the units of the
+            ColumnarWeatherStore, without E0, ES0 and ET0 which are NaN.
+
+        All members are drawn at once, the loop over the days only evaluates
+        the Markov chain and the AR(1) process for all members together.
+        """
+        rng = np.random.default_rng(seed)
+        start = first_date.toordinal()
+        ndays = last_date.toordinal() - start + 1
+        doy, month = _day_of_year(start, ndays)
+        nvars = len(self.residual_variables)
+
+        # Rainfall occurrence and amounts
+        uniform = rng.random((ndays, n_members))
+        wet = np.empty((ndays, n_members), dtype=bool)
+        p_wet = self.p_wet_dry[month[0]]/max(1. - self.p_wet_wet[month[0]] + self.p_wet_dry[month[0]], 1e-12)
+        prev = uniform[0] < p_wet
+        wet[0] = prev
+        for t in range(1, ndays):
+            m = month[t]
+            prev = uniform[t] < np.where(prev, self.p_wet_wet[m], self.p_wet_dry[m])
+            wet[t] = prev
+        rain = rng.gamma(self.gamma_shape[month][:, None], self.gamma_scale[month][:, None],
+                         size=(ndays, n_members))
+        rain = np.where(wet, np.maximum(rain, self.wet_threshold), 0.)
+
+        # Standardized residuals
+        noise = rng.standard_normal((ndays, n_members, nvars)) @ self.B.T
+        Z = np.empty((ndays, n_members, nvars))
+        Z[0] = noise[0]
+        for t in range(1, ndays):
+            Z[t] = Z[t-1] @ self.A.T + noise[t]
+
+        H = _harmonics(doy, self.nharmonics)
+        X = np.empty_like(Z)
+        for state in (0, 1):
+            mean, std = self._seasonal(H, state)
+            X = np.where((wet == state)[:, :, None], mean[:, None, :] + std[:, None, :]*Z, X)
+        X = np.clip(X, self.lower, self.upper)
+
+        variables = ColumnarWeatherStore.variables
+        data = np.full((n_members, len(variables), ndays), np.nan)
+        for j, varname in enumerate(self.residual_variables):
+            data[:, variables.index(varname)] = X[:, :, j].T
+        TMIN = data[:, variables.index("TMIN")]
+        TMAX = data[:, variables.index("TMAX")]
+        np.maximum(TMAX, TMIN, out=TMAX)
+        data[:, variables.index("TEMP")] = (TMIN + TMAX)/2.
+        data[:, variables.index("RAIN")] = rain.T
+        return data
+
+
+class EnsembleWeatherDataProvider(WeatherDataProvider):
+    """Ensemble of synthetic weather records sampled from a WeatherGenerator
+    fitted on the weather of another provider.
+
+    :param provider: WeatherDataProvider with the observed weather of the site
+    :param n_members: number of ensemble members
+    :param first_date: first day of the members, defaults to the first day
+        of the provider
+    :param last_date: last day of the members, defaults to the last day of
+        the provider
+    :param seed: seed for the random number generator
+    :param wet_threshold: minimum rainfall (cm/day) of a wet day
+
+    Every member holds its own ColumnarWeatherStore, a member requires about
+    1.2 MB per 40 years of weather. Use `member()` to get a provider that
+    serves a single member, e.g. to run an Engine on it.
+    """
+    supports_ensembles = True
+
+    def __init__(self, provider, n_members, first_date=None, last_date=None, seed=None,
+                 wet_threshold=0.01):
+        WeatherDataProvider.__init__(self)
+        if n_members < 1:
+            msg = "An ensemble needs at least one member, found %s." % n_members
+            raise exc.WeatherDataProviderError(msg)
+        self.latitude = provider.latitude
+        self.longitude = provider.longitude
+        self.elevation = provider.elevation
+        self.ETmodel = provider.ETmodel
+        self.angstA = provider.angstA
+        self.angstB = provider.angstB
+        self.description = ["Synthetic weather with %i members generated from:" % n_members]
+        self.description += list(provider.description)
+        self.n_members = n_members
+
+        self.generator = WeatherGenerator(provider.columnar_store(), wet_threshold)
+        first_date = provider.first_date if first_date is None else first_date
+        last_date = provider.last_date if last_date is None else last_date
+        data = self.generator.sample(n_members, first_date, last_date, seed)
+
+        # Reference ET for all members at once
+        variables = ColumnarWeatherStore.variables
+        ndays = data.shape[2]
+        doy, _ = _day_of_year(first_date.toordinal(), ndays)
+        weather = {v: data[:, variables.index(v)] for v in ("TMIN", "TMAX", "IRRAD", "VAP", "WIND")}
+        E0, ES0, ET0 = reference_ET_array(np.broadcast_to(doy, (n_members, ndays)), self.latitude,
+                                          self.elevation, weather["TMIN"], weather["TMAX"],
+                                          weather["IRRAD"], weather["VAP"], weather["WIND"],
+                                          self.angstA, self.angstB, self.ETmodel)
+        data[:, variables.index("E0")] = E0/10.
+        data[:, variables.index("ES0")] = ES0/10.
+        data[:, variables.index("ET0")] = ET0/10.
+
+        available = np.ones(ndays, dtype=bool)
+        site = (self.latitude, self.longitude, self.elevation)
+        self._members = [ColumnarWeatherStore(first_date, data[m], available, site)
+                         for m in range(n_members)]
+        self._providers = [None] * n_members
+        self._columnar = self._members[0]
+        self._frozen = True
+
+    def _check_member(self, member_id):
+        if not (0 <= member_id < self.n_members):
+            msg = "No ensemble member %s, the ensemble has %i members." % (member_id, self.n_members)
+            raise exc.WeatherDataProviderError(msg)
+
+    def columnar_store(self, member_id=0):
+        """Returns the ColumnarWeatherStore of ensemble member member_id.
+        """
+        self._check_member(member_id)
+        return self._members[member_id]
+
+    def member(self, member_id):
+        """Returns a frozen ColumnarWeatherDataProvider serving ensemble member
+        member_id.
+        """
+        self._check_member(member_id)
+        if self._providers[member_id] is None:
+            self._providers[member_id] = ColumnarWeatherDataProvider(
+                self._members[member_id], self.latitude, self.longitude, self.description,
+                self.ETmodel, self.angstA, self.angstB)
+        return self._providers[member_id]
+
+    def day_view(self, day, member_id=0):
+        if type(day) is not dt.date:
+            day = self.check_keydate(day)
+        return self.columnar_store(member_id).day_view(day)
+
+    def __call__(self, day, member_id=0):
+        return self.day_view(day, member_id)
+
+    @property
+    def first_date(self):
+        return self._columnar.first_date
+
+    @property
+    def last_date(self):
+        return self._columnar.last_date
+
+    @property
+    def missing(self):
+        return 0
+
+    @property
+    def missing_days(self):
+        return []
+
+    def export(self):
+        return self.member(0).export()
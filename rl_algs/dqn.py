@@ -102,6 +102,20 @@ def make_env(kwargs, seed, idx, capture_video, run_name):
 
     return thunk
 
+def make_envs(kwargs, num_envs, capture_video, run_name):
+    """Steps the environments as a batch with gym.make_vec when the environment
+    has a vector entry point, video recording needs the single environments
+    of a SyncVectorEnv
+    """
+    env_id, env_kwargs = utils.get_gym_args(kwargs)
+    if capture_video or gym.spec(env_id).vector_entry_point is None:
+        return gym.vector.SyncVectorEnv(
+            [make_env(kwargs, kwargs.seed + i, i, capture_video, run_name) for i in range(num_envs)]
+        )
+    envs = gym.make_vec(env_id, num_envs=num_envs, vectorization_mode="custom", vector_kwargs=env_kwargs)
+    envs.single_action_space.seed(kwargs.seed)
+    return envs
+
 
 # ALGO LOGIC: initialize agent here:
 class QNetwork(nn.Module):
@@ -157,9 +171,7 @@ def main(args):
     device = torch.device("cuda" if torch.cuda.is_available() and args.cuda else "cpu")
 
     # env setup
-    envs = gym.vector.SyncVectorEnv(
-        [make_env(args, args.seed + i, i, args.capture_video, run_name) for i in range(args.num_envs)]
-    )
+    envs = make_envs(args, args.num_envs, args.capture_video, run_name)
     assert isinstance(envs.single_action_space, gym.spaces.Discrete), "only discrete action space is supported"
 
     q_network = QNetwork(envs).to(device)
@@ -138,6 +138,19 @@ def make_env(kwargs, idx, capture_video, run_name):
         return env
     return thunk
 
+def make_envs(kwargs, num_envs, capture_video, run_name):
+    """Steps the environments as a batch with gym.make_vec when the environment
+    has a vector entry point, video recording and reward wrappers need the 
+    single environments of a SyncVectorEnv
+    """
+    env_id, env_kwargs = utils.get_gym_args(kwargs)
+    if capture_video or kwargs.env_reward != "default" or gym.spec(env_id).vector_entry_point is None:
+        return gym.vector.SyncVectorEnv(
+            [make_env(kwargs, i, capture_video, run_name) for i in range(num_envs)],
+        )
+    envs = gym.make_vec(env_id, num_envs=num_envs, vectorization_mode="custom", vector_kwargs=env_kwargs)
+    return gym.wrappers.NormalizeReward(envs)
+
 
 def main(kwargs):
     args = kwargs.ppo
@@ -176,9 +189,7 @@ def main(kwargs):
     device = torch.device("cuda" if torch.cuda.is_available() and args.cuda else "cpu")
 
     # env setup
-    envs = gym.vector.SyncVectorEnv(
-        [make_env(kwargs, i, args.capture_video, run_name) for i in range(args.num_envs)],
-    )
+    envs = make_envs(kwargs, args.num_envs, args.capture_video, run_name)
     assert isinstance(envs.single_action_space, gym.spaces.Discrete), "only discrete action space is supported"
 
     agent = Agent(envs).to(device)
@@ -0,0 +1,106 @@
+"""Shared fixtures for the PCSE and WOFOST Gym tests
+
+The tests run offline: synthetic NASA POWER responses are generated for the
+sites of the agromanagement files and written to a weather cache in a
+temporary working directory, as pcse.prefetch does for real responses.
+
+Written by: Will Solow, 2024
+"""
+import os
+import sys
+import datetime as dt
+
+import numpy as np
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "wofost_gym")]
+
+from pcse.nasapower import NASAPowerWeatherDataProvider
+
+# Sites of env_config/agro_config/*.yaml
+SITES = [(52., 5.), (46., -120.)]
+FIRST_DAY = dt.date(1983, 7, 1)
+LAST_DAY = dt.date(2024, 6, 30)
+
+ANNUAL_AGRO = "env_config/agro_config/annual_agro_npk.yaml"
+PERENNIAL_AGRO = "env_config/agro_config/perennial_agro_npk.yaml"
+
+
+def make_power_response(latitude, longitude, first_day=FIRST_DAY, last_day=LAST_DAY, seed=0):
+    """Returns a synthetic response of the POWER daily point API with a
+    seasonal cycle in temperature and radiation.
+    """
+    rng = np.random.default_rng(seed)
+    ndays = (last_day - first_day).days + 1
+    days = [first_day + dt.timedelta(i) for i in range(ndays)]
+    doy = np.array([d.timetuple().tm_yday for d in days])
+    season = np.sin(2 * np.pi * (doy - 110) / 365.)
+    tmean = 10. + 10. * season + rng.normal(0., 2., ndays)
+    toa = 25. + 15. * np.sin(2 * np.pi * (doy - 80) / 365.)
+    values = {"TOA_SW_DWN": toa,
+              "ALLSKY_SFC_SW_DWN": toa * rng.uniform(0.3, 0.75, ndays),
+              "T2M": tmean,
+              "T2M_MIN": tmean - 4.,
+              "T2M_MAX": tmean + 4.,
+              "T2MDEW": tmean - 6.,
+              "WS2M": rng.uniform(1., 5., ndays),
+              "PRECTOTCORR": np.maximum(0., rng.normal(0., 4., ndays))}
+    keys = [d.strftime("%Y%m%d") for d in days]
+    parameters = {name: dict(zip(keys, np.round(v, 2).tolist())) for name, v in values.items()}
+    return {"header": {"title": "Synthetic POWER data", "fill_value": -999.},
+            "geometry": {"coordinates": [longitude, latitude, 10.]},
+            "properties": {"parameter": parameters}}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def weather_cache(tmp_path_factory):
+    """Runs the tests in a temporary working directory with a weather cache
+    for all sites.
+    """
+    workdir = tmp_path_factory.mktemp("pcse_home")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.chdir(workdir)
+        os.makedirs(os.path.join(".pcse", "meteo_cache"))
+        for seed, (latitude, longitude) in enumerate(SITES):
+            powerdata = make_power_response(latitude, longitude, seed=seed)
+            NASAPowerWeatherDataProvider.from_POWER_data(latitude, longitude, powerdata)
+        yield workdir
+
+
+def env_kwargs(env_id="lnpkw-v0", agro_fpath=None, **kwargs):
+    """Returns the keyword arguments for gym.make(env_id). Keyword arguments
+    are set on the NPK_Args.
+    """
+    import wofost_gym
+    from wofost_gym.args import NPK_Args, WOFOST_Args, Agro_Args
+
+    if agro_fpath is None:
+        agro_fpath = PERENNIAL_AGRO if "perennial" in env_id else ANNUAL_AGRO
+    args = NPK_Args(wf_args=WOFOST_Args(), ag_args=Agro_Args(), **kwargs)
+    return dict(args=args, base_fpath=ROOT + os.sep, agro_fpath=agro_fpath,
+                site_fpath="env_config/site_config/", crop_fpath="env_config/crop_config/")
+
+
+def make_env(env_id="lnpkw-v0", agro_fpath=None, **kwargs):
+    """Returns the unwrapped WOFOST Gym environment env_id, see env_kwargs().
+    """
+    import gymnasium as gym
+
+    return gym.make(env_id, **env_kwargs(env_id, agro_fpath, **kwargs)).unwrapped
+
+
+def run_episode(env, year=1990, actions=None, max_steps=500):
+    """Resets env to year and runs it until it terminates or truncates.
+    Returns the stacked observations and the rewards.
+    """
+    obs, _ = env.reset(year=year)
+    observations, rewards = [obs], []
+    for i in range(max_steps):
+        action = 0 if actions is None else actions[i % len(actions)]
+        obs, reward, term, trunc, _ = env.step(action)
+        observations.append(obs)
+        rewards.append(reward)
+        if term or trunc:
+            break
+    return np.array(observations), np.array(rewards)
@@ -0,0 +1,244 @@
+"""Tests for the Engine API: batched runs, output recording and teardown
+
+Written by: Will Solow, 2024
+"""
+import sys
+import copy
+from datetime import date
+
+import numpy as np
+import pytest
+
+from pcse.engine import Wofost8Engine, BatchWofost8Engine
+from pcse import signals
+from pcse.utils import exceptions as exc
+
+from conftest import make_env
+
+
+def _engine(env, config=None):
+    return Wofost8Engine(env.parameterprovider.copy(), env.weatherdataprovider,
+                         env.agromanagement, config=env.config if config is None else config)
+
+
+def _assert_matches(batch, singles, varnames):
+    for varname in varnames:
+        expected = [engine.get_variable(varname) for engine in singles]
+        expected = [np.nan if v is None else v for v in expected]
+        np.testing.assert_allclose(batch.get_variable(varname), expected, rtol=1e-9)
+
+
+@pytest.mark.parametrize("env_id", ["lnpkw-v0", "pp-v0", "lnpk-v0", "ln-v0", "lnw-v0", "lw-v0"])
+def test_batch_engine_matches_single_engines(env_id):
+    env = make_env(env_id)
+    batch = BatchWofost8Engine(env.parameterprovider, env.weatherdataprovider,
+                               env.agromanagement, config=env.config, n=3)
+    singles = [_engine(env) for _ in range(3)]
+    varnames = ("DVS", "LAI", "TAGP", "WSO", "NuptakeTotal", "SM", "WTRAT", "TOTIRRIG",
+                "NAVAIL", "RFTRA", "FIN")
+
+    amounts = np.array([1., 2., 3.])
+    mask = np.array([True, False, True])
+    batch.run(days=60)
+    batch.irrigate(amounts, mask=mask)
+    batch.apply_npk(mask=~mask, N_amount=20., N_recovery=0.7)
+    for i, engine in enumerate(singles):
+        engine.run(days=60)
+        if mask[i]:
+            engine._send_signal(signals.irrigate, amount=amounts[i], efficiency=1.0)
+        else:
+            engine._send_signal(signals.apply_npk, N_amount=20., N_recovery=0.7)
+
+    # Run past the end of the crop and the site, comparing along the way
+    for _ in range(4):
+        batch.run(days=80)
+        for engine in singles:
+            engine.run(days=80)
+        _assert_matches(batch, singles, varnames)
+        assert list(batch.terminated) == [engine.flag_terminate for engine in singles]
+    assert batch.terminated.all()
+
+
+def test_batch_engine_harvest():
+    env = make_env()
+    batch = BatchWofost8Engine(env.parameterprovider, env.weatherdataprovider,
+                               env.agromanagement, config=env.config, n=2)
+    singles = [_engine(env) for _ in range(2)]
+    batch.run(days=200)
+    batch.harvest(efficiency=0.8, mask=[False, True])
+    for engine in singles:
+        engine.run(days=200)
+    singles[1]._send_signal(signals.crop_harvest, day=singles[1].day, efficiency=0.8)
+    _assert_matches(batch, singles, ("WSO", "HWSO", "LHW"))
+    batch.run(days=10)
+    for engine in singles:
+        engine.run(days=10)
+    _assert_matches(batch, singles, ("WSO", "HWSO", "LHW", "DVS"))
+
+
+def test_batch_engine_reset():
+    env = make_env()
+    first = copy.deepcopy(env.agromanagement)
+    env.reset(year=1990)
+    second = copy.deepcopy(env.agromanagement)
+    batch = BatchWofost8Engine(env.parameterprovider, env.weatherdataprovider,
+                               first, config=env.config, n=2)
+    batch.run(days=100)
+    batch.reset(mask=[False, True], agromanagement=second)
+    batch.run(days=150)
+
+    continued = Wofost8Engine(env.parameterprovider.copy(), env.weatherdataprovider,
+                              first, config=env.config)
+    continued.run(days=250)
+    restarted = Wofost8Engine(env.parameterprovider.copy(), env.weatherdataprovider,
+                              second, config=env.config)
+    restarted.run(days=150)
+    _assert_matches(batch, [continued, restarted], ("DVS", "LAI", "WSO", "SM", "NAVAIL"))
+    assert list(batch.day.astype(object)) == [continued.day, restarted.day]
+    assert continued.day.year != restarted.day.year
+    with pytest.raises(exc.PCSEError):
+        batch.reset(agromanagement=[second])
+
+
+def test_batch_engine_output_buffer():
+    env = make_env()
+    batch = BatchWofost8Engine(env.parameterprovider, env.weatherdataprovider,
+                               env.agromanagement, config=env.config, n=3)
+    buffer = batch.set_output_buffer(["DVS", "LAI", "DOP"])
+    assert buffer.shape == (3, 3) and batch.get_output_buffer() is buffer
+    batch.run(days=50, mask=[True, True, False])
+    np.testing.assert_array_equal(buffer[:2, :2], batch.get_variables(["DVS", "LAI"])[:2])
+    assert np.isnan(buffer[2]).all()
+    dop = batch.get_variable("DOP")[0].astype(object)
+    assert buffer[0, 2] == float(dop.strftime("%Y%m%d"))
+    days = batch.get_output_day()
+    assert days[0] == days[1] == batch.day[0] and np.isnat(days[2])
+    assert batch.get_variables(["DVS", "LAI"]).shape == (3, 2)
+    assert np.isnan(batch.get_variable("NOT_A_VARIABLE")).all()
+
+
+def test_batch_engine_errors():
+    env = make_env()
+    with pytest.raises(exc.PCSEError):
+        BatchWofost8Engine(env.parameterprovider, env.weatherdataprovider,
+                           [env.agromanagement] * 2, config=env.config, n=3)
+    with pytest.raises(exc.PCSEError):
+        BatchWofost8Engine(env.parameterprovider, env.weatherdataprovider,
+                           env.agromanagement, config=env.config)
+    batch = BatchWofost8Engine(env.parameterprovider, env.weatherdataprovider,
+                               env.agromanagement, config=env.config, n=2)
+    with pytest.raises(exc.PCSEError):
+        batch.run(mask=[True, False, True])
+    with pytest.raises(exc.PCSEError):
+        batch.send_signal(signals.crop_finish)
+
+
+def _is_closed(engine):
+    return engine.crop is None and engine.soil is None and len(engine.kiosk) == 0 \
+        and len(engine.kiosk.registered_states) == 0 and engine.kiosk.signal_bus.signals() == []
+
+
+def test_engine_close():
+    env = make_env()
+    engine = _engine(env)
+    engine.run(days=100)
+    output = engine.get_output()
+    engine.close()
+    engine.close()
+    assert _is_closed(engine)
+    assert engine.get_output() == output
+
+
+def test_env_close_closes_all_engines():
+    import gymnasium as gym
+    from conftest import env_kwargs
+
+    env = gym.make("lnpkw-v0", **env_kwargs())
+    engines = []
+    for year in (1990, 1991, 1992):
+        env.reset(year=year)
+        engines.append(env.unwrapped.model)
+    assert len(env.unwrapped._engine_cache) == 3
+    env.close()
+    assert all(_is_closed(engine) for engine in engines)
+    assert len(env.unwrapped._engine_cache) == 0
+
+    # Without an engine cache the previous engine is closed on reset
+    env = make_env(engine_cache_size=0)
+    env.reset(year=1990)
+    engine = env.model
+    env.reset(year=1990)
+    assert env.model is not engine and _is_closed(engine)
+
+
+def _as_float(value):
+    """Converts an output value as the OutputRecorder stores it."""
+    if value is None:
+        return np.nan
+    if isinstance(value, date):
+        return value.year * 10000 + value.month * 100 + value.day
+    return value
+
+
+def test_output_recorder_matches_get_output(monkeypatch):
+    env = make_env()
+    varnames = ["DVS", "LAI", "TAGP", "WSO", "SM", "NAVAIL", "TOTN", "DOS"]
+    reference = _engine(env)
+    expected = []
+    for _ in range(200):
+        reference.run()
+        output = reference.get_output()[0]
+        expected.append([_as_float(output.get(v)) for v in varnames])
+
+    engine = _engine(env)
+    recorder = engine.set_output_recorder(varnames)
+    engine.run(days=200)
+    days, values = recorder.to_numpy()
+    assert engine.get_output_recorder() is recorder and len(recorder) == 200
+    assert np.shares_memory(values, recorder._values)
+    np.testing.assert_array_equal(values, np.array(expected))
+    assert days[-1] == np.datetime64(reference.day)
+
+    # Snapshots and forks copy the recorded output
+    snapshot = engine.snapshot()
+    fork = engine.fork()
+    fork.run(days=5)
+    assert len(fork.get_output_recorder()) == 205 and len(recorder) == 200
+    engine.run(days=3)
+    engine.restore(snapshot)
+    assert len(engine.get_output_recorder()) == 200
+    np.testing.assert_array_equal(engine.get_output_recorder().to_numpy()[1], expected)
+
+    ring_engine = _engine(env)
+    ring = ring_engine.set_output_recorder(["DVS", "LAI"], maxlen=10)
+    ring_engine.run(days=200)
+    assert len(ring) == 10
+    np.testing.assert_array_equal(ring.days, days[-10:])
+    np.testing.assert_array_equal(ring.get("DVS"), engine.get_output_recorder().get("DVS")[-10:])
+    frame = ring.to_dataframe()
+    assert list(frame.columns) == ["DVS", "LAI"] and len(frame) == 10
+    with pytest.raises(exc.PCSEError):
+        ring.get("WSO")
+
+    monkeypatch.setitem(sys.modules, "pyarrow", None)
+    with pytest.raises(exc.PCSEError):
+        ring.to_arrow()
+
+
+def test_execution_plans_are_per_engine():
+    env = make_env()
+    first, second = _engine(env), _engine(env)
+    first.run(days=10)
+    second.run(days=10)
+    plan = second._get_plan()[1]
+    crop_plan = second.crop._get_plan()[1]
+
+    # Removing the crop of the first engine leaves the plans of the second
+    # engine in place
+    first.run(days=300)
+    first.close()
+    assert second._get_plan()[1] is plan and second.crop._get_plan()[1] is crop_plan
+    version = second.kiosk.structure_version
+    second.restore(second.snapshot())
+    assert second.kiosk.structure_version != version
+    assert second._get_plan()[1] is not plan and second._get_plan()[1] == plan
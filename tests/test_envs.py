@@ -0,0 +1,31 @@
+"""Tests for the observations of the WOFOST Gym environments
+
+Written by: Will Solow, 2024
+"""
+import datetime
+
+import numpy as np
+import pytest
+
+from conftest import make_env
+
+
+@pytest.mark.parametrize("env_id", ["lnpkw-v0", "plant-npk-v0", "perennial-lnpkw-v0"])
+@pytest.mark.parametrize("forecast_length", [1, 5])
+def test_observations_match_observation_space(env_id, forecast_length):
+    env = make_env(env_id, forecast_length=forecast_length)
+    obs, _ = env.reset(year=1990)
+    assert obs.shape == env.observation_space.shape
+    for _ in range(3):
+        obs, *_ = env.step(0)
+        assert obs.shape == env.observation_space.shape
+
+
+def test_forecast_holds_one_value_per_weather_variable():
+    env = make_env(forecast_length=3, forecast_noise=[0., 0.])
+    obs, _ = env.reset(year=1990)
+    nvars, noutput = len(env.weather_vars), len(env.output_vars)
+    forecast = obs[noutput:-1].reshape(3, nvars)
+    for i in range(3):
+        day = env.date + datetime.timedelta(i)
+        np.testing.assert_allclose(forecast[i], env._get_weather_day(day))
@@ -0,0 +1,55 @@
+"""Tests for the resolved lookups of the ParameterProvider
+
+Written by: Will Solow, 2024
+"""
+from collections import ChainMap
+
+import pytest
+
+from pcse.utils import exceptions as exc
+
+from conftest import make_env
+
+
+def _assert_resolved(provider):
+    """Every parameter has the value found by searching the parameter sets
+    in order, as a ChainMap does.
+    """
+    chain = ChainMap(*provider._maps)
+    assert sorted(provider._unique_parameters) == sorted(chain)
+    for key in chain:
+        assert key in provider and provider[key] is chain[key]
+
+
+def test_resolved_lookups_follow_changes():
+    env = make_env()
+    provider = env.parameterprovider.copy()
+    site, crop = env.agromanagement["SiteCalendar"], env.agromanagement["CropCalendar"]
+    provider.set_active_site(site["site_name"], site["variation_name"])
+    provider.set_active_crop(crop["crop_name"], crop["variety_name"], "sowing", "maturity")
+    _assert_resolved(provider)
+    key = provider.get_parameter_key()
+
+    version = provider.version
+    tdwi = provider["TDWI"]
+    provider.set_override("TDWI", tdwi * 2)
+    assert provider["TDWI"] == tdwi * 2 and provider.version > version
+    assert provider.get_parameter_key() != key
+    _assert_resolved(provider)
+
+    provider["SMLIM"] = 0.25
+    del provider["TDWI"]
+    assert provider["TDWI"] == tdwi and provider["SMLIM"] == 0.25
+    _assert_resolved(provider)
+    provider.set_override("NEWPAR", 1., check=False)
+    assert "NEWPAR" in provider
+    provider.clear_override()
+    assert "NEWPAR" not in provider and provider.get_parameter_key() == key
+    _assert_resolved(provider)
+
+    with pytest.raises(exc.PCSEError):
+        provider["NEWPAR"] = 1.
+    with pytest.raises(exc.PCSEError):
+        del provider["TDWI"]
+    with pytest.raises(KeyError):
+        provider["NEWPAR"]
@@ -0,0 +1,47 @@
+"""Tests for the NASA POWER prefetch against the local POWER stand-in server
+
+Written by: Will Solow, 2024
+"""
+import json
+import datetime as dt
+
+import numpy as np
+
+from pcse.nasapower import NASAPowerWeatherDataProvider, get_grid_cell
+from pcse.powerserver import PowerStandInServer
+from pcse.prefetch import PowerPrefetcher, make_grid
+
+from conftest import make_power_response
+
+FIRST_DAY = dt.date(2000, 1, 1)
+LAST_DAY = dt.date(2002, 12, 31)
+
+
+def test_prefetch_from_stand_in_server(tmp_path, monkeypatch):
+    responses = {}
+    for seed, site in enumerate([(20., 30.), (21., 30.)]):
+        responses[site] = make_power_response(*site, FIRST_DAY, LAST_DAY, seed=seed)
+        with open(tmp_path / (get_grid_cell(*site) + ".json"), "w") as fp:
+            json.dump(responses[site], fp)
+
+    assert make_grid((20., 21.), (30., 30.5), step=0.5) == \
+        [(20., 30.), (20., 30.5), (20.5, 30.), (20.5, 30.5), (21., 30.), (21., 30.5)]
+    sites = [(20., 30.), (21., 30.), (22., 30.), (20.02, 30.04)]
+    with PowerStandInServer(str(tmp_path)) as server:
+        prefetcher = PowerPrefetcher(max_concurrency=2, retries=0, server=server.url)
+        status = prefetcher.prefetch(sites)
+        assert status[(20., 30.)] == status[(21., 30.)] == status[(20.02, 30.04)] == "fetched"
+        assert status[(22., 30.)].startswith("failed")
+        assert prefetcher.prefetch(sites[:2]) == {(20., 30.): "cached", (21., 30.): "cached"}
+
+        # The provider queries the stand-in server when its URL is set
+        monkeypatch.setattr(NASAPowerWeatherDataProvider, "power_url", server.url)
+        queried = NASAPowerWeatherDataProvider(21., 30., force_update=True)
+
+    # Prefetched sites match providers built from the same responses
+    cached = [NASAPowerWeatherDataProvider(*site) for site in responses]
+    for provider, (site, powerdata) in zip(cached, responses.items()):
+        expected = NASAPowerWeatherDataProvider.from_POWER_data(*site, powerdata)
+        np.testing.assert_array_equal(provider.columnar_store().data,
+                                      expected.columnar_store().data)
+    np.testing.assert_array_equal(queried.columnar_store().data, cached[1].columnar_store().data)
@@ -0,0 +1,168 @@
+"""Tests for engine snapshots, restores and forks
+
+Written by: Will Solow, 2024
+"""
+import copy
+
+import numpy as np
+
+from pcse.engine import Engine
+from pcse.base import snapshot
+
+from conftest import make_env, run_episode
+
+
+def test_restore_after_site_finish_keeps_soil():
+    """The execution plan is rebuilt after restoring an engine whose soil was
+    removed at the end of the previous episode.
+    """
+    env = make_env("plant-npk-v0")
+    run_episode(env)
+    assert env.model.soil is None
+
+    for _ in range(2):
+        env.reset(year=1990)
+        env.step(0)
+        model = env.model
+        assert model.soil is not None
+        assert model.soil in model.subSimObjects
+        rates_plan = [id(rates) for rates in model._get_plan()[1]]
+        assert all(id(rates) in rates_plan for rates in model.soil._get_plan()[1])
+        for varname in ("TOTN", "TOTP", "TOTK", "TOTIRRIG"):
+            assert model.get_variable(varname) is not None
+
+
+def test_restore_matches_fresh_engine():
+    """Episodes on a restored engine give the same observations and rewards
+    as episodes on a newly built engine.
+    """
+    actions = [0, 1, 5, 0, 9, 2, 0, 13]
+    fresh = make_env(engine_cache_size=0)
+    obs_fresh, rewards_fresh = run_episode(fresh, actions=actions)
+
+    env = make_env()
+    run_episode(env, actions=actions)
+    run_episode(env, year=1991, actions=actions)
+    obs, rewards = run_episode(env, actions=actions)
+    assert env.model is env._engine_cache[(1990, tuple(env.location))][0]
+    np.testing.assert_array_equal(obs, obs_fresh)
+    np.testing.assert_array_equal(rewards, rewards_fresh)
+
+
+def test_engine_cache_is_bounded():
+    """The least recently used engines are closed when the cache is full.
+    """
+    env = make_env(engine_cache_size=2)
+    engines, tables = [], []
+    for year in (1990, 1991, 1990, 1992):
+        env.reset(year=year)
+        engines.append(env.model)
+        tables.append(env._weather_table)
+    assert engines[0] is engines[2] and tables[0] is tables[2]
+    assert [key[0] for key in env._engine_cache] == [1990, 1992]
+    assert not any(tables[1] is entry[2] for entry in env._engine_cache.values())
+    evicted = engines[1]
+    assert evicted.crop is None and evicted.soil is None
+    assert len(evicted.kiosk.registered_states) == 0
+    assert evicted.kiosk.signal_bus.signals() == []
+
+
+def _step_all(env, actions):
+    """Steps env with actions until it terminates or truncates, returns the
+    stacked observations.
+    """
+    observations = []
+    for action in actions:
+        obs, _, term, trunc, _ = env.step(action)
+        observations.append(obs)
+        if term or trunc:
+            break
+    return np.array(observations)
+
+
+def test_clone_continues_like_original():
+    """A clone stepped with the same actions as the original gives the same
+    observations, and stepping a clone does not change the original.
+    """
+    rng = np.random.default_rng(1)
+    actions = [int(a) for a in rng.integers(0, 17, 500)]
+    env = make_env()
+    env.reset(year=1990)
+    _step_all(env, actions[:40])
+
+    clone = env.clone()
+    other = env.clone()
+    _step_all(other, [4] * 30)
+    obs_clone = _step_all(clone, actions[40:])
+    obs = _step_all(env, actions[40:])
+    np.testing.assert_array_equal(obs_clone, obs)
+    assert clone.model.kiosk is not env.model.kiosk
+
+
+def test_fork_and_snapshot_of_engine():
+    """Engine.fork() and Engine.restore() reproduce the output of the
+    original engine.
+    """
+    env = make_env()
+    env.reset(year=1990)
+    model = env.model
+    model.run(days=120)
+    snapshot = model.snapshot()
+    fork = model.fork()
+
+    varnames = ["DVS", "LAI", "WSO", "SM", "NAVAIL"]
+    model.run(days=60)
+    expected = [model.get_variable(v) for v in varnames]
+    fork.run(days=60)
+    assert [fork.get_variable(v) for v in varnames] == expected
+
+    model.restore(snapshot)
+    model.run(days=60)
+    assert [model.get_variable(v) for v in varnames] == expected
+
+
+def test_crop_templates_match_crop_initialization(monkeypatch):
+    """Crops copied from a template give the same trajectories as crops
+    initialized at every planting.
+    """
+    instantiate = snapshot.CropTemplate.instantiate
+    instantiated = []
+
+    def counting_instantiate(self, *args):
+        instantiated.append(self)
+        return instantiate(self, *args)
+
+    monkeypatch.setattr(snapshot.CropTemplate, "instantiate", counting_instantiate)
+    observations = []
+    for use_crop_templates in (False, True):
+        monkeypatch.setattr(Engine, "use_crop_templates", use_crop_templates)
+        monkeypatch.setattr(snapshot, "_crop_templates", snapshot.OrderedDict())
+        env = make_env("plant-npk-v0", engine_cache_size=0)
+        episodes = []
+        for year, plant_day in ((1990, 5), (1991, 12), (1990, 20)):
+            env.active_crop_flag = False
+            actions = [0] * plant_day + [1] + [0] * 250
+            episodes.append(run_episode(env, year=year, actions=actions, max_steps=len(actions))[0])
+        observations.append(episodes)
+        assert len(instantiated) == (0 if not use_crop_templates else 2)
+    for expected, obs in zip(*observations):
+        np.testing.assert_array_equal(obs, expected)
+
+
+def test_crop_templates_depend_on_crop_parameters(monkeypatch):
+    """Providers with different crop parameters under the same crop and
+    variety name do not share crop templates.
+    """
+    monkeypatch.setattr(snapshot, "_crop_templates", snapshot.OrderedDict())
+    observations = []
+    for use_crop_templates, tdwi_factor in ((True, 1.), (True, 3.), (False, 3.)):
+        monkeypatch.setattr(Engine, "use_crop_templates", use_crop_templates)
+        env = make_env(engine_cache_size=0)
+        crop = env.agromanagement["CropCalendar"]
+        cropdata = env.parameterprovider._cropdata
+        cropdata._store = copy.deepcopy(cropdata._store)
+        cropdata._store[crop["crop_name"]][crop["variety_name"]]["TDWI"][0] *= tdwi_factor
+        observations.append(run_episode(env, year=1990)[0])
+    assert len(snapshot._crop_templates) == 2
+    assert not np.array_equal(observations[0], observations[1])
+    np.testing.assert_array_equal(observations[1], observations[2])
@@ -0,0 +1,114 @@
+"""Tests for the states/rates backends and shared parameter objects
+
+Written by: Will Solow, 2024
+"""
+import numpy as np
+import pytest
+
+from pcse import util
+from pcse.base import (StatesTemplate, RatesTemplate, ParamTemplate, create_kiosk,
+                       get_states_rates_backend)
+from pcse.base import states_rates
+from pcse.engine import Wofost8Engine
+from pcse.util import Afgen, AfgenTrait, get_afgen
+from pcse.utils.traitlets import Float, TraitError
+from pcse.utils import exceptions as exc
+
+from conftest import make_env
+
+
+class States(StatesTemplate):
+    A = Float()
+    B = Float()
+
+
+class Rates(RatesTemplate):
+    RA = Float()
+
+
+class Parameters(ParamTemplate):
+    P = Float()
+    TB = AfgenTrait()
+
+
+def test_default_backend_validates_assignments():
+    kiosk = create_kiosk()
+    assert get_states_rates_backend(kiosk) == "traitlets"
+    states = States(kiosk, publish=["A"], A=1., B=2.)
+    assert states._compact_traits is None
+    states.unlock()
+    with pytest.raises(TraitError):
+        states.A = "not a number"
+
+
+@pytest.mark.parametrize("mode", ["dict", "indexed"])
+def test_compact_backend_is_opt_in(mode):
+    kiosk = create_kiosk(mode, states_rates_backend="compact")
+    states = States(kiosk, publish=["A"], A=1., B=2.)
+    rates = Rates(kiosk, publish="RA")
+    assert "_s_A" in states._compact_slots
+    states.unlock()
+    states.A = 3.
+    rates.RA = 0.5
+    assert kiosk["A"] == 3. and kiosk["RA"] == 0.5
+    assert "B" not in kiosk
+    rates.zerofy()
+    assert rates.RA == 0.
+
+
+def test_engine_backends_give_equal_output():
+    env = make_env()
+    config = dict(env.config)
+    varnames = ["DVS", "LAI", "WSO", "TWSO", "SM", "NAVAIL", "TOTN"]
+    outputs = []
+    for backend in (None, "compact"):
+        config["STATES_RATES_BACKEND"] = backend
+        engine = Wofost8Engine(env.parameterprovider, env.weatherdataprovider,
+                               env.agromanagement, config=config)
+        assert get_states_rates_backend(engine.kiosk) == (backend or "traitlets")
+        assert get_states_rates_backend(engine.fork().kiosk) == (backend or "traitlets")
+        engine.run(days=250)
+        outputs.append([engine.get_variable(v) for v in varnames])
+    assert outputs[0] == outputs[1]
+
+    config["STATES_RATES_BACKEND"] = "fast"
+    with pytest.raises(exc.PCSEError):
+        Wofost8Engine(env.parameterprovider, env.weatherdataprovider, env.agromanagement,
+                      config=config)
+
+
+def test_parameter_objects_are_shared_and_read_only():
+    params = Parameters({"P": 1., "TB": [0., 0., 10., 5.], "OTHER": 3.})
+    assert Parameters({"P": 1., "TB": np.array([0., 0., 10., 5.])}) is params
+    assert Parameters({"P": 2., "TB": [0., 0., 10., 5.]}) is not params
+    assert params.TB is get_afgen([0, 0, 10, 5])
+    assert params.TB(4.) == Afgen([0., 0., 10., 5.])(4.) == 2.
+    with pytest.raises(AttributeError):
+        params.P = 3.
+    with pytest.raises(exc.ParameterError):
+        Parameters({"P": 1.})
+
+
+def test_parameter_and_afgen_caches_are_bounded(monkeypatch):
+    monkeypatch.setattr(states_rates, "MAX_PARAMETER_SETS", 2)
+    monkeypatch.setattr(states_rates, "_parameter_sets", states_rates.OrderedDict())
+    monkeypatch.setattr(util, "MAX_AFGEN_TABLES", 2)
+    monkeypatch.setattr(util, "_afgen_tables", util.OrderedDict())
+    first = Parameters({"P": 1., "TB": [0., 1.]})
+    for value in (2., 1., 3.):
+        Parameters({"P": value, "TB": [0., value]})
+    assert len(states_rates._parameter_sets) == 2 and len(util._afgen_tables) == 2
+    assert Parameters({"P": 1., "TB": [0., 1.]}) is first
+    assert Parameters({"P": 2., "TB": [0., 2.]}).P == 2.
+
+
+def test_engines_share_parameters():
+    env = make_env()
+    engines = [Wofost8Engine(env.parameterprovider, env.weatherdataprovider, env.agromanagement,
+                             config=env.config) for _ in range(2)]
+    for engine in engines:
+        engine.run(days=250)
+    crops = [engine.crop for engine in engines]
+    assert crops[0].params is crops[1].params
+    assert crops[0].pheno.params is crops[1].pheno.params
+    assert engines[0].get_variable("WSO") == engines[1].get_variable("WSO")
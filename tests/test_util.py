@@ -0,0 +1,119 @@
+"""Tests for the reference ET, astronomy and model configuration functions
+of pcse.util
+
+Written by: Will Solow, 2024
+"""
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from pcse import util
+from pcse.util import (astro, astro_array, daylength, get_astro_table, reference_ET,
+                       reference_ET_array, get_model_config, ConfigurationLoader)
+from pcse.nasapower import ea_from_tdew, ea_from_tdew_array
+from pcse.engine import Wofost8Engine
+from pcse.utils import exceptions as exc
+
+from conftest import make_env
+
+DAYS = [dt.date(2001, 1, 1) + dt.timedelta(i) for i in range(0, 365, 5)]
+
+
+def _weather(seed=0):
+    rng = np.random.default_rng(seed)
+    n = len(DAYS)
+    tmin = rng.uniform(-10., 20., n)
+    return dict(TMIN=tmin, TMAX=tmin + rng.uniform(2., 15., n),
+                IRRAD=rng.uniform(1e6, 30e6, n), VAP=rng.uniform(2., 25., n),
+                WIND=rng.uniform(0.5, 8., n))
+
+
+@pytest.mark.parametrize("etmodel", ["PM", "P"])
+@pytest.mark.parametrize("latitude", [52., -35., 68.])
+def test_reference_et_array_matches_scalar(latitude, etmodel):
+    w = _weather()
+    iday = np.array([d.timetuple().tm_yday for d in DAYS])
+    arrays = reference_ET_array(iday, latitude, 10., w["TMIN"], w["TMAX"], w["IRRAD"],
+                                w["VAP"], w["WIND"], 0.29, 0.49, etmodel)
+    for i, day in enumerate(DAYS):
+        expected = reference_ET(day, latitude, 10., w["TMIN"][i], w["TMAX"][i], w["IRRAD"][i],
+                                w["VAP"][i], w["WIND"][i], 0.29, 0.49, etmodel)
+        np.testing.assert_allclose([a[i] for a in arrays], expected, rtol=1e-12)
+
+    results = astro_array(iday, latitude, w["IRRAD"])
+    for i, day in enumerate(DAYS):
+        np.testing.assert_allclose([r[i] for r in results], astro(day, latitude, w["IRRAD"][i]),
+                                   rtol=1e-12, atol=1e-12)
+
+
+def test_ea_from_tdew_array_matches_scalar():
+    tdew = np.linspace(-40., 40., 17)
+    np.testing.assert_allclose(ea_from_tdew_array(tdew), [ea_from_tdew(t) for t in tdew],
+                               rtol=1e-15)
+    with pytest.raises(ValueError):
+        ea_from_tdew_array([10., 70.])
+
+
+@pytest.mark.parametrize("latitude", [52., -35., 68., 89.])
+def test_astro_tables_match_astro(latitude):
+    irrad = _weather()["IRRAD"]
+    iday = np.array([d.timetuple().tm_yday for d in DAYS])
+    reference = astro_array(iday, latitude, irrad)
+    # The batch terms of the columnar weather store equal astro() exactly
+    columns = get_astro_table(latitude).astro_columns(iday, irrad)
+    for i, day in enumerate(DAYS):
+        result = astro(day, latitude, irrad[i])
+        assert tuple(c[i] for c in columns) == tuple(result)
+        np.testing.assert_allclose(result, [r[i] for r in reference], rtol=1e-12, atol=1e-12)
+        assert daylength(day, latitude) == result.DAYLP
+        assert daylength(day, latitude, angle=0) == pytest.approx(result.DAYL, abs=1e-12)
+    with pytest.raises(RuntimeError):
+        astro(DAYS[0], 91., 1e6)
+
+
+def test_astro_tables_are_bounded(monkeypatch):
+    monkeypatch.setattr(util, "MAX_ASTRO_TABLES", 2)
+    monkeypatch.setattr(util, "_astro_tables", util.OrderedDict())
+    for latitude in (10., 20., 10., 30.):
+        astro(DAYS[0], latitude, 1e7)
+    assert list(util._astro_tables) == [10., 30.]
+
+
+def test_model_configs_are_shared(tmp_path):
+    env = make_env()
+    config = dict(env.config)
+    mconf = get_model_config(config)
+    assert get_model_config(dict(config)) is mconf
+    assert get_model_config(dict(config, KIOSK_MODE="indexed")) is not mconf
+    with pytest.raises(AttributeError):
+        mconf.KIOSK_MODE = "indexed"
+    assert ConfigurationLoader(config).defined_attr == mconf.defined_attr
+
+    engines = [Wofost8Engine(env.parameterprovider, env.weatherdataprovider, env.agromanagement,
+                             config=dict(config)) for _ in range(2)]
+    assert engines[0].mconf is engines[1].mconf is mconf
+
+    fname = tmp_path / "model.conf"
+    lines = ["%s = %r" % (k, getattr(mconf, k)) for k in mconf.defined_attr
+             if k not in ("CROP", "SOIL", "AGROMANAGEMENT")]
+    lines += ["CROP = None", "SOIL = None", "AGROMANAGEMENT = None"]
+    fname.write_text("\n".join(lines))
+    from_file = get_model_config(fname)
+    assert get_model_config(str(fname)) is from_file
+    assert from_file.OUTPUT_VARS == mconf.OUTPUT_VARS
+    fname.write_text("\n".join(lines + ["KIOSK_MODE = 'indexed'"]))
+    assert get_model_config(fname).KIOSK_MODE == "indexed"
+
+    with pytest.raises(exc.PCSEError):
+        get_model_config({"CROP": None})
+
+
+def test_model_config_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(util, "MAX_MODEL_CONFIGS", 2)
+    monkeypatch.setattr(util, "_model_configs", util.OrderedDict())
+    config = dict(make_env().config)
+    mconfs = [get_model_config(dict(config, OUTPUT_INTERVAL_DAYS=i)) for i in range(3)]
+    assert len(util._model_configs) == 2
+    assert get_model_config(dict(config, OUTPUT_INTERVAL_DAYS=2)) is mconfs[2]
+    assert get_model_config(dict(config, OUTPUT_INTERVAL_DAYS=0)) is not mconfs[0]
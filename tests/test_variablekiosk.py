@@ -0,0 +1,137 @@
+"""Tests for the VariableKiosk modes and the SignalBus of the kiosk
+
+Written by: Will Solow, 2024
+"""
+import gc
+
+import pytest
+
+from pcse.base import create_kiosk, VariableKiosk, IndexedVariableKiosk, SignalBus
+from pcse.engine import Wofost8Engine
+from pcse.pydispatch import errors
+from pcse import signals
+from pcse.utils import exceptions as exc
+
+from conftest import make_env
+
+MODES = ["dict", "indexed"]
+
+
+def _fill(kiosk):
+    kiosk.register_variable(0, "VAR1", type="S", publish=True)
+    kiosk.register_variable(0, "VAR2", type="S", publish=False)
+    kiosk.register_variable(1, "VAR3", type="R", publish=True)
+    kiosk.register_variable(1, "VAR4", type="R", publish=False)
+    kiosk.set_variable(0, "VAR1", 1.35)
+    kiosk.set_variable(1, "VAR3", 310.56)
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_kiosk_modes_behave_the_same(mode):
+    kiosk = create_kiosk(mode)
+    assert isinstance(kiosk, {"dict": VariableKiosk, "indexed": IndexedVariableKiosk}[mode])
+    _fill(kiosk)
+    assert kiosk["VAR1"] == 1.35 and kiosk.VAR3 == 310.56
+    assert "VAR1" in kiosk and "VAR2" not in kiosk
+    assert kiosk.variable_exists("VAR4")
+    assert sorted(kiosk.keys()) == ["VAR1", "VAR3"]
+
+    with pytest.raises(exc.VariableKioskError):
+        kiosk.register_variable(2, "VAR1", type="S")
+    with pytest.raises(exc.VariableKioskError):
+        kiosk.set_variable(1, "VAR1", 0.)
+    with pytest.raises(exc.VariableKioskError):
+        kiosk.set_variable(0, "VAR2", 0.)
+
+    kiosk.flush_rates()
+    assert "VAR3" not in kiosk and kiosk["VAR1"] == 1.35
+    kiosk.flush_states()
+    assert len(kiosk) == 0
+
+    kiosk.set_variable(0, "VAR1", 2.)
+    kiosk.deregister_variable(0, "VAR1")
+    assert "VAR1" not in kiosk and not kiosk.variable_exists("VAR1")
+    kiosk.deregister_variable(1, "VAR4")
+    with pytest.raises(exc.VariableKioskError):
+        kiosk.deregister_variable(1, "VAR4")
+
+
+@pytest.mark.parametrize("mode", MODES)
+def test_kiosk_state_roundtrip(mode):
+    kiosk = create_kiosk(mode)
+    _fill(kiosk)
+    state = kiosk._get_state()
+    kiosk.set_variable(0, "VAR1", 5.)
+    kiosk.deregister_variable(1, "VAR3")
+    kiosk._set_state(state)
+    assert kiosk["VAR1"] == 1.35 and kiosk["VAR3"] == 310.56
+    assert kiosk.published_rates == {"VAR3": 1}
+
+
+def test_indexed_kiosk_gives_equal_engine_output():
+    env = make_env()
+    config = dict(env.config)
+    varnames = ["DVS", "LAI", "WSO", "SM", "NAVAIL", "TOTN"]
+    outputs = []
+    for mode in MODES:
+        config["KIOSK_MODE"] = mode
+        engine = Wofost8Engine(env.parameterprovider, env.weatherdataprovider,
+                               env.agromanagement, config=config)
+        engine.run(days=250)
+        outputs.append([engine.get_variable(v) for v in varnames])
+    assert outputs[0] == outputs[1]
+
+
+class Listener(object):
+    def __init__(self):
+        self.received = []
+
+    def on_irrigate(self, amount, signal):
+        self.received.append((signal, amount))
+
+    def on_any(self, **kwargs):
+        self.received.append(kwargs["signal"])
+
+
+def test_signal_bus_connect_send_disconnect():
+    bus = SignalBus()
+    first, second = Listener(), Listener()
+    bus.connect(first.on_irrigate, signals.irrigate)
+    bus.connect(second.on_any, signals.irrigate)
+    responses = bus.send(signals.irrigate, None, amount=2., efficiency=0.7)
+    assert [h for h, _ in responses] == [first.on_irrigate, second.on_any]
+    assert first.received == [(signals.irrigate, 2.)]
+    assert second.received == [signals.irrigate]
+
+    # Handlers are weakly referenced
+    del second, responses
+    gc.collect()
+    bus.send(signals.irrigate, None, amount=1.)
+    assert bus.receivers(signals.irrigate) == [first.on_irrigate]
+
+    bus.disconnect(first.on_irrigate, signals.irrigate)
+    assert bus.send(signals.irrigate, None, amount=1.) == []
+    with pytest.raises(errors.DispatcherKeyError):
+        bus.disconnect(first.on_irrigate, signals.irrigate)
+    with pytest.raises(errors.DispatcherTypeError):
+        bus.connect(first.on_irrigate, None)
+
+
+def test_restore_keeps_handlers_of_the_caller():
+    env = make_env()
+    engine = Wofost8Engine(env.parameterprovider, env.weatherdataprovider,
+                           env.agromanagement, config=env.config)
+    bus = engine.kiosk.signal_bus
+    before, after = Listener(), Listener()
+    bus.connect(before.on_irrigate, signals.irrigate)
+    snapshot = engine.snapshot()
+    engine.run(days=10)
+    bus.disconnect(before.on_irrigate, signals.irrigate)
+    bus.connect(after.on_irrigate, signals.irrigate)
+
+    engine.restore(snapshot)
+    engine._send_signal(signals.irrigate, amount=1., efficiency=1.)
+    assert before.received == []
+    assert after.received == [(signals.irrigate, 1.)]
+    # The handlers of the engine components are still connected
+    assert len(bus.receivers(signals.irrigate)) > 1
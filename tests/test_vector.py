@@ -0,0 +1,93 @@
+"""Tests for the WOFOST Gym vector environment
+
+Written by: Will Solow, 2024
+"""
+import numpy as np
+import pytest
+import gymnasium as gym
+
+from wofost_gym.envs.wofost_vector import WOFOSTVectorEnv
+
+from conftest import env_kwargs
+
+
+def _make_envs(env_id, num_envs, **kwargs):
+    kwargs = env_kwargs(env_id, **kwargs)
+    np.random.seed(0)
+    venv = gym.make_vec(env_id, num_envs=num_envs, vectorization_mode="custom",
+                        vector_kwargs=kwargs)
+    senv = gym.vector.SyncVectorEnv(
+        [lambda: gym.wrappers.RecordEpisodeStatistics(gym.make(env_id, **kwargs))
+         for _ in range(num_envs)])
+    return venv, senv
+
+
+@pytest.mark.parametrize("env_id", ["lnpkw-v0", "pp-v0", "lnpk-v0", "ln-v0", "lnw-v0", "lw-v0"])
+def test_vector_env_matches_sync_vector_env(env_id):
+    venv, senv = _make_envs(env_id, 3, intvn_interval=14)
+    assert isinstance(venv, WOFOSTVectorEnv)
+    assert venv.single_observation_space == senv.single_observation_space
+    assert venv.single_action_space == senv.single_action_space
+
+    # Both draw the forecast noise from the global random state
+    np.random.seed(1)
+    obs, _ = venv.reset(seed=0)
+    np.random.seed(1)
+    expected, _ = senv.reset(seed=0)
+    np.testing.assert_allclose(obs, expected, rtol=1e-9)
+    assert obs.shape == (3,) + venv.single_observation_space.shape
+
+    rng = np.random.default_rng(0)
+    dones = 0
+    for _ in range(40):
+        actions = rng.integers(venv.single_action_space.n, size=3)
+        state = np.random.get_state()
+        result = venv.step(actions)
+        np.random.set_state(state)
+        expected = senv.step(actions)
+        for value, expected_value in zip(result[:4], expected[:4]):
+            np.testing.assert_allclose(value, expected_value, rtol=1e-9)
+
+        # Autoreset keeps the final observation and episode statistics. The
+        # infos of SyncVectorEnv also hold those of earlier episodes as the
+        # environment returns its log as info, so only done ones are compared
+        infos, expected_infos = result[4], expected[4]
+        done = result[2] | result[3]
+        assert ("final_info" in infos) == done.any()
+        if done.any():
+            np.testing.assert_array_equal(infos["_final_info"], done)
+            for i in np.flatnonzero(done):
+                # SyncVectorEnv keeps the float64 observation of the environment
+                np.testing.assert_allclose(infos["final_observation"][i],
+                                           expected_infos["final_observation"][i], rtol=1e-6)
+                # RecordEpisodeStatistics sums the returns in float32
+                for key in ("r", "l"):
+                    np.testing.assert_allclose(infos["final_info"][i]["episode"][key],
+                                               expected_infos["final_info"][i]["episode"][key],
+                                               rtol=1e-6)
+                dones += 1
+    assert dones > 0
+    venv.close()
+    senv.close()
+
+
+def test_vector_env_random_reset():
+    venv, _ = _make_envs("lnpkw-v0", 4, random_reset=True)
+    venv.reset(seed=0)
+    years = venv.year.copy()
+    assert set(years) <= set(venv.env.train_weather_data)
+    venv.reset(seed=0)
+    np.testing.assert_array_equal(venv.year, years)
+    venv.close()
+
+
+def test_vector_env_max_episode_steps():
+    kwargs = env_kwargs("lnpkw-v0")
+    venv = WOFOSTVectorEnv("lnpkw-v0", num_envs=2, max_episode_steps=3, **kwargs)
+    venv.reset()
+    for _ in range(2):
+        assert not venv.step(np.zeros(2, dtype=int))[3].any()
+    _, _, _, truncated, infos = venv.step(np.zeros(2, dtype=int))
+    assert truncated.all()
+    assert [info["episode"]["l"][0] for info in infos["final_info"]] == [3, 3]
+    venv.close()
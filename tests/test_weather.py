@@ -0,0 +1,239 @@
+"""Tests for the weather data stores, caches and providers
+
+Written by: Will Solow, 2024
+"""
+import os
+import datetime as dt
+
+import numpy as np
+import pytest
+
+from pcse.nasapower import (NASAPowerWeatherDataProvider, ColumnarWeatherStore,
+                            WeatherDataContainer, WeatherDataRegistry, WeatherDataProvider,
+                            WeatherArchive, WeatherArchiveProvider, WeatherCacheFile,
+                            convert_cache_files, get_grid_cell)
+from pcse.weathergenerator import EnsembleWeatherDataProvider
+from pcse.engine import Wofost8Engine
+from pcse.util import reference_ET_array
+from pcse.utils import exceptions as exc
+
+from conftest import make_power_response, make_env
+
+FIRST_DAY = dt.date(2000, 1, 1)
+LAST_DAY = dt.date(2001, 12, 31)
+MISSING_DAY = dt.date(2000, 3, 1)
+
+
+def _provider(latitude=10., longitude=20., seed=7):
+    """Returns a NASA POWER provider for two years of synthetic weather with
+    one missing day.
+    """
+    powerdata = make_power_response(latitude, longitude, FIRST_DAY, LAST_DAY, seed=seed)
+    powerdata["properties"]["parameter"]["T2M"][MISSING_DAY.strftime("%Y%m%d")] = -999.
+    return NASAPowerWeatherDataProvider.from_POWER_data(latitude, longitude, powerdata)
+
+
+def test_columnar_store_matches_weather_containers():
+    provider = _provider()
+    store = provider.columnar_store()
+    np.testing.assert_array_equal(ColumnarWeatherStore.from_provider(provider).data, store.data)
+    assert store.first_date == FIRST_DAY and store.last_date == LAST_DAY
+    assert MISSING_DAY not in store and FIRST_DAY in store
+    with pytest.raises(exc.WeatherDataProviderError):
+        store.index(MISSING_DAY)
+
+    days = [FIRST_DAY + dt.timedelta(i) for i in range(0, 700, 37)]
+    for day in days:
+        wdc = provider.store[(day, 0)]
+        wdv = store.day_view(day)
+        for varname in WeatherDataContainer.required + ["TEMP"]:
+            assert getattr(wdv, varname) == getattr(wdc, varname)
+        assert wdv.DTEMP == (wdc.TEMP + wdc.TMAX) / 2.
+
+    start, end = dt.date(2001, 2, 1), dt.date(2001, 3, 31)
+    irrad = store.get_range("IRRAD", start, end)
+    expected = [provider.store[(start + dt.timedelta(i), 0)].IRRAD
+                for i in range((end - start).days + 1)]
+    np.testing.assert_array_equal(irrad, expected)
+    assert not irrad.flags.writeable
+    with pytest.raises(exc.WeatherDataProviderError):
+        store.get_range("IRRAD", FIRST_DAY - dt.timedelta(1), end)
+
+
+def test_registry_shares_providers_and_evicts():
+    sites = [(10., 20.), (11., 20.), (12., 20.)]
+    expected = [_provider(*site, seed=i).columnar_store() for i, site in enumerate(sites)]
+    registry = WeatherDataRegistry()
+    provider = registry.get(*sites[0])
+    assert registry.get(*sites[0]) is provider and provider.frozen
+    np.testing.assert_array_equal(provider.columnar_store().data, expected[0].data)
+    with pytest.raises(exc.WeatherDataProviderError):
+        provider._store_WeatherDataContainer(provider(dt.date(2000, 1, 2)), dt.date(2000, 1, 2))
+
+    # Room for two providers, the least recently used one is evicted
+    registry.max_bytes = 2 * registry.nbytes
+    registry.get(*sites[1])
+    registry.get(*sites[0])
+    registry.get(*sites[2])
+    assert sites[0] in registry and sites[2] in registry and sites[1] not in registry
+    assert registry.nbytes <= registry.max_bytes
+
+    # The most recent provider is kept even if it exceeds the budget
+    registry.max_bytes = 0
+    assert len(registry) == 1 and sites[2] in registry
+    for site, store in zip(sites, expected):
+        np.testing.assert_array_equal(registry.get(*site).columnar_store().data, store.data)
+
+
+def test_archive_matches_cache_files(tmp_path):
+    provider = _provider(13., 20.)
+    legacy = _provider(14., 20., seed=3)
+    prefix = os.path.join(str(tmp_path), NASAPowerWeatherDataProvider.__name__ + "_")
+    meta = {"description": provider.description, "ETmodel": "PM",
+            "angstA": provider.angstA, "angstB": provider.angstB}
+    WeatherCacheFile.write(prefix + get_grid_cell(13., 20.) + ".wcache",
+                           provider.columnar_store(), meta)
+    WeatherDataProvider._dump(legacy, prefix + get_grid_cell(14., 20.) + ".cache")
+
+    fname = convert_cache_files(str(tmp_path), str(tmp_path / "weather.archive"))
+    archive = WeatherArchive(fname)
+    assert len(archive) == 2
+    for p in (provider, legacy):
+        cell = get_grid_cell(p.latitude, p.longitude)
+        archived = WeatherArchiveProvider(archive, cell, p.latitude, p.longitude)
+        np.testing.assert_array_equal(archived.columnar_store().data, p.columnar_store().data)
+        np.testing.assert_array_equal(archived.columnar_store().available,
+                                      p.columnar_store().available)
+        assert archived(dt.date(2001, 5, 5)).IRRAD == p(dt.date(2001, 5, 5)).IRRAD
+        assert archived.first_date == FIRST_DAY and archived.missing_days == [MISSING_DAY]
+
+
+def test_archive_gives_equal_engine_output(tmp_path):
+    env = make_env()
+    fname = convert_cache_files(archive_fname=str(tmp_path / "weather.archive"))
+    registry = WeatherDataRegistry(archive_fname=fname)
+    provider = registry.get(*env.location)
+    assert isinstance(provider, WeatherArchiveProvider)
+
+    varnames = ["DVS", "LAI", "WSO", "SM", "NAVAIL"]
+    outputs = []
+    for wdp in (env.weatherdataprovider, provider):
+        engine = Wofost8Engine(env.parameterprovider, wdp, env.agromanagement, config=env.config)
+        engine.run(days=250)
+        outputs.append([engine.get_variable(v) for v in varnames])
+    assert outputs[0] == outputs[1]
+
+
+class ContainerWeatherDataProvider(WeatherDataProvider):
+    """Serves the weather of a provider as plain WeatherDataContainers, so
+    the engine derives the driving variables itself.
+    """
+    supports_ensembles = True
+
+    def __init__(self, provider):
+        WeatherDataProvider.__init__(self)
+        store = provider.columnar_store()
+        self.latitude, self.longitude = provider.latitude, provider.longitude
+        self.elevation = store.ELEV
+        index = np.flatnonzero(store.available)
+        days = [store.first_date + dt.timedelta(int(i)) for i in index]
+        variables = {v: store.columns[v][index] for v in WeatherDataContainer.required + ["TEMP"]}
+        for wdc in WeatherDataContainer.from_arrays(days, store.LAT, store.LON, store.ELEV,
+                                                    **variables):
+            self._store_WeatherDataContainer(wdc, wdc.DAY)
+
+
+def test_driver_table_gives_equal_engine_output():
+    env = make_env()
+    store = env.weatherdataprovider.columnar_store()
+    day = dt.date(1990, 6, 1)
+    wdv = store.day_view(day)
+    tmin = [store.day_view(day - dt.timedelta(k)).TMIN for k in range(7)]
+    assert wdv.TMINRA == tuple(sum(tmin[:k]) / k for k in range(1, 8))
+    assert wdv.DTEMP == (wdv.TEMP + wdv.TMAX) / 2.
+
+    varnames = ["DVS", "LAI", "WSO", "TAGP", "SM", "NAVAIL"]
+    outputs = []
+    for wdp in (env.weatherdataprovider, ContainerWeatherDataProvider(env.weatherdataprovider)):
+        engine = Wofost8Engine(env.parameterprovider, wdp, env.agromanagement, config=env.config)
+        engine.run(days=250)
+        outputs.append([engine.get_variable(v) for v in varnames])
+    assert outputs[0] == outputs[1]
+
+
+def test_ensemble_members_are_reproducible_and_realistic():
+    provider = make_env().weatherdataprovider
+    first_date, last_date = dt.date(1990, 1, 1), dt.date(1999, 12, 31)
+    ensemble = EnsembleWeatherDataProvider(provider, 3, first_date, last_date, seed=11)
+    again = EnsembleWeatherDataProvider(provider, 3, first_date, last_date, seed=11)
+    for m in range(3):
+        np.testing.assert_array_equal(ensemble.columnar_store(m).data, again.columnar_store(m).data)
+    assert not np.array_equal(ensemble.columnar_store(0).data, ensemble.columnar_store(1).data)
+    with pytest.raises(exc.WeatherDataProviderError):
+        ensemble.member(3)
+
+    # The reference ET of each member equals that of a single member computed alone
+    store = ensemble.columnar_store(2)
+    doy = store.day_of_year
+    E0, ES0, ET0 = reference_ET_array(doy, provider.latitude, provider.elevation,
+                                      store.columns["TMIN"], store.columns["TMAX"],
+                                      store.columns["IRRAD"], store.columns["VAP"],
+                                      store.columns["WIND"], provider.angstA, provider.angstB)
+    np.testing.assert_allclose(store.columns["ET0"], ET0/10., rtol=1e-12)
+    np.testing.assert_allclose(store.columns["E0"], E0/10., rtol=1e-12)
+    member = ensemble.member(2)
+    assert member.frozen and member(dt.date(1995, 7, 1)).TMAX == store.day_view(dt.date(1995, 7, 1)).TMAX
+
+    # Seasonal means and rainfall frequency resemble the observed weather
+    observed = provider.columnar_store()
+    for varname, tolerance in (("TMIN", 1.5), ("TMAX", 1.5), ("IRRAD", 2e6)):
+        obs = observed.get_range(varname, first_date, last_date)
+        for month in (1, 7):
+            obs_days = [i for i in range(len(obs))
+                        if (first_date + dt.timedelta(i)).month == month]
+            synthetic = np.mean([ensemble.columnar_store(m).columns[varname][obs_days]
+                                 for m in range(3)])
+            assert abs(synthetic - np.nanmean(obs[obs_days])) < tolerance
+    obs_wet = np.mean(observed.get_range("RAIN", first_date, last_date) >= 0.01)
+    syn_wet = np.mean([ensemble.columnar_store(m).columns["RAIN"] >= 0.01 for m in range(3)])
+    assert abs(syn_wet - obs_wet) < 0.05
+
+
+def test_cache_file_roundtrip(tmp_path):
+    provider = _provider(15., 20.)
+    loaded = NASAPowerWeatherDataProvider(15., 20.)
+    assert not loaded.store
+    np.testing.assert_array_equal(loaded.columnar_store().data, provider.columnar_store().data)
+    np.testing.assert_array_equal(loaded.columnar_store().available,
+                                  provider.columnar_store().available)
+    assert (loaded.angstA, loaded.angstB) == (provider.angstA, provider.angstB)
+    assert loaded.description == provider.description and loaded.elevation == provider.elevation
+    assert loaded.missing_days == provider.missing_days == [MISSING_DAY]
+    day = dt.date(2001, 8, 8)
+    for varname in WeatherDataContainer.required:
+        assert getattr(loaded(day), varname) == getattr(provider(day), varname)
+
+    # Corrupt files are rejected
+    fname = provider._get_cache_filename(15., 20.)
+    with open(fname, "rb") as fp:
+        buf = bytearray(fp.read())
+    for corrupt in (b"NOTACACHE" + bytes(buf[9:]), bytes(buf[:-10] + b"0" * 10)):
+        bad_fname = str(tmp_path / "bad.wcache")
+        with open(bad_fname, "wb") as fp:
+            fp.write(corrupt)
+        with pytest.raises(exc.WeatherDataProviderError):
+            WeatherCacheFile.read(bad_fname)
+
+
+def test_legacy_cache_file_is_converted():
+    provider = _provider(16., 20.)
+    fname = provider._get_cache_filename(16., 20.)
+    legacy_fname = provider._get_legacy_cache_filename(16., 20.)
+    WeatherDataProvider._dump(provider, legacy_fname)
+    os.remove(fname)
+
+    loaded = NASAPowerWeatherDataProvider(16., 20.)
+    assert os.path.exists(fname)
+    np.testing.assert_array_equal(loaded.columnar_store().data, provider.columnar_store().data)
+    store, meta = WeatherCacheFile.read(fname)
+    np.testing.assert_array_equal(store.data, provider.columnar_store().data)
@@ -0,0 +1,26 @@
+"""Tests for the WOFOST Gym wrappers
+
+Written by: Will Solow, 2024
+"""
+import numpy as np
+
+from wofost_gym.wrappers import RewardFertilizationThresholdWrapper
+
+from conftest import make_env
+
+
+def test_threshold_wrapper_without_output_vars():
+    """The threshold wrapper reads TOTN/TOTP/TOTK/TOTIRRIG from the model
+    when they are not among the output variables of the environment.
+    """
+    rng = np.random.default_rng(3)
+    actions = rng.integers(0, 17, 120)
+    rewards = []
+    for output_vars in (None, ["FIN", "DVS", "WSO"]):
+        kwargs = {} if output_vars is None else {"output_vars": output_vars}
+        env = RewardFertilizationThresholdWrapper(
+            make_env(**kwargs), max_n=2, max_p=2, max_k=2, max_w=2)
+        env.reset(year=1990)
+        rewards.append([env.step(int(a))[1] for a in actions])
+    np.testing.assert_array_equal(rewards[0], rewards[1])
+    assert min(rewards[0]) <= -1e4
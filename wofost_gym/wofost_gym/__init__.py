@@ -2,7 +2,9 @@
 registration.
 """
 
-from gymnasium.envs.registration import register
+from functools import partial
+
+from gymnasium.envs.registration import register, registry
 from wofost_gym import args
 from wofost_gym import utils
 from wofost_gym import exceptions
@@ -161,4 +163,18 @@ register(
 register(
     id='perennial-harvest-lw-v0',
     entry_point='wofost_gym.envs.harvest_perennial:Perennial_Harvest_Limited_W_Env',
-)
\ No newline at end of file
+)
+
+def _make_vector_env(env_id: str, **kwargs):
+    """Creates the WOFOSTVectorEnv for env_id. Used as vector entry point of
+    the annual environments, which can be simulated as a batch:
+    gym.make_vec(env_id, num_envs, vectorization_mode="custom",
+    vector_kwargs=env_kwargs)
+    """
+    from wofost_gym.envs.wofost_vector import WOFOSTVectorEnv
+    return WOFOSTVectorEnv(env_id, **kwargs)
+
+for _spec in registry.values():
+    if isinstance(_spec.entry_point, str) and \
+            _spec.entry_point.startswith("wofost_gym.envs.wofost_annual:"):
+        _spec.vector_entry_point = partial(_make_vector_env, _spec.id)
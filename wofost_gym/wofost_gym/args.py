@@ -415,6 +415,9 @@ class NPK_Args:
     """Output Variables"""
     """See env_config/README.md for more information"""
     output_vars: list = field(default_factory = lambda: ['FIN', 'DVS', 'WSO', 'NAVAIL', 'PAVAIL', 'KAVAIL', 'SM', 'TOTN', 'TOTP', 'TOTK', 'TOTIRRIG', 'DOC', 'DON', 'DOB', 'DOL', 'DOV', 'DOR', 'DOP'])
+    """Record all model OUTPUT_VARS each day for NPK_Env.get_output_frame()"""
+    """Slower, use only for debugging and export"""
+    debug_output: bool = False
     """Weather Variables"""
     weather_vars: list = field(default_factory = lambda: ['IRRAD', 'TEMP', 'RAIN'])
 
@@ -446,6 +449,13 @@ class NPK_Args:
 
     """Flag for resetting to random year"""
     random_reset: bool = False
+    """Number of synthetic weather members sampled per location, 0 uses"""
+    """the historical weather. Every reset draws a new member"""
+    weather_ensemble: int = 0
+    """Number of engines (with their forecast weather tables) kept to restore"""
+    """their snapshot on reset to the same year and location. The least"""
+    """recently used engine is closed when full"""
+    engine_cache_size: int = 8
 
 GRAPH_OUTPUT_VARS = [ 
         # WOFOST STATES 
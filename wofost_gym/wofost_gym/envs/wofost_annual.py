@@ -10,7 +10,6 @@ from wofost_gym.args import NPK_Args
 from wofost_gym import utils
 from wofost_gym.envs.wofost_base import NPK_Env
 
-import pcse
 from pcse.soil.soil_wrappers import SoilModuleWrapper_LNPKW
 from pcse.soil.soil_wrappers import SoilModuleWrapper_LN
 from pcse.soil.soil_wrappers import SoilModuleWrapper_LNPK
@@ -43,37 +42,31 @@ class Limited_NPKW_Env(NPK_Env):
         Args:
             action
         """
-        n_amount = 0
-        p_amount = 0
-        k_amount = 0
-        irrig_amount = 0
+        n_amount, p_amount, k_amount, irrig_amount = self._action_amounts(action)
+        self._apply_amounts(n_amount, p_amount, k_amount, irrig_amount)
+        # Irrigation is not counted in the action tuple
+        return (n_amount, p_amount, k_amount, 0)
+
+    def _action_amounts(self, action: int):
+        """Returns the amounts of N, P, K and water applied by the integer action
+        
+        Args:
+            action
+        """
+        amounts = [0, 0, 0, 0]
 
         # Null action
         if action == 0: 
-            return (n_amount, p_amount, k_amount, irrig_amount)
+            return tuple(amounts)
         
         # Irrigation action
         if action >= 3 * self.num_fert+1:
-            i_amount = action - (3 * self.num_fert)
-            i_amount *= self.irrig_amount
-            self.model._send_signal(signal=pcse.signals.irrigate, amount=i_amount, \
-                                    efficiency=self.irrig_effec)
-            return (n_amount, p_amount, k_amount, irrig_amount)
+            amounts[self.I] = (action - (3 * self.num_fert)) * self.irrig_amount
+            return tuple(amounts)
         
         # Fertilizaiton action, correct for null action
-        if (action-1) // self.num_fert == 0:
-            n_amount = self.fert_amount * (( (action-1) % self.num_fert)+1) 
-            self.model._send_signal(signal=pcse.signals.apply_npk, \
-                                    N_amount=n_amount, N_recovery=self.n_recovery)
-        elif (action-1) // self.num_fert == 1:
-            p_amount = self.fert_amount * (( (action-1) % self.num_fert)+1) 
-            self.model._send_signal(signal=pcse.signals.apply_npk, \
-                                    P_amount=p_amount, P_recovery=self.p_recovery)
-        elif (action-1) // self.num_fert == 2:
-            k_amount = self.fert_amount * (( (action-1) % self.num_fert)+1) 
-            self.model._send_signal(signal=pcse.signals.apply_npk, \
-                                        K_amount=k_amount, K_recovery=self.k_recovery)  
-        return (n_amount, p_amount, k_amount, irrig_amount)
+        amounts[(action-1) // self.num_fert] = self.fert_amount * (( (action-1) % self.num_fert)+1) 
+        return tuple(amounts)
 
 class PP_Env(NPK_Env):
     """Simulates Potential Production. That is how much the crop would grow
@@ -104,6 +97,16 @@ class PP_Env(NPK_Env):
         """
         return (0, 0, 0, 0)
 
+    def _action_amounts(self, action: int):
+        """Returns the amounts of N, P, K and water applied by the integer action
+        
+        No actions available in this Potential Production Env 
+
+        Args:
+            action
+        """
+        return (0, 0, 0, 0)
+
 class Limited_NPK_Env(NPK_Env):
     """Simulates crop growth under NPK Limited Production 
     """
@@ -129,29 +132,25 @@ class Limited_NPK_Env(NPK_Env):
         Args:
             action
         """
-        n_amount = 0
-        p_amount = 0
-        k_amount = 0
+        n_amount, p_amount, k_amount, _ = self._action_amounts(action)
+        self._apply_amounts(n_amount, p_amount, k_amount, 0)
+        return (n_amount, p_amount, k_amount, 0)
+
+    def _action_amounts(self, action: int):
+        """Returns the amounts of N, P, K and water applied by the integer action
+        
+        Args:
+            action
+        """
+        amounts = [0, 0, 0, 0]
 
         # Null action
         if action == 0: 
-            return (n_amount, p_amount, k_amount, 0)
+            return tuple(amounts)
         
         # Fertilizaiton action, correct for null action
-        if (action-1) // self.num_fert == 0:
-            n_amount = self.fert_amount * (( (action-1) % self.num_fert)+1) 
-            self.model._send_signal(signal=pcse.signals.apply_npk, \
-                                    N_amount=n_amount, N_recovery=self.n_recovery)
-        elif (action-1) // self.num_fert == 1:
-            p_amount = self.fert_amount * (( (action-1) % self.num_fert)+1) 
-            self.model._send_signal(signal=pcse.signals.apply_npk, \
-                                    P_amount=p_amount, P_recovery=self.p_recovery)
-        elif (action-1) // self.num_fert == 2:
-            k_amount = self.fert_amount * (( (action-1) % self.num_fert)+1) 
-            self.model._send_signal(signal=pcse.signals.apply_npk, \
-                                        K_amount=k_amount, K_recovery=self.k_recovery)
-            
-        return (n_amount, p_amount, k_amount, 0)
+        amounts[(action-1) // self.num_fert] = self.fert_amount * (( (action-1) % self.num_fert)+1) 
+        return tuple(amounts)
 
 class Limited_N_Env(NPK_Env):
     """Simulates crop growth under Nitrogen Limited Production 
@@ -178,19 +177,25 @@ class Limited_N_Env(NPK_Env):
         Args:
             action
         """
-        n_amount = 0
+        n_amount, _, _, _ = self._action_amounts(action)
+        self._apply_amounts(n_amount, 0, 0, 0)
+        return (n_amount, 0, 0, 0)
+
+    def _action_amounts(self, action: int):
+        """Returns the amounts of N, P, K and water applied by the integer action
+        
+        Args:
+            action
+        """
+        amounts = [0, 0, 0, 0]
 
         # Null action
         if action == 0: 
-            return (n_amount, 0, 0, 0)
+            return tuple(amounts)
         
         # Fertilizaiton action, correct for null action
-        if (action-1) // self.num_fert == 0:
-            n_amount = self.fert_amount * (( (action-1) % self.num_fert)+1) 
-            self.model._send_signal(signal=pcse.signals.apply_npk, \
-                                    N_amount=n_amount, N_recovery=self.n_recovery)
-            
-        return (n_amount, 0, 0, 0)
+        amounts[(action-1) // self.num_fert] = self.fert_amount * (( (action-1) % self.num_fert)+1) 
+        return tuple(amounts)
 
 class Limited_NW_Env(NPK_Env):
     """Simulates crop growth under Nitrogen and Water Limited Production 
@@ -216,28 +221,31 @@ class Limited_NW_Env(NPK_Env):
         Args:
             action
         """
-        n_amount = 0
-        irrig_amount = 0
+        n_amount, _, _, irrig_amount = self._action_amounts(action)
+        self._apply_amounts(n_amount, 0, 0, irrig_amount)
+        # Irrigation is not counted in the action tuple
+        return (n_amount, 0, 0, 0)
+
+    def _action_amounts(self, action: int):
+        """Returns the amounts of N, P, K and water applied by the integer action
+        
+        Args:
+            action
+        """
+        amounts = [0, 0, 0, 0]
 
         # Null action
         if action == 0: 
-            return (n_amount, 0, 0, irrig_amount)
+            return tuple(amounts)
         
         # Irrigation action
         if action >= self.num_fert+1:
-            i_amount = action - (self.num_fert)
-            i_amount *= self.irrig_amount
-            self.model._send_signal(signal=pcse.signals.irrigate, amount=i_amount, \
-                                    efficiency=self.irrig_effec)
-            return (n_amount, 0, 0, irrig_amount)
+            amounts[self.I] = (action - self.num_fert) * self.irrig_amount
+            return tuple(amounts)
         
         # Fertilizaiton action, correct for null action
-        if (action-1) // self.num_fert == 0:
-            n_amount = self.fert_amount * (( (action-1) % self.num_fert)+1) 
-            self.model._send_signal(signal=pcse.signals.apply_npk, \
-                                    N_amount=n_amount, N_recovery=self.n_recovery)
-            
-        return (n_amount, 0, 0, irrig_amount)
+        amounts[(action-1) // self.num_fert] = self.fert_amount * (( (action-1) % self.num_fert)+1) 
+        return tuple(amounts)
 
 class Limited_W_Env(NPK_Env):
     """Simulates crop growth under Water Limited Production 
@@ -263,16 +271,16 @@ class Limited_W_Env(NPK_Env):
         Args:
             action
         """
-        irrig_amount = action
-        # Null action
-        if action == 0: 
-            return (0, 0, 0, irrig_amount)
-        
-        # Irrigation action
-        if action >= 0 * self.num_fert+1:
-            i_amount = action - (0 * self.num_fert)
-            i_amount *= self.irrig_amount
-            self.model._send_signal(signal=pcse.signals.irrigate, amount=i_amount, \
-                                    efficiency=self.irrig_effec)
+        _, _, _, irrig_amount = self._action_amounts(action)
+        self._apply_amounts(0, 0, 0, irrig_amount)
+        # The action tuple holds the irrigation action instead of the amount
+        return (0, 0, 0, action)
 
-        return (0, 0, 0, irrig_amount)
\ No newline at end of file
+    def _action_amounts(self, action: int):
+        """Returns the amounts of N, P, K and water applied by the integer action
+        
+        Args:
+            action
+        """
+        # Null action and irrigation actions
+        return (0, 0, 0, action * self.irrig_amount)
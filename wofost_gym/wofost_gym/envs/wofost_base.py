@@ -2,7 +2,9 @@
 from the NPK_Env Gym Environment"""
 
 import os
+import copy
 import datetime
+from collections import OrderedDict
 from datetime import date
 import numpy as np
 import pandas as pd
@@ -15,7 +17,7 @@ from wofost_gym import utils
 
 import pcse
 from pcse.engine import Wofost8Engine
-from pcse import NASAPowerWeatherDataProvider
+from pcse import get_weather_data_provider, EnsembleWeatherDataProvider
 
 
 class NPK_Env(gym.Env):
@@ -54,10 +56,14 @@ class NPK_Env(gym.Env):
         self.forecast_length = args.forecast_length
         self.forecast_noise = args.forecast_noise
         self.random_reset = args.random_reset
+        self.weather_ensemble = args.weather_ensemble
+        self.engine_cache_size = args.engine_cache_size
 
         # Get the weather and output variables
         self.weather_vars = args.weather_vars
         self.output_vars = args.output_vars
+        self._output_index = {var: i for i, var in enumerate(self.output_vars)}
+        self.debug_output = args.debug_output
 
         self.log = self._init_log()
         # Load all model parameters from .yaml files
@@ -77,7 +83,7 @@ class NPK_Env(gym.Env):
         self.max_site_duration = self.site_end_date - self.site_start_date
         self.max_crop_duration = self.crop_end_date - self.crop_start_date
 
-        self.weatherdataprovider = NASAPowerWeatherDataProvider(*self.location)
+        self.weatherdataprovider = get_weather_data_provider(*self.location)
         self.train_weather_data = self._get_train_weather_data()
 
         # Check that the configuration is valid
@@ -89,6 +95,18 @@ class NPK_Env(gym.Env):
         # Initialize crop engine
         self.model = Wofost8Engine(self.parameterprovider, self.weatherdataprovider,
                                          self.agromanagement, config=self.config)
+        self.model.set_output_buffer(self.output_vars, save_output=self.debug_output)
+        # Engines, their post-initialization snapshots and forecast weather 
+        # tables by (year, location), the least recently used engines are 
+        # closed, see _cache_model()
+        self._engine_cache = OrderedDict()
+        # Synthetic weather ensembles by location and the current member
+        self._ensembles = {}
+        self.weather_member = None
+        # Forecast weather table of the current episode, see _get_weather_table()
+        self._weather_table = None
+        self._noise_scale = np.linspace(start=self.forecast_noise[0], \
+                                  stop=self.forecast_noise[1], num=self.forecast_length)
         
         print('Successfully initialized WOFOST Engine. Ready to run simulation...')
         self.date = self.site_start_date
@@ -125,6 +143,23 @@ class NPK_Env(gym.Env):
         np.random.seed(seed)
         return [seed]
         
+    def clone(self):
+        """Return an independent copy of the environment at the current timestep.
+
+        The crop model is forked with `Engine.fork()`, so the copy shares the 
+        parameters and weather data with this environment. Stepping either 
+        environment does not affect the other.
+        """
+        env = copy.copy(self)
+        env.model = self.model.fork()
+        env.parameterprovider = env.model.parameterprovider
+        env.agromanagement = copy.deepcopy(self.agromanagement)
+        env.log = {k: dict(v) for k, v in self.log.items()}
+        env._engine_cache = OrderedDict()
+        if self._np_random is not None:
+            env._np_random = copy.deepcopy(self._np_random)
+        return env
+
     def render(self, mode: str='human', close: bool=False):
         """Render the environment into something a human can understand"""
         msg = "Render not implemented for Ag Environment"
@@ -160,6 +195,45 @@ class NPK_Env(gym.Env):
         if self.random_reset:
             self.year = self.np_random.choice(self.train_weather_data) 
 
+        self._set_dates()
+    
+        # Override parameters
+        utils.set_params(self, self.wofost_params)
+
+        # Reset model. Restore the post-initialization snapshot of a previously 
+        # built engine for this year and location, otherwise build a new one
+        key = (self.year, tuple(self.location))
+        self._close_model()
+        if self.weather_ensemble > 0:
+            # The initial rates depend on the weather of the first day, so 
+            # the engine is rebuilt for every ensemble member
+            self.weatherdataprovider = self._get_ensemble_member()
+            self.model = Wofost8Engine(self.parameterprovider, self.weatherdataprovider,
+                                         self.agromanagement, config=self.config)
+            self.model.set_output_buffer(self.output_vars, save_output=self.debug_output)
+            self._weather_table = self._get_weather_table()
+        elif key in self._engine_cache:
+            self._engine_cache.move_to_end(key)
+            self.model, snapshot, self._weather_table = self._engine_cache[key]
+            self.weatherdataprovider = self.model.weatherdataprovider
+            self.model.restore(snapshot)
+        else:
+            self.weatherdataprovider = get_weather_data_provider(*self.location)
+            self.model = Wofost8Engine(self.parameterprovider, self.weatherdataprovider,
+                                         self.agromanagement, config=self.config)
+            self.model.set_output_buffer(self.output_vars, save_output=self.debug_output)
+            self._weather_table = self._get_weather_table()
+            self._cache_model(key)
+        
+        # Generate initial output
+        output = self._run_simulation()
+        observation = self._process_output(output)
+
+        return observation, self.log
+
+    def _set_dates(self):
+        """Change the site and crop dates and the agromanagement dictionary 
+        to the year specified by self.year"""
         # Change the current start and end date to specified year
         self.site_start_date = self.site_start_date.replace(year=self.year)
         self.site_end_date = self.site_start_date + self.max_site_duration
@@ -176,22 +250,33 @@ class NPK_Env(gym.Env):
         self.agromanagement['CropCalendar']['crop_end_date'] = self.crop_end_date
         self.agromanagement['SiteCalendar']['site_start_date'] = self.site_start_date
         self.agromanagement['SiteCalendar']['site_end_date'] = self.site_end_date
-    
-        # Reset weather 
-        self.weatherdataprovider = NASAPowerWeatherDataProvider(*self.location)
-
-        # Override parameters
-        utils.set_params(self, self.wofost_params)
-
-        # Reset model
-        self.model = Wofost8Engine(self.parameterprovider, self.weatherdataprovider,
-                                         self.agromanagement, config=self.config)
-        
-        # Generate initial output
-        output = self._run_simulation()
-        observation = self._process_output(output)
 
-        return observation, self.log
+    def close(self):
+        """Close the environment and release the crop engines, including the
+        engines kept for restoring their snapshots on reset
+        """
+        self._close_model()
+        for model, _, _ in self._engine_cache.values():
+            model.close()
+        self._engine_cache.clear()
+        self.model.close()
+
+    def _cache_model(self, key: tuple):
+        """Keep the current crop engine, its snapshot and the forecast weather
+        table for restoring on reset, closing the least recently used engines 
+        beyond engine_cache_size
+        """
+        if self.engine_cache_size <= 0:
+            return
+        self._engine_cache[key] = (self.model, self.model.snapshot(), self._weather_table)
+        while len(self._engine_cache) > self.engine_cache_size:
+            _, (model, _, _) = self._engine_cache.popitem(last=False)
+            model.close()
+
+    def _close_model(self):
+        """Close the current crop engine unless it is kept in the engine cache"""
+        if not any(self.model is model for model, _, _ in self._engine_cache.values()):
+            self.model.close()
 
     def step(self, action):
         """Run one timestep of the environment's dynamics.
@@ -214,9 +299,9 @@ class NPK_Env(gym.Env):
         # Terminate based on site end date
         terminate = self.date >= self.site_end_date
         # Truncate based on crop finishing
-        truncation = output.iloc[-1]['FIN'] == 1.0
+        truncation = self._output_var(output, 'FIN') == 1.0
 
-        self._log(output.iloc[-1]['WSO'], act_tuple, reward)
+        self._log(self._output_var(output, 'WSO'), act_tuple, reward)
 
         return observation, reward, terminate, truncation, self.log
     
@@ -307,6 +392,19 @@ class NPK_Env(gym.Env):
 
         return valid_years
     
+    def _get_ensemble_member(self):
+        """Draw a member from the synthetic weather ensemble of the current 
+        location. The ensemble is sampled once per location and kept in 
+        memory, so drawing a member does not touch the disk or the network.
+        """
+        location = tuple(self.location)
+        if location not in self._ensembles:
+            provider = get_weather_data_provider(*self.location)
+            self._ensembles[location] = EnsembleWeatherDataProvider(provider, self.weather_ensemble,
+                                                seed=int(self.np_random.integers(2**31)))
+        self.weather_member = int(self.np_random.integers(self.weather_ensemble))
+        return self._ensembles[location].member(self.weather_member)
+
     def _get_weather(self, date:date):
         """Get the weather for a range of days from the NASA Weather Provider.
 
@@ -317,19 +415,51 @@ class NPK_Env(gym.Env):
         Args:
             date: datetime - day to start collecting the weather information
         """
-        weather_vars = []
-        noise_scale = np.linspace(start=self.forecast_noise[0], \
-                                  stop=self.forecast_noise[1], num=self.forecast_length)
+        # Slice the forecasting window from the weather table, fall back to 
+        # the weather provider when (part of) the window is not in the table
+        offset = (date - self.site_start_date).days
+        weather = None
+        if self._weather_table is not None and offset >= 0:
+            weather = self._weather_table[offset:offset+self.forecast_length]
+            if len(weather) < self.forecast_length or np.isnan(weather).any():
+                weather = None
+        if weather is None:
+            weather = np.array([self._get_weather_day(date + datetime.timedelta(i)) \
+                                for i in range(0, self.forecast_length)], dtype=np.float64)
         
-        # For every day in the forecasting window
-        for i in range(0, self.forecast_length):
-            weather = self._get_weather_day(date + datetime.timedelta(i) )
+        # Add random noise to weather prediction
+        return weather + np.random.normal(size=weather.shape) * weather * self._noise_scale[:, None]
+
+    def _get_weather_table(self):
+        """Get the weather variables for every day from the site start date 
+        up to the site end date plus the forecast length. Row i holds the 
+        weather of site_start_date + i, with the years cycled through the 
+        training years as in _get_weather_day().
 
-            # Add random noise to weather prediction
-            weather += np.random.normal(size=len(weather)) * weather * noise_scale[i] 
-            weather_vars.append(weather)
+        Days for which the weather cannot be taken from the columnar weather 
+        store are NaN and are served by _get_weather_day().
+        """
+        ndays = self.max_site_duration.days + 1 + self.forecast_length
+        table = np.full((ndays, len(self.weather_vars)), np.nan)
+        store = self.weatherdataprovider.columnar_store()
+        if not all(var in store.columns for var in self.weather_vars):
+            return table
 
-        return np.array(weather_vars)
+        site_start_ind = np.argwhere(self.train_weather_data == self.site_start_date.year).flatten()[0]
+        rows, columns = [], []
+        for i in range(ndays):
+            date = self.site_start_date + datetime.timedelta(i)
+            weather_year_ind = (site_start_ind+date.year-self.site_start_date.year) % len(self.train_weather_data)
+            try:
+                weather_date = date.replace(year=int(self.train_weather_data[weather_year_ind]))
+            except ValueError:
+                continue
+            if weather_date in store:
+                rows.append(i)
+                columns.append(store.index(weather_date))
+        for j, var in enumerate(self.weather_vars):
+            table[rows, j] = store.columns[var][columns]
+        return table
 
     def _get_weather_day(self, date: date):
         """Get the weather for a specific date based on the desired weather
@@ -346,17 +476,17 @@ class NPK_Env(gym.Env):
 
         return [getattr(weatherdatacontainer, attr) for attr in self.weather_vars]
     
-    def _process_output(self, output: dict):
+    def _process_output(self, output: np.ndarray):
         """Process the output from the model into the observation required by
         the current environment
         
         Args:
-            output: dictionary of model output variables
+            output: array of model output variables
         """
 
         # Current day crop observation
-        crop_observation = np.array(output.iloc[-1][self.output_vars])
-        self.date = output.index[-1]
+        crop_observation = output
+        self.date = self.model.get_output_day()
 
         # Observed weather through the specified forecast
         weather_observation = self._get_weather(self.date)
@@ -365,16 +495,45 @@ class NPK_Env(gym.Env):
         days_elapsed = self.date - self.site_start_date
 
         observation = np.concatenate([crop_observation, weather_observation.flatten(), [days_elapsed.days]])
-
-        for i in range(len(observation)):
-            if isinstance(observation[i], datetime.date):
-                observation[i] = int(observation[i].strftime('%Y%m%d'))
         return observation.astype('float64')
 
     def _run_simulation(self):
         """Run the WOFOST model for the specified number of days
+
+        Returns the output buffer of the model holding the values of the 
+        output variables, with nans for missing values (e.g. when the crop 
+        has not been planted yet) and dates as YYYYMMDD. The buffer is 
+        overwritten by the next run.
         """
         self.model.run(days=self.intervention_interval)
+        return self.model.get_output_buffer()
+
+    def _output_var(self, output: np.ndarray, varname: str):
+        """Return the value of an output variable from the output of 
+        _run_simulation(). Variables that are not in the output variables
+        (e.g. read by a wrapper) are taken from the model, with nan for
+        missing values
+
+        Args:
+            output: array of model output variables
+            varname: name of the output variable
+        """
+        index = self._output_index.get(varname)
+        if index is None:
+            value = self.model.get_variable(varname)
+            return np.nan if value is None else value
+        return output[index]
+
+    def get_output_frame(self):
+        """Return the model output as a pandas DataFrame indexed by day. 
+        
+        For debugging and export only, requires the environment to be 
+        created with debug_output as the model otherwise only records the
+        output variables.
+        """
+        if not self.debug_output:
+            msg = "Model output is only recorded when debug_output is set"
+            raise exc.WOFOSTGymError(msg)
         output = pd.DataFrame(self.model.get_output()).set_index("day")
 
         # Fill missing values with nans - arises when crop has not been
@@ -394,7 +553,39 @@ class NPK_Env(gym.Env):
         msg = "\'Take Action\' method not yet implemented on %s" % self.__class__.__name__
         raise NotImplementedError(msg)
 
-    def _get_reward(self, output: dict, act_tuple: tuple):
+    def _action_amounts(self, action: int):
+        """Returns the amounts of N, P, K (kg/ha) and water (cm) that the 
+        integer action applies to the model as a tuple, see _apply_amounts()
+        
+        Args:
+            action
+        """
+        msg = "\'Action Amounts\' method not yet implemented on %s" % self.__class__.__name__
+        raise NotImplementedError(msg)
+
+    def _apply_amounts(self, n_amount: float, p_amount: float, k_amount: float, \
+                       irrig_amount: float):
+        """Sends the fertilization and irrigation signals for the amounts of 
+        N, P, K and water returned by _action_amounts() to the model
+
+        Args:
+            n_amount, p_amount, k_amount: fertilizer amounts (kg/ha)
+            irrig_amount: irrigation amount (cm)
+        """
+        if irrig_amount > 0:
+            self.model._send_signal(signal=pcse.signals.irrigate, amount=irrig_amount, \
+                                    efficiency=self.irrig_effec)
+        if n_amount > 0:
+            self.model._send_signal(signal=pcse.signals.apply_npk, \
+                                    N_amount=n_amount, N_recovery=self.n_recovery)
+        if p_amount > 0:
+            self.model._send_signal(signal=pcse.signals.apply_npk, \
+                                    P_amount=p_amount, P_recovery=self.p_recovery)
+        if k_amount > 0:
+            self.model._send_signal(signal=pcse.signals.apply_npk, \
+                                    K_amount=k_amount, K_recovery=self.k_recovery)
+
+    def _get_reward(self, output: np.ndarray, act_tuple: tuple):
         """Convert the reward by applying a high penalty if a fertilization
         threshold is crossed
         
@@ -402,7 +593,7 @@ class NPK_Env(gym.Env):
             output     - of the simulator
             act_tuple  - amount of NPK/Water applied
         """
-        return np.nan_to_num(output.iloc[-1]['WSO'])
+        return np.nan_to_num(self._output_var(output, 'WSO'))
         
     def _init_log(self):
         """Initialize the log.
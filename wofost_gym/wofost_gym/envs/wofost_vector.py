@@ -0,0 +1,290 @@
+"""Vector environment simulating multiple WOFOST Gym environments as a batch
+in a single process.
+
+Created with gym.make_vec(env_id, num_envs, vectorization_mode="custom",
+vector_kwargs=env_kwargs) where env_kwargs are the keyword arguments that
+would otherwise be passed to gym.make()
+"""
+import time
+import datetime
+from copy import deepcopy
+
+import numpy as np
+import gymnasium as gym
+from gymnasium.envs.registration import load_env_creator
+from gymnasium.utils import seeding
+from gymnasium.vector.utils import create_empty_array
+
+from wofost_gym import exceptions as exc
+from pcse.engine import BatchWofost8Engine
+
+
+class WOFOSTVectorEnv(gym.vector.VectorEnv):
+    """Vectorized WOFOST Gym environment.
+
+    Simulates `num_envs` copies of the annual environment registered as
+    `env_id` with one BatchWofost8Engine, so that a step of all
+    sub-environments is a single batched simulation. Observations are
+    written into one preallocated (num_envs, obs_dim) array.
+
+    Actions, observations, rewards, termination and truncation follow
+    NPK_Env and the annual environments, whose configuration, parameters
+    and weather are taken from a template environment. Sub-environments
+    that terminate or truncate are reset automatically in the same step,
+    with the last observation and info stored in the infos under
+    "final_observation" and "final_info", as done by gym.vector.SyncVectorEnv.
+    The final info holds the episode statistics of
+    gym.wrappers.RecordEpisodeStatistics, the log of NPK_Env is not kept.
+
+    Weather ensembles are not supported and wrappers of the single
+    environment cannot be applied, use gym.vector.SyncVectorEnv for those.
+    """
+
+    def __init__(self, env_id: str, num_envs: int=1, max_episode_steps: int=None,
+                 copy: bool=True, **kwargs):
+        """Initialize the :class:`WOFOSTVectorEnv`.
+
+        Args:
+            env_id: id of the registered environment
+            num_envs: number of sub-environments
+            max_episode_steps: optional limit on the number of steps per episode
+            copy: return a copy of the observation array on reset/step
+            kwargs: keyword arguments for the environment constructor
+        """
+        spec = gym.spec(env_id)
+        env_kwargs = dict(spec.kwargs)
+        env_kwargs.update(kwargs)
+        env_creator = load_env_creator(spec.entry_point) \
+            if isinstance(spec.entry_point, str) else spec.entry_point
+        if max_episode_steps is None:
+            max_episode_steps = spec.max_episode_steps
+
+        # Template environment holding the configuration, parameters and
+        # weather of the sub-environments
+        self.env = env_creator(**env_kwargs)
+        if self.env.weather_ensemble > 0:
+            msg = "Weather ensembles are not supported by the vector environment"
+            raise exc.WOFOSTGymError(msg)
+        super().__init__(num_envs, self.env.observation_space, self.env.action_space)
+        self.copy = copy
+        self.max_episode_steps = max_episode_steps
+
+        # Amounts of N, P, K and water applied by each action
+        self._amounts = np.array([self.env._action_amounts(a) for a in
+                                  range(self.single_action_space.n)], dtype=np.float64)
+
+        self.model = BatchWofost8Engine(self.env.parameterprovider, self.env.weatherdataprovider,
+                                        self.env.agromanagement, self.env.config, n=num_envs)
+        self._output = self.model.set_output_buffer(self.env.output_vars)
+
+        # Year, dates and forecast weather table of each sub-environment
+        self._default_year = self.env.year
+        self.year = np.full(num_envs, self._default_year)
+        self.site_start_date = np.full(num_envs, np.datetime64("NaT"), dtype="datetime64[D]")
+        self.site_end_date = self.site_start_date.copy()
+        self.date = self.site_start_date.copy()
+        ndays = self.env.max_site_duration.days + 1 + self.env.forecast_length
+        self._weather = np.full((num_envs, ndays, len(self.env.weather_vars)), np.nan)
+        # Forecast weather tables by year, see _set_year()
+        self._weather_tables = {}
+
+        self.observations = create_empty_array(self.single_observation_space, n=num_envs,
+                                               fn=np.zeros)
+        self._rewards = np.zeros((num_envs,), dtype=np.float64)
+        self._terminateds = np.zeros((num_envs,), dtype=np.bool_)
+        self._truncateds = np.zeros((num_envs,), dtype=np.bool_)
+
+        # Episode statistics, see gym.wrappers.RecordEpisodeStatistics
+        self._episode_returns = np.zeros((num_envs,), dtype=np.float64)
+        self._episode_lengths = np.zeros((num_envs,), dtype=np.int64)
+        self._episode_start_times = np.zeros((num_envs,), dtype=np.float64)
+
+    def reset(self, *, seed: int=None, options: dict=None):
+        """Reset all sub-environments.
+
+        Args:
+            seed: seed for drawing the years of the sub-environments when
+                random_reset is set
+            options: not used
+        """
+        if seed is not None:
+            self._np_random, _ = seeding.np_random(seed)
+        self._terminateds[:] = False
+        self._truncateds[:] = False
+
+        idx = np.arange(self.num_envs)
+        self._reset_envs(idx)
+        self._observe(idx, self._noise(self.num_envs))
+
+        return (deepcopy(self.observations) if self.copy else self.observations), {}
+
+    def step(self, actions):
+        """Take an action in every sub-environment.
+
+        Args:
+            actions: array with one integer action for each sub-environment
+        """
+        env = self.env
+        n_amount, p_amount, k_amount, irrig_amount = self._amounts[np.asarray(actions)].T
+        irrigate = irrig_amount > 0
+        if irrigate.any():
+            self.model.irrigate(irrig_amount, efficiency=env.irrig_effec, mask=irrigate)
+        for nutrient, amount, recovery in (("N", n_amount, env.n_recovery),
+                                           ("P", p_amount, env.p_recovery),
+                                           ("K", k_amount, env.k_recovery)):
+            apply = amount > 0
+            if apply.any():
+                self.model.apply_npk(mask=apply, **{nutrient + "_amount": amount,
+                                                    nutrient + "_recovery": recovery})
+        self.model.run(days=env.intervention_interval)
+
+        self.date[:] = self.model.get_output_day()
+        self._rewards[:] = np.nan_to_num(self._output_var("WSO"))
+        # Terminate based on site end date, truncate based on crop finishing
+        self._terminateds[:] = self.date >= self.site_end_date
+        self._truncateds[:] = self._output_var("FIN") == 1.0
+
+        self._episode_returns += self._rewards
+        self._episode_lengths += 1
+        if self.max_episode_steps is not None:
+            self._truncateds |= self._episode_lengths >= self.max_episode_steps
+        done = self._terminateds | self._truncateds
+        done_idx = np.flatnonzero(done)
+
+        # Forecast noise is drawn in the order of SyncVectorEnv, which resets
+        # a done sub-environment before stepping the next one
+        noise = self._noise(self.num_envs + len(done_idx))
+        step_rows = np.arange(self.num_envs) + np.cumsum(done) - done
+        self._observe(np.arange(self.num_envs), noise[step_rows])
+
+        infos = {}
+        now = time.perf_counter()
+        for i in done_idx:
+            episode = {"r": self._episode_returns[i:i+1].copy(),
+                       "l": self._episode_lengths[i:i+1].copy(),
+                       "t": np.round(now - self._episode_start_times[i:i+1], 6)}
+            infos = self._add_info(infos, {"final_observation": self.observations[i].copy(),
+                                           "final_info": {"episode": episode}}, i)
+        if len(done_idx) > 0:
+            self._reset_envs(done_idx)
+            self._observe(done_idx, noise[step_rows[done_idx] + 1])
+
+        return (deepcopy(self.observations) if self.copy else self.observations,
+                np.copy(self._rewards), np.copy(self._terminateds),
+                np.copy(self._truncateds), infos)
+
+    def close_extras(self, **kwargs):
+        """Close the template environment
+        """
+        self.env.close()
+
+    def _reset_envs(self, idx: np.ndarray):
+        """Restart the simulations of the sub-environments idx in their year
+        and run them to the first observation, see NPK_Env.reset()
+
+        Args:
+            idx: indices of the sub-environments
+        """
+        env = self.env
+        # Reset to random year if random-reset. Useful for RL algorithms
+        if env.random_reset:
+            self.year[idx] = self.np_random.choice(env.train_weather_data, size=len(idx))
+        else:
+            self.year[idx] = self._default_year
+
+        agromanagement = []
+        for i in idx:
+            self._weather[i] = self._set_year(self.year[i])
+            self.site_start_date[i] = env.site_start_date
+            self.site_end_date[i] = env.site_end_date
+            agromanagement.append(deepcopy(env.agromanagement))
+
+        mask = np.zeros(self.num_envs, dtype=bool)
+        mask[idx] = True
+        self.model.reset(mask=mask, agromanagement=agromanagement)
+        self.model.run(days=env.intervention_interval, mask=mask)
+        self.date[idx] = self.model.get_output_day()[idx]
+
+        self._episode_returns[idx] = 0
+        self._episode_lengths[idx] = 0
+        self._episode_start_times[idx] = time.perf_counter()
+
+    def _set_year(self, year: int):
+        """Change the dates and agromanagement of the template environment to
+        year and return the forecast weather table of the year
+
+        Args:
+            year: year of the weather
+        """
+        self.env.year = int(year)
+        self.env._set_dates()
+        if self.env.year not in self._weather_tables:
+            self._weather_tables[self.env.year] = self.env._get_weather_table()
+        return self._weather_tables[self.env.year]
+
+    def _noise(self, n: int):
+        """Draw the forecast noise of n observations, one after the other as
+        done by NPK_Env._get_weather()
+
+        Args:
+            n: number of observations
+        """
+        return np.random.normal(size=(n, self.env.forecast_length, len(self.env.weather_vars)))
+
+    def _observe(self, idx: np.ndarray, noise: np.ndarray):
+        """Write the observations of the sub-environments idx into the
+        observation array, see NPK_Env._process_output()
+
+        Args:
+            idx: indices of the sub-environments
+            noise: forecast noise of each of the sub-environments
+        """
+        env = self.env
+        nvars = len(env.output_vars)
+        self.observations[idx, :nvars] = self._output[idx]
+
+        # Observed weather through the specified forecast
+        weather = self._forecast(idx)
+        weather = weather + noise * weather * env._noise_scale[:, None]
+        self.observations[idx, nvars:-1] = weather.reshape(len(idx), -1)
+
+        # Count the number of days elapsed - for time-based policies
+        self.observations[idx, -1] = (self.date[idx] - self.site_start_date[idx]).astype(np.float64)
+
+    def _forecast(self, idx: np.ndarray):
+        """Get the weather of the forecasting window of the sub-environments
+        idx without noise, see NPK_Env._get_weather()
+
+        Args:
+            idx: indices of the sub-environments
+        """
+        env = self.env
+        ndays = self._weather.shape[1]
+        offset = (self.date[idx] - self.site_start_date[idx]).astype(np.int64)
+        rows = offset[:, None] + np.arange(env.forecast_length)
+        weather = self._weather[idx[:, None], np.clip(rows, 0, ndays - 1)]
+
+        # Fall back to the weather provider when (part of) the window is not
+        # in the table
+        missing = (offset < 0) | (offset + env.forecast_length > ndays) \
+            | np.isnan(weather).any(axis=(1, 2))
+        for j in np.flatnonzero(missing):
+            i = idx[j]
+            self._set_year(self.year[i])
+            date = self.date[i].astype(datetime.date)
+            weather[j] = [env._get_weather_day(date + datetime.timedelta(d))
+                          for d in range(env.forecast_length)]
+        return weather
+
+    def _output_var(self, varname: str):
+        """Return the values of an output variable for all sub-environments,
+        variables that are not in the output variables are taken from the
+        model, see NPK_Env._output_var()
+
+        Args:
+            varname: name of the output variable
+        """
+        index = self.env._output_index.get(varname)
+        if index is None:
+            return np.asarray(self.model.get_variable(varname), dtype=np.float64)
+        return self._output[:, index]
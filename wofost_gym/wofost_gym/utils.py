@@ -143,10 +143,20 @@ def make_config(soil: BaseSoilModuleWrapper=SoilModuleWrapper_LNPKW, crop: BaseC
     # Set to an empty list if you do not want any TERMINAL_OUTPUT
     TERMINAL_OUTPUT_VARS = OUTPUT_VARS
 
+    # Storage of published variables in the VariableKiosk, either "dict"
+    # or "indexed" (slot based, bulk flushing of states/rates)
+    KIOSK_MODE = "dict"
+
+    # Storage of state/rate variables, None for the default ("traitlets", 
+    # validates every assignment) or "compact" (slots, faster but without
+    # type validation), see pcse.base.set_states_rates_backend()
+    STATES_RATES_BACKEND = None
+
     return {'SOIL': SOIL, 'CROP': CROP, 'AGROMANAGEMENT': AGROMANAGEMENT, 'OUTPUT_INTERVAL': OUTPUT_INTERVAL, \
             'OUTPUT_INTERVAL_DAYS':OUTPUT_INTERVAL_DAYS, 'OUTPUT_WEEKDAY': OUTPUT_WEEKDAY, \
                 'OUTPUT_VARS': OUTPUT_VARS, 'SUMMARY_OUTPUT_VARS': SUMMARY_OUTPUT_VARS, \
-                    'TERMINAL_OUTPUT_VARS': TERMINAL_OUTPUT_VARS}
+                    'TERMINAL_OUTPUT_VARS': TERMINAL_OUTPUT_VARS, 'KIOSK_MODE': KIOSK_MODE, \
+                        'STATES_RATES_BACKEND': STATES_RATES_BACKEND}
 
 def set_params(env: gym.Env, args: WOFOST_Args):
     """Sets editable WOFOST Model parameters by overriding the value
@@ -416,17 +416,17 @@ class RewardFertilizationCostWrapper(RewardWrapper):
         self.env = env
         self.cost = cost
     
-    def _get_reward(self, output: dict, act_tuple:tuple):
+    def _get_reward(self, output: np.ndarray, act_tuple:tuple):
         """Gets the reward as a penalty based on the amount of NPK/Water applied
         
         Args:
-            output: dict     - output from model
+            output: np.ndarray - output from model
             act_tuple: tuple -  NPK/Water amounts"""
         if self.env.unwrapped.NUM_ACT == 6:
-            reward = output.iloc[-1]['WSO'] - \
+            reward = self.env.unwrapped._output_var(output, 'WSO') - \
                             (np.sum(10 * np.array([act_tuple])))
         elif self.env.unwrapped.NUM_ACT == 4: 
-            reward = output.iloc[-1]['WSO'] - \
+            reward = self.env.unwrapped._output_var(output, 'WSO') - \
                             (np.sum(10 * np.array([act_tuple[2:]])))
         return reward
          
@@ -474,9 +474,9 @@ class RewardFertilizationThresholdWrapper(RewardWrapper):
         # Terminate based on site end date
         terminate = self.env.unwrapped.date >= self.env.unwrapped.site_end_date
         # Truncate based on crop finishing
-        truncation = output.iloc[-1]['FIN'] == 1.0
+        truncation = self.env.unwrapped._output_var(output, 'FIN') == 1.0
 
-        self.env.unwrapped._log(output.iloc[-1]['WSO'], act_tuple, reward)
+        self.env.unwrapped._log(self.env.unwrapped._output_var(output, 'WSO'), act_tuple, reward)
         return observation, reward, terminate, truncation, self.env.unwrapped.log
     
     def _get_reward(self, output, act_tuple):
@@ -487,14 +487,14 @@ class RewardFertilizationThresholdWrapper(RewardWrapper):
             output     - of the simulator
             act_tuple  - amount of NPK/Water applied
         """
-        if output.iloc[-1]['TOTN'] > self.max_n and act_tuple[self.env.unwrapped.N] > 0:
+        if self.env.unwrapped._output_var(output, 'TOTN') > self.max_n and act_tuple[self.env.unwrapped.N] > 0:
             return -1e4 * act_tuple[self.env.unwrapped.N]
-        if output.iloc[-1]['TOTP'] > self.max_p and act_tuple[self.env.unwrapped.P] > 0:
+        if self.env.unwrapped._output_var(output, 'TOTP') > self.max_p and act_tuple[self.env.unwrapped.P] > 0:
             return -1e4 * act_tuple[self.env.unwrapped.P]
-        if output.iloc[-1]['TOTK'] > self.max_k and act_tuple[self.env.unwrapped.K] > 0:
+        if self.env.unwrapped._output_var(output, 'TOTK') > self.max_k and act_tuple[self.env.unwrapped.K] > 0:
             return -1e4 * act_tuple[self.env.unwrapped.K]
-        if output.iloc[-1]['TOTIRRIG'] > self.max_w and act_tuple[self.env.unwrapped.I] > 0:
+        if self.env.unwrapped._output_var(output, 'TOTIRRIG') > self.max_w and act_tuple[self.env.unwrapped.I] > 0:
             return -1e4 * act_tuple[self.env.unwrapped.I]
-        return np.nan_to_num(output.iloc[-1]['WSO'])
+        return np.nan_to_num(self.env.unwrapped._output_var(output, 'WSO'))
     
 